@@ -0,0 +1,151 @@
+"""
+A per-experiment index of the comments on the posts an experiment is watching.
+
+The comments table holds every comment from every subreddit we have ever
+followed, so experiment queries against it by subreddit and time, or by
+post_id IN (...), get slower as the archive grows. Experiments that set
+`comment_index: true` in their yml instead register the posts they care about
+with watch_posts(). CommentController passes the comments it archives
+to index_comments(), which copies the comments on watched posts into
+experiment_comments. Queries through get_comments() and get_descendants() are
+then proportional to the size of the experiment.
+
+Reply removal can also run incrementally on each batch of archived comments:
+find_replies() finds the replies to treatment comments in the batch, and
+record_replies() stores them with the treatment comment they descend from
+(root_id), so that replies to those replies are found in later batches.
+"""
+
+import datetime
+import simplejson as json
+from collections import defaultdict
+from sqlalchemy import and_
+from sqlalchemy.dialects.mysql import insert
+from app.models import Comment, ExperimentWatchedPost, ExperimentComment
+
+def is_enabled(experiment_settings):
+    return bool(experiment_settings.get("comment_index", False))
+
+def comment_row(experiment_id, comment, root_id=None):
+    return {
+        "experiment_id": experiment_id,
+        "comment_id": comment['id'],
+        "post_id": comment['link_id'].replace("t3_", ""),
+        "parent_id": comment['parent_id'],
+        "created_utc": datetime.datetime.utcfromtimestamp(comment['created_utc']),
+        "root_id": root_id
+    }
+
+def watch_posts(db_session, experiment_id, post_ids):
+    """Start indexing comments on these posts. Comments on them that are
+    already archived are indexed now, so it is safe to watch a post late."""
+    post_ids = set(post_ids)
+    if len(post_ids) == 0:
+        return 0
+    already_watched = set(row.post_id for row in db_session.query(ExperimentWatchedPost.post_id).filter(and_(
+        ExperimentWatchedPost.experiment_id == experiment_id,
+        ExperimentWatchedPost.post_id.in_(post_ids))))
+    new_post_ids = post_ids - already_watched
+    if len(new_post_ids) == 0:
+        return 0
+
+    db_session.insert_retryable(ExperimentWatchedPost, [
+        {"experiment_id": experiment_id, "post_id": post_id} for post_id in new_post_ids])
+
+    rows = [comment_row(experiment_id, json.loads(comment.comment_data))
+            for comment in db_session.query(Comment).filter(Comment.post_id.in_(new_post_ids))]
+    if len(rows) > 0:
+        db_session.insert_retryable(ExperimentComment, rows)
+    return len(new_post_ids)
+
+def index_comments(db_session, comments):
+    """Add comments (reddit json dicts) on watched posts to the index of every
+    experiment watching them. Returns the number of rows inserted."""
+    post_ids = set(comment['link_id'].replace("t3_", "") for comment in comments)
+    if len(post_ids) == 0:
+        return 0
+    watchers = defaultdict(list)
+    for watched in db_session.query(ExperimentWatchedPost).filter(
+            ExperimentWatchedPost.post_id.in_(post_ids)):
+        watchers[watched.post_id].append(watched.experiment_id)
+    if len(watchers) == 0:
+        return 0
+
+    rows = []
+    for comment in comments:
+        for experiment_id in watchers.get(comment['link_id'].replace("t3_", ""), []):
+            rows.append(comment_row(experiment_id, comment))
+    if len(rows) == 0:
+        return 0
+    return db_session.insert_retryable(ExperimentComment, rows).rowcount
+
+def get_comments(db_session, experiment_id, post_ids=None):
+    """Indexed comments for an experiment, oldest first, as rows with the
+    id, post_id, parent_id and created_utc of each comment."""
+    query = db_session.query(
+        ExperimentComment.comment_id.label("id"),
+        ExperimentComment.post_id,
+        ExperimentComment.parent_id,
+        ExperimentComment.created_utc).filter(
+        ExperimentComment.experiment_id == experiment_id)
+    if post_ids is not None:
+        query = query.filter(ExperimentComment.post_id.in_(post_ids))
+    return query.order_by(ExperimentComment.created_utc).all()
+
+def get_descendants(db_session, experiment_id, comment_ids):
+    """The ids of every indexed reply to these comments, at any depth."""
+    children = defaultdict(list)
+    for comment in db_session.query(ExperimentComment.comment_id, ExperimentComment.parent_id).filter(
+            ExperimentComment.experiment_id == experiment_id):
+        children[comment.parent_id].append(comment.comment_id)
+
+    descendants = []
+    queue = ["t1_" + comment_id for comment_id in comment_ids]
+    while queue:
+        for child_id in children.get(queue.pop(), []):
+            descendants.append(child_id)
+            queue.append("t1_" + child_id)
+    return descendants
+
+def find_replies(db_session, experiment_id, root_ids, comments):
+    """Of these comments (reddit json dicts), find the ones that reply, at any
+    depth, to one of the root comments, using the replies recorded by earlier
+    calls. Only the parents of these comments are looked up, so the cost is
+    proportional to the number of comments passed in. Returns a dictionary of
+    {comment id: root id} for replies that were not already recorded."""
+    comments = {comment['id']: comment for comment in comments}
+    parent_ids = set(comment['parent_id'].replace("t1_", "") for comment in comments.values()
+                     if comment['parent_id'].startswith("t1_"))
+    candidate_ids = parent_ids | set(comments.keys())
+
+    roots = {root_id: root_id for root_id in set(root_ids) & candidate_ids}
+    for row in db_session.query(ExperimentComment.comment_id, ExperimentComment.root_id).filter(and_(
+            ExperimentComment.experiment_id == experiment_id,
+            ExperimentComment.root_id != None,
+            ExperimentComment.comment_id.in_(candidate_ids))):
+        roots[row.comment_id] = row.root_id
+
+    # a reply can arrive in the same batch as its parent, so repeat
+    # until no more replies are found
+    new_replies = {}
+    found = True
+    while found:
+        found = False
+        for comment in comments.values():
+            parent_id = comment['parent_id'].replace("t1_", "")
+            if comment['id'] not in roots and parent_id in roots:
+                roots[comment['id']] = new_replies[comment['id']] = roots[parent_id]
+                found = True
+    return new_replies
+
+def record_replies(db_session, experiment_id, replies, comments):
+    """Save the root of each reply found by find_replies, so later batches can
+    find replies to these replies."""
+    if len(replies) == 0:
+        return
+    comments = {comment['id']: comment for comment in comments}
+    statement = insert(ExperimentComment.__table__)
+    statement = statement.on_duplicate_key_update(root_id = statement.inserted.root_id)
+    db_session.execute_retryable(statement, [
+        comment_row(experiment_id, comments[comment_id], root_id)
+        for comment_id, root_id in replies.items()])
@@ -1,5 +1,7 @@
+import asyncio
 import inspect, os, sys, yaml
 import simplejson as json
+import reddit.async_client
 import reddit.connection
 import app.controllers.front_page_controller
 import app.controllers.subreddit_controller
@@ -10,8 +12,10 @@ import app.controllers.sticky_comment_experiment_controller
 import app.controllers.messaging_controller
 import app.controllers.messaging_experiment_controller
 import app.controllers.banneduser_experiment_controller
-from utils.common import PageType, DbEngine
+import app.controllers.retention_controller
+from utils.common import PageType, DbEngine, load_yaml_cached
 from utils.perftest import profilable
+from utils.scheduling import coalesced
 import app.cs_logger
 from app.models import Base, SubredditPage, Subreddit, Post, ModAction, Experiment
 
@@ -27,12 +31,24 @@ log = app.cs_logger.get_logger(ENV, BASE_DIR)
 
 conn = reddit.connection.Connect()
 
+## CALLED BY app.worker BETWEEN JOBS. dispose=True also empties the connection
+## pools, so that a forked work horse never shares a MySQL connection with
+## the worker it was forked from
+def reset_db_sessions(dispose=False):
+    for session in set([db_session, conn.db_session]):
+        session.rollback()
+        if dispose:
+            session.close()
+            session.get_bind().dispose()
+
+@coalesced
 @profilable
 def fetch_reddit_front(page_type=PageType.TOP):
     r = conn.connect(controller="FetchRedditFront")
     fp = app.controllers.front_page_controller.FrontPageController(db_session, r, log)
     fp.archive_reddit_front_page(page_type)
 
+@coalesced
 @profilable
 def fetch_subreddit_front(sub_name, page_type = PageType.TOP):
     r = conn.connect(controller="FetchSubredditFront")
@@ -49,6 +65,7 @@ def fetch_missing_subreddit_post_comments(subreddit_id):
     cc = app.controllers.comment_controller.CommentController(db_session, r, log)
     cc.archive_all_missing_subreddit_post_comments(subreddit_id)
 
+@coalesced
 @profilable
 def fetch_mod_action_history(subreddit, after_id = None):
     r = conn.connect(controller="ModLog")
@@ -70,21 +87,106 @@ def fetch_mod_action_history(subreddit, after_id = None):
         subreddit = subreddit,
         stored = pre_action_count - first_action_count,
         total = pre_action_count))
+    return pre_action_count - first_action_count
 
+@coalesced
 @profilable
 def fetch_last_thousand_comments(subreddit_name):
     r = conn.connect(controller="FetchComments")
     cc = app.controllers.comment_controller.CommentController(db_session, r, log)
-    cc.archive_last_thousand_comments(subreddit_name)
+    return cc.archive_last_thousand_comments(subreddit_name)
+
+## JOBS THAT ARCHIVE SEVERAL SUBREDDITS AT ONCE, WITH THEIR REQUESTS TO REDDIT
+## IN FLIGHT CONCURRENTLY UNDER ONE RATE LIMITER (see reddit/async_client.py).
+## THE DATABASE WRITES AND EXPERIMENT CALLBACKS STILL RUN ONE SUBREDDIT AT A TIME.
+## WITHOUT aiohttp, OR AGAINST THE FAKE REDDIT, THEY RUN THE SINGLE-SUBREDDIT JOBS IN TURN.
+ASYNC_FETCH_CONCURRENCY = 10
+
+def can_fetch_concurrently():
+    return reddit.async_client.is_available() and not reddit.connection.FAKE_REDDIT_CONFIG
+
+def fetch_concurrently(controller, fetch, names):
+    """Run fetch(client, name) for every name; returns the results, or the
+    exceptions raised, in the order of names."""
+    async def _fetch_all():
+        client = reddit.async_client.AsyncReddit.from_praw_key(db_session, controller, conn=conn)
+        async with client:
+            return await reddit.async_client.gather(
+                [fetch(client, name) for name in names], limit=ASYNC_FETCH_CONCURRENCY)
+    return asyncio.run(_fetch_all())
+
+def fetched_or_log(names, results, description):
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            log.error("Error fetching {0} for {1}: {2}".format(description, name, str(result)))
+        else:
+            yield name, result
+
+@coalesced
+@profilable
+def fetch_subreddit_fronts(sub_names, page_type = PageType.TOP):
+    if not can_fetch_concurrently():
+        for sub_name in sub_names:
+            fetch_subreddit_front(sub_name, page_type)
+        return
+    # makes sure the praw key exists and its token is fresh
+    r = conn.connect(controller="FetchSubredditFront")
+    async def _fetch(client, sub_name):
+        sub = await client.get_subreddit(sub_name)
+        return sub, await client.get_subreddit_page(sub_name, page_type, limit=300)
+    results = fetch_concurrently("FetchSubredditFront", _fetch, sub_names)
+    for sub_name, fetched in fetched_or_log(sub_names, results, "the {0} page".format(page_type.name)):
+        sp = app.controllers.subreddit_controller.SubredditPageController(sub_name, db_session, r, log)
+        sp.archive_subreddit_page(pg_type = page_type, fetched = fetched)
+
+@coalesced
+@profilable
+def fetch_last_thousand_comments_for(subreddit_names):
+    if not can_fetch_concurrently():
+        return sum(fetch_last_thousand_comments(name) or 0 for name in subreddit_names)
+    r = conn.connect(controller="FetchComments")
+    async def _fetch(client, subreddit_name):
+        return await client.get_comments(subreddit_name, limit=1000)
+    results = fetch_concurrently("FetchComments", _fetch, subreddit_names)
+    total_comments_added = 0
+    for subreddit_name, comments in fetched_or_log(subreddit_names, results, "comments"):
+        cc = app.controllers.comment_controller.CommentController(db_session, r, log)
+        total_comments_added += cc.archive_last_thousand_comments(subreddit_name, fetched = comments)
+    return total_comments_added
+
+@coalesced
+@profilable
+def fetch_mod_action_histories(subreddits):
+    if not can_fetch_concurrently():
+        return sum(fetch_mod_action_history(subreddit) or 0 for subreddit in subreddits)
+    r = conn.connect(controller="ModLog")
+    async def _fetch(client, subreddit):
+        return await client.get_mod_log(subreddit, limit=500)
+    results = fetch_concurrently("ModLog", _fetch, subreddits)
+    stored = 0
+    for subreddit, mod_actions in fetched_or_log(subreddits, results, "the moderation log"):
+        mac = app.controllers.moderator_controller.ModeratorController(subreddit, db_session, r, log)
+        after_id, num_actions_stored = mac.archive_mod_action_page(fetched = mod_actions)
+        stored += num_actions_stored
+        # a first page of only new actions means there may be more; page
+        # through the rest the usual way
+        if num_actions_stored > 0 and after_id:
+            stored += fetch_mod_action_history(subreddit, after_id) or 0
+    return stored
+
+@coalesced
+@profilable
+def archive_cold_rows(table_name=None):
+    rc = app.controllers.retention_controller.RetentionController(db_session, log)
+    rc.archive_all([table_name] if table_name else None)
 
 def get_experiment_class(experiment_name):
     experiment_file_path = os.path.join(BASE_DIR, "config", "experiments", experiment_name) + ".yml"
-    with open(experiment_file_path, 'r') as f:
-        try:
-            experiment_config_all = yaml.full_load(f)
-        except yaml.YAMLError as exc:
-            log.error("Failure loading experiment yaml {0}".format(experiment_file_path), str(exc))
-            sys.exit(1)
+    try:
+        experiment_config_all = load_yaml_cached(experiment_file_path)
+    except yaml.YAMLError as exc:
+        log.error("Failure loading experiment yaml {0}".format(experiment_file_path), str(exc))
+        sys.exit(1)
 
     if(ENV not in experiment_config_all.keys()):
         log.error("Cannot find experiment settings for {0} in {1}".format(ENV, experiment_file_path))
@@ -104,6 +206,7 @@ def get_experiment_class(experiment_name):
 # for banned user experiments that are NOT using event_handler+callbacks
 # NOTE: The following was used to send interventions for the banneduser experiment.
 #       The update_experiment method is now called as part of the callback from archiving mod actions.
+@coalesced
 @profilable
 def conduct_banuser_experiment(experiment_name):
     bue = initialize_banuser_experiment(experiment_name)
@@ -124,11 +227,18 @@ def initialize_banuser_experiment(experiment_name):
 
 
 ## for sticky comment experiments that are NOT using event_handler+callbacks
+@coalesced
 @profilable
 def conduct_sticky_comment_experiment(experiment_name):
     sce = initialize_sticky_comment_experiment(experiment_name)
     sce.update_experiment()
 
+## one submission's intervention, enqueued by experiments with intervention_fanout
+@profilable
+def run_sticky_comment_intervention(experiment_name, experiment_thing_id):
+    sce = initialize_sticky_comment_experiment(experiment_name)
+    sce.run_enqueued_intervention(experiment_thing_id)
+
 # not to be run as a job, just to store and get a sce object
 @profilable
 def initialize_sticky_comment_experiment(experiment_name):
@@ -142,6 +252,7 @@ def initialize_sticky_comment_experiment(experiment_name):
     )
     return sce    
 
+@coalesced
 @profilable
 def remove_experiment_replies(experiment_name):
     r = conn.connect(controller=experiment_name)    
@@ -153,6 +264,7 @@ def remove_experiment_replies(experiment_name):
     )
     sce.remove_replies_to_treatments()
 
+@coalesced
 @profilable
 def archive_experiment_submission_metadata(experiment_name):
     r = conn.connect(controller=experiment_name)
@@ -165,6 +277,7 @@ def archive_experiment_submission_metadata(experiment_name):
     )
     sce.archive_experiment_submission_metadata()
 
+@coalesced
 @profilable
 def update_stylesheet_experiment(experiment_name):
     r = conn.connect(controller=app.controllers.stylesheet_experiment_controller.StylesheetExperimentController)
@@ -176,6 +289,7 @@ def update_stylesheet_experiment(experiment_name):
     )
     sce.update_experiment()
 
+@coalesced
 @profilable
 def update_newcomer_messaging_experiment(experiment_name):
     r = conn.connect(controller=app.controllers.messaging_experiment_controller.NewcomerMessagingExperimentController)
@@ -10,6 +10,8 @@ from pytz import UTC
 import uuid
 from sqlalchemy import and_, func
 
+import app.membership
+
 
 from app.controllers.experiment_controller import ExperimentConfigurationError
 from app.controllers.modaction_experiment_controller import (
@@ -283,12 +285,11 @@ class BanneduserExperimentController(ModactionExperimentController):
         # Find currently temporarily banned user records to update.
         users_by_username = {}
         for ut in self.db_session.query(ExperimentThing).filter(
-            ExperimentThing.object_type == ThingType.USER.value,
             ExperimentThing.experiment_id == self.experiment.id,
+            ExperimentThing.ban_type == "temporary",
+            ExperimentThing.object_type == ThingType.USER.value,
         ):
-            user_metadata = json.loads(ut.metadata_json)
-            if user_metadata["ban_type"] == "temporary":
-                users_by_username[ut.thing_id] = ut
+            users_by_username[ut.thing_id] = ut
 
         updated_users = []
         for modaction in modactions:
@@ -306,8 +307,6 @@ class BanneduserExperimentController(ModactionExperimentController):
             if not user:
                 continue
 
-            user_metadata = json.loads(user.metadata_json)
-
             updated_users.append(modaction)
 
         if not updated_users:
@@ -348,7 +347,7 @@ class BanneduserExperimentController(ModactionExperimentController):
                     user.query_index = BannedUserQueryIndex.FIRST_BANSTART_IMPOSSIBLE
                 # NOTE: upon an unban, _assign_second_banover_candidates will set query_index to SECOND_BANOVER_PENDING. So do not alter SECOND_BANOVER_PENDING values, otherwise banover interventions will not trigger.
 
-            user.metadata_json = json.dumps(user_metadata)
+            user.set_metadata(user_metadata)
 
             self.db_session.add_retryable(user)
 
@@ -493,7 +492,7 @@ class BanneduserExperimentController(ModactionExperimentController):
                 "experiment_id": self.experiment.id,
                 "object_type": ThingType.USER.value,
                 "query_index": BannedUserQueryIndex.FIRST_BANSTART_PENDING,
-                "metadata_json": json.dumps(user_metadata),
+                **ExperimentThing.metadata_columns(user_metadata),
             }
 
             newcomer_ets.append(user)
@@ -505,6 +504,12 @@ class BanneduserExperimentController(ModactionExperimentController):
 
         if len(newcomer_ets) > 0:
             self.db_session.insert_retryable(ExperimentThing, newcomer_ets)
+            app.membership.add_things(
+                self.experiment.id,
+                ThingType.USER.value,
+                [et["thing_id"] for et in newcomer_ets],
+                column="thing_id",
+            )
             self.experiment.settings_json = json.dumps(self.experiment_settings)
 
         self.log.info(
@@ -824,6 +829,8 @@ class BanneduserExperimentController(ModactionExperimentController):
         mc = MessagingController(self.db_session, self.r, self.log)
         action = "SendMessage"
         messages_to_send = []
+        # ExperimentActions are inserted in batches; see WriteBuffer
+        write_buffer = self.db_session.write_buffer()
         for experiment_thing in experiment_things:
             message = self._format_intervention_message(
                 experiment_thing, intervention_type
@@ -833,19 +840,23 @@ class BanneduserExperimentController(ModactionExperimentController):
             if message is None:
                 metadata = json.loads(experiment_thing.metadata_json)
                 metadata["message_status"] = f"{intervention_type}_sent"
-                ea = ExperimentAction(
-                    experiment_id=self.experiment.id,
-                    action=action,
-                    action_object_type=ThingType.USER.value,
-                    action_object_id=experiment_thing.id,
-                    metadata_json=json.dumps(metadata),
+                write_buffer.add(
+                    ExperimentAction,
+                    {
+                        "experiment_id": self.experiment.id,
+                        "action": action,
+                        "action_object_type": ThingType.USER.value,
+                        "action_object_id": experiment_thing.id,
+                        "metadata_json": json.dumps(metadata),
+                    },
                 )
                 experiment_thing.query_index = complete_status
-                experiment_thing.metadata_json = json.dumps(metadata)
-                self.db_session.add_retryable(ea)
+                experiment_thing.set_metadata(metadata)
             else:
                 message["account"] = experiment_thing.thing_id
                 messages_to_send.append(message)
+        # record the control group before sending any messages
+        write_buffer.flush()
 
         self.log.info(
             f"{self.log_prefix} Sending {intervention_type} messages to {len(messages_to_send)} users: [{','.join([x['account'] for x in messages_to_send])}]"
@@ -857,54 +868,56 @@ class BanneduserExperimentController(ModactionExperimentController):
         )
 
         # iterate through message_result, linked with experiment_things
-        for experiment_thing in experiment_things:
-            if experiment_thing.thing_id in message_results.keys():
-                message_result = message_results[experiment_thing.thing_id]
-
-                metadata = json.loads(experiment_thing.metadata_json)
-                update_records = False
-
-                message_errors = 0
-                if "errors" in message_result:
-                    message_errors = len(message_result["errors"])
-
-                ## Handle all message errors as non-fatal with retry mechanism
-                ## Track retry attempts and set impossible status only after 3 failures
-                if message_errors > 0:
-                    retry_count = metadata.get("message_retry_count", 0) + 1
-
-                    metadata["message_retry_count"] = retry_count
-                    metadata["last_message_error"] = "; ".join(
-                        error["error"] for error in message_result["errors"]
-                    )
-
-                    # Give up after 3 failed attempts.
-                    if retry_count >= 3:
-                        metadata["message_status"] = f"{intervention_type}_failed"
-                        metadata["survey_status"] = f"{intervention_type}_failed"
-                        experiment_thing.query_index = impossible_status
-
-                    # Always update records with errors.
-                    update_records = True
-                ## if there are no errors
-                ## add an ExperimentAction and
-                ## update the experiment_thing metadata
-                else:
-                    metadata["message_status"] = f"{intervention_type}_sent"
-                    experiment_thing.query_index = complete_status
-                    update_records = True
-
-                if update_records:
-                    metadata_json = json.dumps(metadata)
-                    ea = ExperimentAction(
-                        experiment_id=self.experiment.id,
-                        action=action,
-                        action_object_type=ThingType.USER.value,
-                        action_object_id=experiment_thing.id,
-                        metadata_json=metadata_json,
-                    )
-                    self.db_session.add_retryable(ea, commit=False)
-                    experiment_thing.metadata_json = metadata_json
+        with write_buffer:
+            for experiment_thing in experiment_things:
+                if experiment_thing.thing_id in message_results.keys():
+                    message_result = message_results[experiment_thing.thing_id]
+
+                    metadata = json.loads(experiment_thing.metadata_json)
+                    update_records = False
+
+                    message_errors = 0
+                    if "errors" in message_result:
+                        message_errors = len(message_result["errors"])
+
+                    ## Handle all message errors as non-fatal with retry mechanism
+                    ## Track retry attempts and set impossible status only after 3 failures
+                    if message_errors > 0:
+                        retry_count = metadata.get("message_retry_count", 0) + 1
+
+                        metadata["message_retry_count"] = retry_count
+                        metadata["last_message_error"] = "; ".join(
+                            error["error"] for error in message_result["errors"]
+                        )
+
+                        # Give up after 3 failed attempts.
+                        if retry_count >= 3:
+                            metadata["message_status"] = f"{intervention_type}_failed"
+                            metadata["survey_status"] = f"{intervention_type}_failed"
+                            experiment_thing.query_index = impossible_status
+
+                        # Always update records with errors.
+                        update_records = True
+                    ## if there are no errors
+                    ## add an ExperimentAction and
+                    ## update the experiment_thing metadata
+                    else:
+                        metadata["message_status"] = f"{intervention_type}_sent"
+                        experiment_thing.query_index = complete_status
+                        update_records = True
+
+                    if update_records:
+                        write_buffer.add(
+                            ExperimentAction,
+                            {
+                                "experiment_id": self.experiment.id,
+                                "action": action,
+                                "action_object_type": ThingType.USER.value,
+                                "action_object_id": experiment_thing.id,
+                                "metadata_json": json.dumps(metadata),
+                            },
+                        )
+                        experiment_thing.set_metadata(metadata)
         # NOTE: experiment_things also become updated in database with this commit method,
         # as they are sqlalchemy objects
         self.db_session.commit()
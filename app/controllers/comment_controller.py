@@ -8,7 +8,9 @@ import reddit.queries
 from utils.common import PageType
 from utils.retry import retryable
 from app.models import Base, SubredditPage, Subreddit, Post, Comment
+import app.comment_index
 import app.event_handler
+import app.user_sightings
 from sqlalchemy import and_
 from sqlalchemy import text
 import sqlalchemy
@@ -68,8 +70,24 @@ class CommentController:
         for post in posts_without_comments:
             self.archive_missing_post_comments(post.id)
 
+    def insert_comments(self, subreddit_id, comments):
+        db_comments = []
+        for comment in comments:
+             db_comments.append({
+                "id": comment['id'],
+                "subreddit_id": subreddit_id,
+                "created_utc": datetime.datetime.utcfromtimestamp(comment['created_utc']),
+                "post_id": comment['link_id'].replace("t3_" ,""),
+                "user_id": comment['author'],
+                "comment_data": json.dumps(comment)
+            })
+        result = self.db_session.insert_retryable(Comment, db_comments)
+        return result.rowcount
+
+    ## fetched: the comments, if already fetched from reddit
+    ## (e.g. concurrently through reddit.async_client)
     @app.event_handler.event_handler
-    def archive_last_thousand_comments(self, subreddit_name):
+    def archive_last_thousand_comments(self, subreddit_name, fetched=None):
         # fetch the subreddit ID
         subreddit = self.db_session.query(Subreddit).filter(Subreddit.name == subreddit_name).first()
         subreddit_id = subreddit.id
@@ -84,8 +102,11 @@ class CommentController:
         total_comments_added = 0
         self.log.info("Fetching up to the last thousand comments in {subreddit_name}.".format(subreddit_name=subreddit.name))
         try:
-            limit_found = False
+            limit_found = fetched is not None
             after_id = None
+            if fetched is not None:
+                comments = [getattr(comment, "json_dict", comment) for comment in fetched]
+                total_comments_added = self.insert_comments(subreddit_id, comments) if comments else 0
 
             iterations = 0
             while(limit_found == False):
@@ -105,20 +126,7 @@ class CommentController:
                 if(comment_result is None or comments_returned == 0 ):
                     limit_found = True
 
-                db_comments = []
-                db_comment_ids = []
-                add_comment_page_query = ""
-                for comment in comments:
-                     db_comments.append({
-                        "id": comment['id'],
-                        "subreddit_id": subreddit_id,
-                        "created_utc": datetime.datetime.utcfromtimestamp(comment['created_utc']),
-                        "post_id": comment['link_id'].replace("t3_" ,""),
-                        "user_id": comment['author'],
-                        "comment_data": json.dumps(comment)
-                    })
-
-                self.db_session.insert_retryable(Comment, db_comments)
+                total_comments_added += self.insert_comments(subreddit_id, comments)
 
 #                comments_added =0
 #                for db_comment in db_comments:
@@ -151,5 +159,16 @@ class CommentController:
         except praw.errors.APIException:
             self.log.error("Error querying latest {subreddit_name} comments from reddit API. Immediate attention needed.".format(subreddit_name=subreddit_name))
             sys.exit(1)
+
+        ## track commenters in users, in one statement for the whole run
+        user_sightings = app.user_sightings.UserSightings()
+        for comment in comments:
+            user_sightings.add(comment['author'], datetime.datetime.fromtimestamp(comment['created']))
+        user_sightings.flush(self.db_session)
+
+        indexed = app.comment_index.index_comments(self.db_session, comments)
+        if(indexed > 0):
+            self.log.info("Indexed {0} comments from {1} on posts watched by experiments.".format(indexed, subreddit_name))
         self.last_queried_comments += comments
+        return total_comments_added
             
@@ -37,13 +37,12 @@ class ExperimentController():
 
     def get_experiment_config(self, required_keys, experiment_name): 
         experiment_file_path = os.path.join(BASE_DIR, "config", "experiments", experiment_name) + ".yml"
-        with open(experiment_file_path, 'r') as f:
-            try:
-                experiment_config_all = yaml.full_load(f)
-            except yaml.YAMLError as exc:
-                self.log.error("{0}: Failure loading experiment yaml {1}".format(
-                    self.__class__.__name__, experiment_file_path), str(exc))
-                sys.exit(1)
+        try:
+            experiment_config_all = load_yaml_cached(experiment_file_path)
+        except yaml.YAMLError as exc:
+            self.log.error("{0}: Failure loading experiment yaml {1}".format(
+                self.__class__.__name__, experiment_file_path), str(exc))
+            sys.exit(1)
         if(ENV not in experiment_config_all.keys()):
             self.log.error("{0}: Cannot find experiment settings for {1} in {2}".format(
                 self.__class__.__name__, ENV, experiment_file_path))
@@ -9,9 +9,14 @@ from utils.common import PageType
 from app.models import Base, FrontPage
 from app.event_handler import event_handler, initialize_callee_controllers
 import app.event_handler
+import app.page_deltas
 
 ALL_SUBREDDIT_NAME = "all"
 
+## the last page stored for each page type by this process, which new
+## pages are stored as deltas against. see app/page_deltas.py
+page_deltas = app.page_deltas.PageDeltaCache()
+
 class FrontPageController:
   def __init__(self, db_session, r, log):
     self.db_session = db_session
@@ -66,13 +71,8 @@ class FrontPageController:
   @app.event_handler.event_handler
   def archive_reddit_front_page(self, pg_type = PageType.TOP):
       posts = self.fetch_reddit_front_page(pg_type)
-      front_page = FrontPage(created_at = datetime.datetime.utcnow(),
-                             page_data = json.dumps(posts),
-                             page_type = pg_type.value,
-                             is_utc = True)
-      self.db_session.add(front_page)
       try:
-        self.db_session.commit()
+        page_deltas.store(self.db_session, None, pg_type, posts)
         self.log.info("Saved reddit {0} page.".format(pg_type.name))
       except:
         self.log.error("Error while saving DB Session", extra=sys.exc_info()[0])
@@ -147,7 +147,7 @@ class SurveyController:
         if exp_object.metadata_json:
             metadata = json.loads(exp_object.metadata_json)
         metadata[key] = value
-        exp_object.metadata_json = json.dumps(metadata)
+        exp_object.set_metadata(metadata)
 
     def append_surveyed_user_log(self, username, response):
         invalid_username = False
@@ -201,28 +201,29 @@ class SurveyController:
                 responses = self.messaging_controller.send_messages(message_dicts, self.survey_task_id)
                 
                 updates = []
-                for user_thing in user_things:
-                    if user_thing.thing_id in responses.keys():
-                        response = responses[user_thing.thing_id]
-                        self.append_surveyed_user_log(user_thing.thing_id, response)
-                        if len(response.get("errors", {})) > 0:
-                            self.log.info("Experiment {0}: failed to survey user {1}: {2}".format(
-                                experiment_name, user_thing.thing_id, str(response)))
-                            self._update_metadata(user_thing, "survey_status", "failed")
-                            updates.append(user_thing)
-                        else:
-                            self.log.info("Experiment {0}: successfully surveyed user {1}: {2}".format(
-                                experiment_name, user_thing.thing_id, str(response)))
-                            survey_action = ExperimentAction(
-                                experiment_id = experiment_id,
-                                action = "SendSurvey",
-                                action_object_type = ThingType.USER.value,
-                                action_object_id = user_thing.thing_id
-                            )
-                            self._update_metadata(survey_action, "survey_status", "sent")
-                            self._update_metadata(user_thing, "survey_status", "sent")
-                            updates.append(survey_action)
-                            updates.append(user_thing)
+                ## SendSurvey actions are inserted in batches, see WriteBuffer
+                with self.db_session.write_buffer() as write_buffer:
+                    for user_thing in user_things:
+                        if user_thing.thing_id in responses.keys():
+                            response = responses[user_thing.thing_id]
+                            self.append_surveyed_user_log(user_thing.thing_id, response)
+                            if len(response.get("errors", {})) > 0:
+                                self.log.info("Experiment {0}: failed to survey user {1}: {2}".format(
+                                    experiment_name, user_thing.thing_id, str(response)))
+                                self._update_metadata(user_thing, "survey_status", "failed")
+                                updates.append(user_thing)
+                            else:
+                                self.log.info("Experiment {0}: successfully surveyed user {1}: {2}".format(
+                                    experiment_name, user_thing.thing_id, str(response)))
+                                write_buffer.add(ExperimentAction, {
+                                    "experiment_id": experiment_id,
+                                    "action": "SendSurvey",
+                                    "action_object_type": ThingType.USER.value,
+                                    "action_object_id": user_thing.thing_id,
+                                    "metadata_json": json.dumps({"survey_status": "sent"})
+                                })
+                                self._update_metadata(user_thing, "survey_status", "sent")
+                                updates.append(user_thing)
                 if updates:
                     self.db_session.add_retryable(updates)
         except Exception as e:
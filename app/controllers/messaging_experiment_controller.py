@@ -5,6 +5,7 @@ import datetime, yaml, time, csv
 import reddit.connection
 import reddit.praw_utils as praw_utils
 import reddit.queries
+import app.membership
 import sqlalchemy
 from dateutil import parser
 from utils.common import *
@@ -91,6 +92,12 @@ class MessagingExperimentController(ExperimentController):
 
         # step two: get information about past participation in the experiment
         past_participation = defaultdict(list)
+        # most accounts have never been enrolled; only query for the ones that have
+        enrolled = app.membership.get_thing_set(
+            self.db_session, self.experiment.id, ThingType.USER.value, column="thing_id")
+        account_usernames = [username for username in account_usernames if username in enrolled]
+        if len(account_usernames) == 0:
+            return past_participation
         for et_account in self.db_session.query(ExperimentThing).filter(and_(
             ExperimentThing.object_type == ThingType.USER.value,
             ExperimentThing.experiment_id == self.experiment.id,
@@ -197,7 +204,7 @@ class NewcomerMessagingExperimentController(MessagingExperimentController):
                         metadata_json = json.dumps(metadata)
                     )
                     experiment_thing.query_index = "Intervention Complete"
-                    experiment_thing.metadata_json = json.dumps(metadata)
+                    experiment_thing.set_metadata(metadata)
                     self.db_session.add(ea)
                 else:
                     message['account'] = experiment_thing.thing_id
@@ -256,7 +263,7 @@ class NewcomerMessagingExperimentController(MessagingExperimentController):
                             metadata_json = metadata_json
                         )
                         self.db_session.add(ea)
-                        experiment_thing.metadata_json = metadata_json
+                        experiment_thing.set_metadata(metadata)
             self.db_session.commit()
         except(Exception) as e:
            self.db_session.execute("UNLOCK TABLES")
@@ -385,7 +392,7 @@ class NewcomerMessagingExperimentController(MessagingExperimentController):
                             # at this stage, and it would take more queries to get
                             "object_created": None, 
                             "query_index": "Intervention TBD",
-                            "metadata_json": json.dumps(et_metadata)
+                            **ExperimentThing.metadata_columns(et_metadata)
                         })
 
             if(newcomers_without_randomization > 0 ):
@@ -393,6 +400,8 @@ class NewcomerMessagingExperimentController(MessagingExperimentController):
 
             if(len(newcomer_ets)>0):
                 self.db_session.insert_retryable(ExperimentThing, newcomer_ets)
+                app.membership.add_things(self.experiment.id, ThingType.USER.value,
+                    [et['thing_id'] for et in newcomer_ets], column="thing_id")
 
                 self.experiment.settings_json = json.dumps(self.experiment_settings)
                 self.db_session.commit()
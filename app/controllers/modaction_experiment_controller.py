@@ -5,6 +5,7 @@ import json
 
 from sqlalchemy import and_
 
+import app.membership
 from app.controllers.experiment_controller import ExperimentController
 from app.models import ExperimentThing, ModAction, ThingType
 
@@ -108,10 +109,7 @@ class ModactionExperimentController(ExperimentController, abc.ABC):
         Returns:
             A list of user IDs.
         """
-        user_ids = self.db_session.query(ExperimentThing.thing_id).filter(
-            and_(
-                ExperimentThing.experiment_id == self.experiment.id,
-                ExperimentThing.object_type == ThingType.USER.value,
-            )
+        enrolled = app.membership.get_thing_set(
+            self.db_session, self.experiment.id, ThingType.USER.value, column="thing_id"
         )
-        return [u[0] for u in user_ids]
+        return list(enrolled)
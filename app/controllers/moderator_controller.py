@@ -22,8 +22,9 @@ class ModeratorController:
         self.fetched_subreddit_id = None
 
     # returns the last action id, for paging purposes
+    # fetched: the page of mod actions, if already fetched from reddit
     @app.event_handler.event_handler
-    def archive_mod_action_page(self, after_id=None):
+    def archive_mod_action_page(self, after_id=None, fetched=None):
         if after_id:
             self.log.info(
                 "Querying moderation log for {subreddit}, after_id = {after_id}".format(
@@ -37,9 +38,12 @@ class ModeratorController:
                 )
             )
 
-        self.fetched_mod_actions = list(
-            self.r.get_mod_log(self.subreddit, limit=500, params={"after": after_id})
-        )
+        if fetched is not None:
+            self.fetched_mod_actions = list(fetched)
+        else:
+            self.fetched_mod_actions = list(
+                self.r.get_mod_log(self.subreddit, limit=500, params={"after": after_id})
+            )
         if self.fetched_mod_actions:
             first_ma = self.fetched_mod_actions[0]
             src_dict = getattr(first_ma, "json_dict", first_ma)
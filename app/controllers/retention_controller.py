@@ -0,0 +1,162 @@
+import inspect, os, sys # set the BASE_DIR
+import simplejson as json
+import datetime
+import yaml
+from sqlalchemy import and_, or_, select, tuple_
+from app.models import Base, Experiment, Comment, ArchivedComments, ModAction, ArchivedModAction
+from app.models import SubredditPage, ArchivedSubredditPage, FrontPage, ArchivedFrontPage, RetentionCheckpoint
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))), "../..")
+POLICIES_PATH = os.path.join(BASE_DIR, "config", "retention.yml")
+
+# table -> (live model, archive model)
+ARCHIVES = {
+    "comments": (Comment, ArchivedComments),
+    "mod_actions": (ModAction, ArchivedModAction),
+    "subreddit_pages": (SubredditPage, ArchivedSubredditPage),
+    "front_pages": (FrontPage, ArchivedFrontPage),
+}
+
+# Rows older than max_age_days (by created_at) are moved to the archive table.
+#   subreddit_ids: only archive rows from these subreddits (default: all);
+#       not for front_pages, which has no subreddit_id
+#   keep_active_experiments: keep rows from subreddits that have an experiment
+#       that has not yet ended, since experiment jobs query the live table
+# Policies can be overridden per table in config/retention.yml.
+DEFAULT_POLICIES = {
+    "comments": {"max_age_days": 42, "keep_active_experiments": True},
+    "mod_actions": {"max_age_days": 180, "keep_active_experiments": True},
+    "subreddit_pages": {"max_age_days": 90, "keep_active_experiments": True},
+    "front_pages": {"max_age_days": 90},
+}
+
+BATCH_SIZE = 1000
+MAX_BATCHES = 100
+
+def load_policies(path=POLICIES_PATH):
+    policies = {table: dict(policy) for table, policy in DEFAULT_POLICIES.items()}
+    if os.path.isfile(path):
+        with open(path, "r") as f:
+            for table, policy in (yaml.full_load(f) or {}).items():
+                if table not in ARCHIVES:
+                    raise Exception("Unknown retention table {0} in {1}".format(table, path))
+                if (policy or {}).get("subreddit_ids") and "subreddit_id" not in ARCHIVES[table][0].__table__.c:
+                    raise Exception("Retention table {0} in {1} has no subreddit_id for subreddit_ids".format(table, path))
+                policies.setdefault(table, {}).update(policy or {})
+    return policies
+
+class RetentionController:
+    """Moves cold rows from the tables that grow forever into their archive
+    tables, so the indexes used by the hot paths stay bounded.
+
+    Rows are moved in batches of batch_size. Each batch is copied with
+    INSERT IGNORE ... SELECT and deleted from the live table in the same
+    transaction, and the position in the table is saved to
+    retention_checkpoints, so the job can be stopped at any point and a run
+    never holds locks for long. A run moves at most max_batches batches per
+    table; the next run continues from the checkpoint."""
+
+    def __init__(self, db_session, log, policies=None, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+        self.db_session = db_session
+        self.log = log
+        self.policies = policies if policies is not None else load_policies()
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+
+    def active_experiment_subreddit_ids(self, now):
+        subreddit_ids = set()
+        experiments = self.db_session.query(Experiment).filter(
+            or_(Experiment.end_time == None, Experiment.end_time >= now)).all()
+        for experiment in experiments:
+            settings = json.loads(experiment.settings_json) if experiment.settings_json else {}
+            for key in ["subreddit_id", "shadow_subreddit_id"]:
+                if settings.get(key):
+                    subreddit_ids.add(settings[key])
+        return subreddit_ids
+
+    def get_checkpoint(self, table_name, cutoff):
+        checkpoint = self.db_session.query(RetentionCheckpoint).filter(
+            RetentionCheckpoint.table_name == table_name).first()
+        if checkpoint is None:
+            checkpoint = RetentionCheckpoint(table_name = table_name, rows_archived = 0)
+            self.db_session.add(checkpoint)
+        if checkpoint.is_complete or checkpoint.cutoff is None:
+            # start a new pass over the table
+            checkpoint.cutoff = cutoff
+            checkpoint.last_created_at = None
+            checkpoint.last_id = None
+            checkpoint.is_complete = False
+        return checkpoint
+
+    def batch_filter(self, model, policy, checkpoint, kept_subreddit_ids):
+        table = model.__table__
+        conditions = [table.c.created_at < checkpoint.cutoff]
+        if policy.get("subreddit_ids"):
+            conditions.append(table.c.subreddit_id.in_(policy["subreddit_ids"]))
+        if kept_subreddit_ids and "subreddit_id" in table.c:
+            conditions.append(or_(table.c.subreddit_id == None,
+                                  table.c.subreddit_id.notin_(kept_subreddit_ids)))
+        if checkpoint.last_created_at is not None:
+            last_id = table.c.id.type.python_type(checkpoint.last_id)
+            conditions.append(tuple_(table.c.created_at, table.c.id) > tuple_(checkpoint.last_created_at, last_id))
+        return and_(*conditions)
+
+    def archive_batch(self, model, archive_model, policy, checkpoint, kept_subreddit_ids):
+        table = model.__table__
+        rows = self.db_session.execute(
+            select([table.c.id, table.c.created_at])
+            .where(self.batch_filter(model, policy, checkpoint, kept_subreddit_ids))
+            .order_by(table.c.created_at, table.c.id)
+            .limit(self.batch_size)).fetchall()
+        if len(rows) == 0:
+            return 0
+
+        ids = [row.id for row in rows]
+        columns = [c.name for c in table.columns]
+        self.db_session.execute_retryable(
+            archive_model.__table__.insert().prefix_with("IGNORE").from_select(
+                columns, select([table.c[c] for c in columns]).where(table.c.id.in_(ids))),
+            commit=False)
+        self.db_session.execute(table.delete().where(table.c.id.in_(ids)))
+
+        checkpoint.last_created_at = rows[-1].created_at
+        checkpoint.last_id = str(rows[-1].id)
+        checkpoint.rows_archived = (checkpoint.rows_archived or 0) + len(rows)
+        checkpoint.updated_at = datetime.datetime.utcnow()
+        self.db_session.commit()
+        return len(rows)
+
+    def archive_table(self, table_name, now=None):
+        now = now or datetime.datetime.utcnow()
+        policy = self.policies[table_name]
+        model, archive_model = ARCHIVES[table_name]
+        cutoff = now - datetime.timedelta(days=policy["max_age_days"])
+        kept_subreddit_ids = set()
+        if policy.get("keep_active_experiments"):
+            kept_subreddit_ids = self.active_experiment_subreddit_ids(now)
+
+        checkpoint = self.get_checkpoint(table_name, cutoff)
+        self.db_session.commit()
+
+        archived = 0
+        for i in range(self.max_batches):
+            count = self.archive_batch(model, archive_model, policy, checkpoint, kept_subreddit_ids)
+            archived += count
+            if count < self.batch_size:
+                checkpoint.is_complete = True
+                self.db_session.commit()
+                break
+
+        self.log.info("Retention: archived {archived} rows from {table} older than {cutoff}, keeping {kept} active experiment subreddits. {status}.".format(
+            archived = archived,
+            table = table_name,
+            cutoff = checkpoint.cutoff,
+            kept = len(kept_subreddit_ids),
+            status = "Finished pass" if checkpoint.is_complete else "Continuing next run"))
+        return archived
+
+    def archive_all(self, table_names=None, now=None):
+        archived = {}
+        for table_name in (table_names or self.policies.keys()):
+            archived[table_name] = self.archive_table(table_name, now)
+        return archived
@@ -14,6 +14,8 @@ from app.models import Experiment, ExperimentThing, ExperimentAction, Experiment
 from app.models import EventHook
 from sqlalchemy import and_, or_
 from app.controllers.subreddit_controller import SubredditPageController
+import app.comment_index
+import app.membership
 import numpy as np
 
 ### LOAD ENVIRONMENT VARIABLES
@@ -33,13 +35,12 @@ class StickyCommentExperimentController:
         
     def get_experiment_config(self, required_keys, experiment_name):        
         experiment_file_path = os.path.join(BASE_DIR, "config", "experiments", experiment_name) + ".yml"
-        with open(experiment_file_path, 'r') as f:
-            try:
-                experiment_config_all = yaml.full_load(f)
-            except yaml.YAMLError as exc:
-                self.log.error("{0}: Failure loading experiment yaml {1}".format(
-                    self.__class__.__name__, experiment_file_path), str(exc))
-                sys.exit(1)
+        try:
+            experiment_config_all = load_yaml_cached(experiment_file_path)
+        except yaml.YAMLError as exc:
+            self.log.error("{0}: Failure loading experiment yaml {1}".format(
+                self.__class__.__name__, experiment_file_path), str(exc))
+            sys.exit(1)
         if(ENV not in experiment_config_all.keys()):
             self.log.error("{0}: Cannot find experiment settings for {1} in {2}".format(
                 self.__class__.__name__, ENV, experiment_file_path))
@@ -87,6 +88,8 @@ class StickyCommentExperimentController:
 
         self.experiment_name = experiment_name
         self.dry_run = experiment_config.get("dry_run", False)
+        ## RUN EACH SUBMISSION INTERVENTION AS ITS OWN RQ JOB (see enqueue_interventions)
+        self.intervention_fanout = experiment_config.get("intervention_fanout", False)
 
         self.subreddit = experiment_config['subreddit']
         self.subreddit_id = experiment_config['subreddit_id']
@@ -143,12 +146,59 @@ class StickyCommentExperimentController:
         return self.run_interventions(eligible_objs, ThingType.SUBMISSION)
     
     def run_interventions(self, eligible_objs, thing_type):
+        assignments = self.assign_randomized_conditions(eligible_objs, thing_type)
+        if self.intervention_fanout and thing_type == ThingType.SUBMISSION:
+            return self.enqueue_interventions(assignments)
         results = []
-        for experiment_thing, obj in self.assign_randomized_conditions(eligible_objs, thing_type):
-            result = self.run_intervention(experiment_thing, obj, thing_type)
-            if result is not None:
-                results.append(result)
+        ## RECORDS OF CONTROL NON-ACTIONS ARE WRITTEN IN BATCHES, SEE WriteBuffer.
+        ## STICKY COMMENTS ARE RECORDED AS SOON AS THEY ARE POSTED
+        with self.db_session.write_buffer():
+            for experiment_thing, obj in assignments:
+                result = self.run_intervention(experiment_thing, obj, thing_type)
+                if result is not None:
+                    results.append(result)
         return results
+
+    ## WITH intervention_fanout ENABLED, THE SCHEDULED JOB ONLY ASSIGNS CONDITIONS
+    ## AND ENQUEUES ONE JOB PER SUBMISSION, SO A BACKLOG OF INTERVENTIONS
+    ## (e.g. after downtime) DOESN'T KEEP THE SCHEDULED JOB RUNNING INTO THE NEXT ONE.
+    ## RETURNS THE IDS OF THE ENQUEUED JOBS
+    def enqueue_interventions(self, assignments):
+        from redis import Redis
+        from rq import Queue
+        from utils import sharding
+        queue = Queue(sharding.queue_name(self.subreddit), connection=Redis())
+        job_ids = []
+        for experiment_thing, obj in assignments:
+            job = queue.enqueue("app.controller.run_sticky_comment_intervention",
+                args = [self.experiment_name, experiment_thing.id],
+                job_id = "intervention_{0}_{1}".format(self.experiment.id, experiment_thing.id),
+                job_timeout = 3600,
+                result_ttl = 86400)
+            job_ids.append(job.id)
+        self.log.info("{0}: Experiment {1} enqueued {2} submission interventions".format(
+            self.__class__.__name__,
+            self.experiment_name,
+            len(job_ids)))
+        return job_ids
+
+    ## RUN ONE ENQUEUED INTERVENTION. THE LOCK AND THE ExperimentAction CHECK IN
+    ## submission_acceptable MAKE THIS SAFE TO RETRY OR RUN TWICE CONCURRENTLY:
+    ## AT MOST ONE INTERVENTION IS RECORDED PER SUBMISSION
+    def run_enqueued_intervention(self, experiment_thing_id, thing_type=ThingType.SUBMISSION):
+        lock_id = "{0}::intervention::{1}".format(self.experiment_name, experiment_thing_id)
+        with self.db_session.cooplock(lock_id, self.experiment.id):
+            experiment_thing = self.db_session.query(ExperimentThing).filter(and_(
+                ExperimentThing.id == experiment_thing_id,
+                ExperimentThing.experiment_id == self.experiment.id)).first()
+            if experiment_thing is None:
+                self.log.error("{0}: Experiment {1} has no experiment thing {2} to intervene on".format(
+                    self.__class__.__name__,
+                    self.experiment_name,
+                    experiment_thing_id))
+                return None
+            submission = self.r.get_submission(submission_id = experiment_thing.id)
+            return self.run_intervention(experiment_thing, submission, thing_type)
     
     def run_intervention(self, experiment_thing, obj, thing_type):
         condition = json.loads(experiment_thing.metadata_json)['condition']
@@ -224,7 +274,7 @@ class StickyCommentExperimentController:
         treatment_arm = int(metadata['randomization']['treatment'])
         condition     = metadata['condition']
         
-        experiment_action = ExperimentAction(
+        experiment_action = dict(
             experiment_id = self.experiment.id,
             praw_key_id = PrawKey.get_praw_id(ENV, self.experiment_name),
             action = action,
@@ -235,9 +285,7 @@ class StickyCommentExperimentController:
                 "randomization": metadata['randomization'],
                 "action_object_created_utc":None})
         )
-        self.db_session.add_retryable(experiment_action)
-        #self.db_session.add(experiment_action)
-        #self.db_session.commit()
+        self.db_session.insert_buffered(ExperimentAction, experiment_action)
         self.log.info("{0}: Experiment {1} applied arm {2} to post {3} (condition = {4})".format(
             self.__class__.__name__,
             self.experiment_name, 
@@ -245,7 +293,8 @@ class StickyCommentExperimentController:
             submission.id,
             condition
         ))
-        return experiment_action.id
+        ## the action may still be buffered, without its id
+        return submission.id
 
     def make_sticky_post(self, experiment_thing, submission, group="treatment", action="Intervention"):
         if(self.submission_acceptable(submission) == False):
@@ -295,7 +344,7 @@ class StickyCommentExperimentController:
             str(distinguish_results)
         ))
 
-        experiment_action = ExperimentAction(
+        experiment_action = dict(
             experiment_id = self.experiment.id,
             praw_key_id = PrawKey.get_praw_id(ENV, self.experiment_name),
             action_subject_type = ThingType.COMMENT.value,
@@ -309,21 +358,27 @@ class StickyCommentExperimentController:
                 "action_object_created_utc":comment.created_utc})
         )
 
-        comment_thing = ExperimentThing(
+        comment_thing = dict(
             experiment_id = self.experiment.id,
             object_created = datetime.datetime.fromtimestamp(comment.created_utc),
             object_type = ThingType.COMMENT.value,
             id = comment.id,
-            metadata_json = json.dumps({"group":group, "arm":"arm_"+str(treatment_arm),
-                                        "condition":condition,
-                                        "randomization": metadata['randomization'],
-                                        "submission_id":submission.id})
+            parent_thing_id = submission.id,
+            **ExperimentThing.metadata_columns({"group":group, "arm":"arm_"+str(treatment_arm),
+                                                "condition":condition,
+                                                "randomization": metadata['randomization'],
+                                                "submission_id":submission.id})
         )
 
-        self.db_session.add_retryable([comment_thing, experiment_action])
-        #self.db_session.add(comment_thing)
-        #self.db_session.add(experiment_action)
-        #self.db_session.commit()
+        ## THE COMMENT IS ALREADY ON REDDIT, SO RECORD IT NOW RATHER THAN
+        ## BUFFERING IT: submission_acceptable RELIES ON THIS RECORD TO AVOID
+        ## POSTING TWICE IF THE JOB DIES BEFORE THE BUFFER IS FLUSHED
+        self.db_session.insert_retryable(ExperimentThing, comment_thing, commit=False, ignore_dupes=False)
+        self.db_session.insert_retryable(ExperimentAction, experiment_action, ignore_dupes=False)
+
+        ## FOLLOW REPLIES TO THE STICKY COMMENT THROUGH THE EXPERIMENT COMMENT INDEX
+        if app.comment_index.is_enabled(self.experiment_settings):
+            app.comment_index.watch_posts(self.db_session, self.experiment.id, [submission.id])
         return distinguish_results
 
 
@@ -345,12 +400,9 @@ class StickyCommentExperimentController:
         @retryable(backoff=True, rollback=True, session=self.db_session)
         def _fetch_already_processed_objects():
             if len(objs_dict) == 0:
-                return []
-            return [thing.id for thing in 
-                self.db_session.query(ExperimentThing).filter(and_(
-                    ExperimentThing.object_type==thing_type.value, 
-                    ExperimentThing.experiment_id == self.experiment.id,
-                    ExperimentThing.id.in_(list(objs_dict.keys())))).all()]
+                return set()
+            return app.membership.get_thing_set(
+                self.db_session, self.experiment.id, thing_type.value).intersection(objs_dict.keys())
         already_processed_ids = _fetch_already_processed_objects()
 
         eligible_objs = []
@@ -436,7 +488,7 @@ class StickyCommentExperimentController:
             object_type    = thing_type.value,
             experiment_id  = self.experiment.id,
             object_created = datetime.datetime.fromtimestamp(obj.created_utc),
-            metadata_json  = json.dumps({
+            **ExperimentThing.metadata_columns({
                 "randomizable": randomizable,
                 "randomization": randomization,
                 "condition": condition})
@@ -480,6 +532,8 @@ class StickyCommentExperimentController:
 
         self.experiment.settings_json = json.dumps(self.experiment_settings)
         self.db_session.add_retryable(experiment_things)
+        app.membership.add_things(self.experiment.id, thing_type.value,
+            [experiment_thing.id for experiment_thing in experiment_things])
         
         self.log.info("{0}: Experiment {1}: assigned conditions to {2} {3}s".format(
             self.__class__.__name__,
@@ -511,6 +565,11 @@ class StickyCommentExperimentController:
     def get_all_experiment_comment_replies(self):
         experiment_comments = self.get_all_experiment_comments()
         experiment_comment_ids = [x.id for x in experiment_comments]
+
+        if app.comment_index.is_enabled(self.experiment_settings):
+            reply_ids = app.comment_index.get_descendants(
+                self.db_session, self.experiment.id, experiment_comment_ids)
+            return [CommentNode(id = reply_id, data = None) for reply_id in reply_ids]
         
         comment_tree = Comment.get_comment_tree(self.db_session, sqlalchemyfilter = and_(
             Comment.subreddit_id == self.subreddit_id,
@@ -535,6 +594,34 @@ class StickyCommentExperimentController:
         comments = self.get_comment_objects_for_experiment_comment_replies(
             self.get_all_experiment_comment_replies()
         )
+        return self.remove_replies(comments)
+
+    ## EVENT HOOK CALLBACK FOR CommentController.archive_last_thousand_comments
+    ## REMOVES REPLIES TO TREATMENTS AMONG THE COMMENTS JUST ARCHIVED, WITHOUT
+    ## REBUILDING THE COMMENT TREE FOR THE WHOLE EXPERIMENT
+    def callback_remove_new_replies(self, instance):
+        if(instance.last_subreddit_id != self.subreddit_id or len(instance.last_queried_comments) == 0):
+            return 0
+        new_comments = instance.last_queried_comments
+        parent_ids = set(c['parent_id'].replace("t1_", "") for c in new_comments)
+        treatment_ids = [thing.id for thing in self.db_session.query(ExperimentThing.id).filter(and_(
+            ExperimentThing.experiment_id == self.experiment.id,
+            ExperimentThing.object_type == ThingType.COMMENT.value,
+            ExperimentThing.id.in_(parent_ids)))]
+
+        replies = app.comment_index.find_replies(
+            self.db_session, self.experiment.id, treatment_ids, new_comments)
+        if(len(replies) == 0):
+            return 0
+
+        comments = self.r.get_info(thing_id = ["t1_" + x for x in replies.keys()])
+        removed = self.remove_replies(comments)
+        ## ONLY RECORD THE REPLIES ONCE THEY ARE REMOVED, SO THAT IF REDDIT FAILS,
+        ## find_replies RETURNS THEM AGAIN WHEN THEY ARE NEXT FETCHED
+        app.comment_index.record_replies(self.db_session, self.experiment.id, replies, new_comments)
+        return removed
+
+    def remove_replies(self, comments):
         removed_comment_ids = []
         parent_submission_ids = set()
         for comment in comments:
@@ -895,7 +982,7 @@ class StickyCommentMessagingExperimentController(StickyCommentExperimentControll
             )
             return None
         user_thing_metadata['submission_message_counts'][post_id] += 1
-        user_thing.metadata_json = json.dumps(user_thing_metadata)
+        user_thing.set_metadata(user_thing_metadata)
 
         # Fetch the actual group from the parent post if needed, i.e. for
         # mod actions related to posts that were not in the "within guestbook" arm
@@ -939,7 +1026,8 @@ class StickyCommentMessagingExperimentController(StickyCommentExperimentControll
             metadata = json.loads(thing.metadata_json)
             metadata['target_author'] = obj.target_author
             metadata['submission_id'] = self.extract_post_id(obj)
-            thing.metadata_json = json.dumps(metadata)
+            thing.set_metadata(metadata)
+            thing.parent_thing_id = metadata['submission_id']
             return thing
         
     def build_user_experiment_thing(self, user_id):
@@ -949,7 +1037,7 @@ class StickyCommentMessagingExperimentController(StickyCommentExperimentControll
             experiment_id = self.experiment.id,
             object_type = ThingType.USER.value,
             object_created = None,
-            metadata_json = json.dumps({
+            **ExperimentThing.metadata_columns({
                 'post_randomizations': {},
                 'submission_message_counts': {}})
         )
@@ -974,11 +1062,10 @@ class StickyCommentMessagingExperimentController(StickyCommentExperimentControll
         )
     
     def fetch_sticky_comment_things(self, post_ids):
-        post_id_strings = ["\"submission_id\": \"%s\"" % post_id for post_id in post_ids]
         return self.db_session.query(ExperimentThing).filter(
             ExperimentThing.object_type == ThingType.COMMENT.value,
             ExperimentThing.experiment_id == self.experiment.id,
-            or_(ExperimentThing.metadata_json.contains(post_id_str) for post_id_str in post_id_strings)
+            ExperimentThing.parent_thing_id.in_(post_ids)
         )
     
     def fetch_user_things(self, user_ids):
@@ -1003,7 +1090,7 @@ class StickyCommentMessagingExperimentController(StickyCommentExperimentControll
             # this method has been refactored and removed
             randomization['source_condition'] = 'ama_nonquestion_mod_action'
             post_randomizations[post_id] = randomization
-            user_thing.metadata_json = json.dumps(user_thing_metadata)
+            user_thing.set_metadata(user_thing_metadata)
         return randomization
     
     # This is a hack that needs to be refactored (but also working and tested). There should
@@ -1023,11 +1110,11 @@ class StickyCommentMessagingExperimentController(StickyCommentExperimentControll
             randomization['source_condition'] = 'ama_post'
             post_randomizations[post_id] = randomization
             user_thing_metadata['condition'] = 'ama_post'
-            user_thing.metadata_json = json.dumps(user_thing_metadata)
+            user_thing.set_metadata(user_thing_metadata)
         mod_action_thing_metadata = json.loads(mod_action_thing.metadata_json)
         mod_action_thing_metadata['randomizable'] = False # i.e. replace the null
         mod_action_thing_metadata['randomization'] = randomization
-        mod_action_thing.metadata_json = json.dumps(mod_action_thing_metadata)
+        mod_action_thing.set_metadata(mod_action_thing_metadata)
     
     def get_post_group(self, post_thing):
         metadata_json = json.loads(post_thing.metadata_json)
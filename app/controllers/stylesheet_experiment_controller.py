@@ -14,6 +14,7 @@ from app.models import Experiment, ExperimentThing, ExperimentAction, Experiment
 from app.models import EventHook
 from sqlalchemy import and_, or_, desc, asc
 from app.controllers.subreddit_controller import SubredditPageController
+import app.comment_index
 
 ### LOAD ENVIRONMENT VARIABLES
 BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))), "..","..")
@@ -33,13 +34,12 @@ class StylesheetExperimentController:
         
     def get_experiment_config(self, required_keys, experiment_name):        
         experiment_file_path = os.path.join(BASE_DIR, "config", "experiments", experiment_name) + ".yml"
-        with open(experiment_file_path, 'r') as f:
-            try:
-                experiment_config_all = yaml.full_load(f)
-            except yaml.YAMLError as exc:
-                self.log.error("{0}: Failure loading experiment yaml {1}".format(
-                    self.__class__.__name__, experiment_file_path), str(exc))
-                sys.exit(1)
+        try:
+            experiment_config_all = load_yaml_cached(experiment_file_path)
+        except yaml.YAMLError as exc:
+            self.log.error("{0}: Failure loading experiment yaml {1}".format(
+                self.__class__.__name__, experiment_file_path), str(exc))
+            sys.exit(1)
         if(ENV not in experiment_config_all.keys()):
             self.log.error("{0}: Cannot find experiment settings for {1} in {2}".format(
                 self.__class__.__name__, ENV, experiment_file_path))
@@ -299,12 +299,15 @@ class StylesheetExperimentController:
               object_type = ThingType.SUBMISSION.value,
               experiment_id = self.experiment.id,
               object_created = post.created,
-              metadata_json = last_action.metadata_json
+              **ExperimentThing.metadata_columns(json.loads(last_action.metadata_json))
             )
             self.db_session.add(et)
             added_experiment_things += 1
         self.db_session.commit()
 
+        if app.comment_index.is_enabled(self.experiment_settings):
+            app.comment_index.watch_posts(self.db_session, self.experiment.id, [x.id for x in eligible_posts])
+
         self.log.info("{0}: Experiment {1}: Added {2} posts for comment monitoring in r/{3}.".format(
                 self.__class__.__name__,
                 self.experiment.id,
@@ -342,32 +345,39 @@ class StylesheetExperimentController:
         # In other experiments, it might be important to query on a per-post basis
         post_comments = defaultdict(list)
         added_n_comments_for_monitoring = 0 
-        for comment in self.db_session.query(Comment).filter(Comment.post_id.in_([x for x in posts_needing_comments.keys()])).order_by(asc(Comment.created_utc)):
-
+        if app.comment_index.is_enabled(self.experiment_settings):
+            ## indexed comments have the id, post_id and created_utc used below
+            post_comment_query = app.comment_index.get_comments(
+                self.db_session, self.experiment.id, list(posts_needing_comments.keys()))
+        else:
+            post_comment_query = self.db_session.query(Comment).filter(Comment.post_id.in_([x for x in posts_needing_comments.keys()])).order_by(asc(Comment.created_utc))
+        for comment in post_comment_query:
             post_comments[comment.post_id].append(comment)
 
-        for post_id, comments in post_comments.items():
-            already_observing = [x.id for x in posts_needing_comments[post_id]]
-            post_comment_count = len(already_observing)
-            for comment in comments:
-                # if the comment is toplevel and hasn't been seen before
-                # and we're under our quota, then add an experiment_thing.
-                # snapshots will be taken in a separate method
-                if(post_comment_count < self.experiment_settings['first_n_comments'] and 
-                   comment.post_id == comment.post_id and comment.id not in already_observing):
-
-                    comments_to_observe.append(comment)
+        ## the sampled comments are inserted in batches, see WriteBuffer
+        with self.db_session.write_buffer(max_rows=1000) as write_buffer:
+            for post_id, comments in post_comments.items():
+                already_observing = [x.id for x in posts_needing_comments[post_id]]
+                post_comment_count = len(already_observing)
+                for comment in comments:
+                    # if the comment is toplevel and hasn't been seen before
+                    # and we're under our quota, then add an experiment_thing.
+                    # snapshots will be taken in a separate method
+                    if(post_comment_count < self.experiment_settings['first_n_comments'] and 
+                       comment.post_id == comment.post_id and comment.id not in already_observing):
+
+                        comments_to_observe.append(comment)
                     
-                    et = ExperimentThing(
-                      id = comment.id,
-                      object_type = ThingType.COMMENT.value,
-                      experiment_id = self.experiment.id,
-                      object_created = comment.created_utc,
-                      query_index = post_id
-                    )
-                    self.db_session.add(et)
-                    post_comment_count += 1
-                    added_n_comments_for_monitoring += 1
+                        write_buffer.add(ExperimentThing, dict(
+                          id = comment.id,
+                          object_type = ThingType.COMMENT.value,
+                          experiment_id = self.experiment.id,
+                          object_created = comment.created_utc,
+                          query_index = post_id,
+                          parent_thing_id = post_id
+                        ))
+                        post_comment_count += 1
+                        added_n_comments_for_monitoring += 1
 
         self.log.info("{0}: Experiment {1}: Added {2} comments for monitoring in r/{3}".format(
                 self.__class__.__name__,
@@ -7,9 +7,15 @@ import reddit.praw_utils as praw_utils
 import reddit.queries
 import sqlalchemy
 import app.event_handler
+import app.user_sightings
+import app.page_deltas
 from utils.common import PageType
 from app.models import Base, SubredditPage, Subreddit, Post, User
 
+## the last page stored for each subreddit and page type by this process,
+## which new pages are stored as deltas against. see app/page_deltas.py
+page_deltas = app.page_deltas.PageDeltaCache()
+
 class SubredditPageController:
     def __init__(self, subname, db_session, r, log):
         self.subname = subname
@@ -18,14 +24,22 @@ class SubredditPageController:
         self.r = r
         self.fetched_posts = []
         self.fetched_subreddit_id = None
+        self.user_sightings = app.user_sightings.UserSightings()
   
-    def fetch_subreddit_page(self, pg_type, limit=300, return_praw_object=False):
-        sub = self.r.get_subreddit(self.subname)
+    ## fetched: a (subreddit, posts) pair already fetched from reddit,
+    ## e.g. concurrently through reddit.async_client
+    def fetch_subreddit_page(self, pg_type, limit=300, return_praw_object=False, fetched=None):
+        if fetched is not None:
+            sub, self.fetched_posts = fetched
+        else:
+            sub = self.r.get_subreddit(self.subname)
         self.fetched_subreddit_id = sub.id
 
-        # fetch subreddit posts from reddit
+        # fetch subreddit posts from reddit, unless they already were
         try:
-            if pg_type==PageType.TOP:
+            if fetched is not None:
+                pass
+            elif pg_type==PageType.TOP:
                 self.fetched_posts = sub.get_top(limit=limit)
             elif pg_type==PageType.CONTR:
                 self.fetched_posts = sub.get_controversial(limit=limit)
@@ -33,7 +47,7 @@ class SubredditPageController:
                 self.fetched_posts = sub.get_new(limit=limit)   
             elif pg_type==PageType.HOT:
                 self.fetched_posts = sub.get_hot(limit=limit)   
-        except:
+        except Exception as e:
             self.log.error("Error querying /r/{0} {1} page: {2}".format(self.subname, pg_type.name, str(e)))
             return []         
         self.fetched_posts = list(self.fetched_posts)
@@ -63,7 +77,9 @@ class SubredditPageController:
                 }
                 json_posts.append(pruned_post)
                 is_new_post = self.archive_post(post.json_dict)
-                is_new_user = self.archive_user(pruned_post['author'], datetime.datetime.fromtimestamp(post.created))
+                self.user_sightings.add(pruned_post['author'], datetime.datetime.fromtimestamp(post.created))
+            ## authors are archived in one statement per page, see app/user_sightings.py
+            self.user_sightings.flush(self.db_session)
             self.log.info("Saved posts from /r/{0} {1} page.".format(self.subname, pg_type.name))
         except sqlalchemy.exc.IntegrityError as e:
             self.log.info("Error Saving posts from /r/{0} {1} page: {2}".format(self.subname, pg_type.name, str(e)))
@@ -76,14 +92,10 @@ class SubredditPageController:
             return json_posts
 
     @app.event_handler.event_handler
-    def archive_subreddit_page(self, pg_type=PageType.HOT):
-        posts = self.fetch_subreddit_page(pg_type, return_praw_object=False)
+    def archive_subreddit_page(self, pg_type=PageType.HOT, fetched=None):
+        posts = self.fetch_subreddit_page(pg_type, return_praw_object=False, fetched=fetched)
 
-        self.db_session.insert_retryable(SubredditPage, {
-            "page_type": pg_type.value,
-            "subreddit_id": posts[0]['subreddit_id'].replace("t5_",""),
-            "page_data": json.dumps(posts),
-            "is_utc": True})
+        page_deltas.store(self.db_session, posts[0]['subreddit_id'].replace("t5_",""), pg_type, posts)
 
         #posts = self.fetch_subreddit_page(pg_type, return_praw_object=False)
         #subreddit_page = SubredditPage(created_at = datetime.datetime.utcnow(),
@@ -151,32 +163,11 @@ class SubredditPageController:
         seen_at is of type timestamp
         (to save on api calls, do not query reddit for user info!)
 
-        returns True if it archives a new redditor. 
-        returns False if the redditor was already in table.
+        archives a new redditor, or moves the last_seen of a
+        redditor already in the table forward.
+        fetch_subreddit_page batches these through self.user_sightings
     """
     def archive_user(self, username, seen_at):
-        user = self.db_session.query(User).filter(User.name == username).first()
-
-        if not user:
-            #new_user = User(
-            #        name = username,
-            #        id = None,
-            #        created = None,
-            #        first_seen = seen_at,
-            #        last_seen = seen_at, 
-            #        user_data = None)
-            #self.db_session.add(new_user)
-            #self.db_session.commit()
-            self.db_session.insert_retryable(User, {
-                "name": username,
-                "id": None,
-                "created": None,
-                "first_seen": seen_at,
-                "last_seen": seen_at, 
-                "user_data": None})
-            return True
-        else:
-            if seen_at > user.last_seen:
-                user.last_seen = seen_at
-                self.db_session.commit()
-            return False
+        user_sightings = app.user_sightings.UserSightings()
+        user_sightings.add(username, seen_at)
+        user_sightings.flush(self.db_session)
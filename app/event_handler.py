@@ -19,6 +19,7 @@ callbacks should all pass in instance (self)
 """
 
 from utils.common import EventWhen
+from utils import jobmetrics
 from app.models import Base, EventHook, Experiment
 from sqlalchemy import and_
 import datetime
@@ -26,6 +27,7 @@ from functools import wraps
 import importlib
 import inspect
 import simplejson as json
+import time
 
 """
 the exposed method
@@ -78,7 +80,12 @@ def run_callbacks(instance, caller_method, call_when):
         callee_instance = instance.experiment_to_controller[e.experiment_id] if e.experiment_id in instance.experiment_to_controller else None 
         if callee_instance:
             callee_method = getattr(callee_instance, e.callee_method)
-            callee_method(instance) # callee methods always only take in 1 arg: instance
+            start = time.perf_counter()
+            try:
+                callee_method(instance) # callee methods always only take in 1 arg: instance
+            finally:
+                experiment_name = getattr(callee_instance, "experiment_name", e.experiment_id)
+                jobmetrics.record_callback(experiment_name, time.perf_counter() - start)
         else:
             instance.log.error("Error in event_handler: callee_instance not found to be passed in caller_instance {0}.".format(instance))
 
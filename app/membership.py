@@ -0,0 +1,92 @@
+"""
+In-process caches of the things already enrolled in each experiment.
+
+get_thing_set() returns a set of the ids (or thing_ids) enrolled in an
+experiment, kept for the life of the process and refreshed from
+experiment_things when their COUNT or MAX(created_at) changes.
+"""
+
+from sqlalchemy import and_, func
+from app.models import ExperimentThing
+
+_thing_sets = {}
+
+class ExperimentThingSet:
+    def __init__(self, experiment_id, object_type, column="id"):
+        self.experiment_id = experiment_id
+        self.object_type = object_type
+        self.column = column
+        self.values = set()
+        self.row_ids = set()
+        self.version = (0, None)
+
+    def __contains__(self, value):
+        return value in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def _filter(self):
+        return and_(ExperimentThing.experiment_id == self.experiment_id,
+                    ExperimentThing.object_type == self.object_type)
+
+    def _load(self, db_session, since=None):
+        """Load rows, returning how many weren't in the set already."""
+        query = db_session.query(ExperimentThing.id, getattr(ExperimentThing, self.column)).filter(self._filter())
+        if since is not None:
+            query = query.filter(ExperimentThing.created_at >= since)
+        loaded = 0
+        for row_id, value in query:
+            if row_id not in self.row_ids:
+                self.row_ids.add(row_id)
+                loaded += 1
+            self.values.add(value)
+        return loaded
+
+    def refresh(self, db_session):
+        """Bring the set up to date with the database. Returns True if it
+        had to load anything."""
+        version = tuple(db_session.query(
+            func.count(ExperimentThing.id),
+            func.max(ExperimentThing.created_at)).filter(self._filter()).one())
+        if version == self.version:
+            return False
+
+        count, max_created_at = version
+        last_count, last_max_created_at = self.version
+        loaded = 0
+        if last_max_created_at is not None:
+            # created_at has one second resolution, so the last second is loaded again
+            loaded = self._load(db_session, since=last_max_created_at)
+        # unless the new rows account for the whole change in the count,
+        # things were also deleted (perhaps as many as were added)
+        if loaded != count - last_count or len(self.row_ids) != count:
+            self.values = set()
+            self.row_ids = set()
+            self._load(db_session)
+        self.version = version
+        return True
+
+    def add(self, values):
+        """Add things this process has just enrolled, so they are skipped
+        before the next refresh loads them."""
+        self.values.update(values)
+
+    def intersection(self, values):
+        return self.values.intersection(values)
+
+def get_thing_set(db_session, experiment_id, object_type, column="id", refresh=True):
+    key = (experiment_id, object_type, column)
+    thing_set = _thing_sets.get(key)
+    if thing_set is None:
+        thing_set = _thing_sets[key] = ExperimentThingSet(experiment_id, object_type, column)
+    if refresh:
+        thing_set.refresh(db_session)
+    return thing_set
+
+def add_things(experiment_id, object_type, values, column="id"):
+    """Record things this process has just enrolled, without a query."""
+    get_thing_set(None, experiment_id, object_type, column, refresh=False).add(values)
@@ -21,6 +21,10 @@ class FrontPage(Base):
     page_type           = Column(Integer) # see utils/common.py
     page_data           = Column(MEDIUMTEXT)
     is_utc              = Column(Boolean, default=False)
+    # null for a page that stores every post. otherwise page_data is a delta
+    # against the previous page of the chain starting at this keyframe page
+    # (see app/page_deltas.py)
+    keyframe_id         = Column(Integer, index=True)
 
 class Subreddit(Base):
     __tablename__       = 'subreddits'
@@ -36,6 +40,12 @@ class SubredditPage(Base):
     page_type           = Column(Integer) # see utils/common.py
     page_data           = Column(MEDIUMTEXT)
     is_utc              = Column(Boolean, default=False)
+    # null for a page that stores every post. otherwise page_data is a delta
+    # against the previous page of the chain starting at this keyframe page
+    # (see app/page_deltas.py)
+    keyframe_id         = Column(Integer, index=True)
+
+Index("ix_subreddit_pages_subreddit_id_page_type", SubredditPage.subreddit_id, SubredditPage.page_type)
 
 class Post(Base):
     __tablename__       = 'posts'
@@ -71,6 +81,68 @@ class ArchivedComments(Base):
     user_id             = Column(String(64), index=True)
     comment_data        = Column(MEDIUMTEXT)
 
+# archive tables for the other tables that grow forever, filled in batches by
+# app/controllers/retention_controller.py. Columns match the live tables, so
+# rows can be copied with INSERT ... SELECT.
+class ArchivedModAction(Base):
+    __tablename__       = "archived_mod_actions"
+    id                  = Column(String(256), primary_key = True, unique=True, autoincrement=False)
+    created_at          = Column(DateTime, index=True)
+    created_utc         = Column(DateTime)
+    subreddit_id        = Column(String(32), index=True)
+    mod                 = Column(String(64))
+    target_author       = Column(String(64))
+    action              = Column(String(256))
+    target_fullname     = Column(String(256))
+    action_data         = Column(MEDIUMTEXT)
+
+class ArchivedSubredditPage(Base):
+    __tablename__       = 'archived_subreddit_pages'
+    id                  = Column(Integer, primary_key = True, autoincrement=False)
+    created_at          = Column(DateTime, index=True)
+    subreddit_id        = Column(String(32), index=True)
+    page_type           = Column(Integer)
+    page_data           = Column(MEDIUMTEXT)
+    is_utc              = Column(Boolean, default=False)
+    keyframe_id         = Column(Integer, index=True)
+
+class ArchivedFrontPage(Base):
+    __tablename__       = 'archived_front_pages'
+    id                  = Column(Integer, primary_key = True, autoincrement=False)
+    created_at          = Column(DateTime, index=True)
+    page_type           = Column(Integer)
+    page_data           = Column(MEDIUMTEXT)
+    is_utc              = Column(Boolean, default=False)
+    keyframe_id         = Column(Integer, index=True)
+
+# progress of the retention job through each table, so that an interrupted
+# run picks up where it stopped
+class RetentionCheckpoint(Base):
+    __tablename__       = "retention_checkpoints"
+    table_name          = Column(String(64), primary_key = True, autoincrement=False)
+    created_at          = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at          = Column(DateTime, default=datetime.datetime.utcnow)
+    cutoff              = Column(DateTime)
+    last_created_at     = Column(DateTime)
+    last_id             = Column(String(256))
+    rows_archived       = Column(Integer, default=0)
+    is_complete         = Column(Boolean, default=False)
+
+# the ranges of a table that a backfill (utils/backfill.py) splits it into,
+# marked complete as they are processed, so that a stopped backfill resumes
+# with the ranges it hasn't finished. range_end is exclusive, and None for
+# the last range
+class BackfillChunk(Base):
+    __tablename__       = "backfill_chunks"
+    id                  = Column(Integer, primary_key = True)
+    backfill_name       = Column(String(128))
+    created_at          = Column(DateTime, default=datetime.datetime.utcnow)
+    completed_at        = Column(DateTime)
+    range_start         = Column(String(256))
+    range_end           = Column(String(256))
+    rows_processed      = Column(Integer, default=0)
+    __table_args__      = (Index("ix_backfill_chunks_backfill_name_completed_at", "backfill_name", "completed_at"),)
+
 class Comment(Base):
     __tablename__       = "comments"
     id                  = Column(String(256), primary_key = True, unique=True, autoincrement=False)
@@ -163,7 +235,32 @@ class ExperimentThing(Base):
     object_created      = Column(DateTime, index = True)
     #column for experiment-specific custom query index
     query_index         = Column(String(256), index = True) 
+    #the thing this thing belongs to, e.g. the post of a sticky comment
+    parent_thing_id     = Column(String(256), index = True)
     metadata_json       = Column(MEDIUMTEXT)
+    #typed copies of the metadata_json fields that experiments query on;
+    #write metadata with set_metadata() or metadata_columns() to keep them in sync
+    ban_type            = Column(String(32))
+    arm                 = Column(String(64))
+    condition           = Column(String(256))
+    message_retry_count = Column(Integer)
+
+    PROJECTED_FIELDS = ["ban_type", "arm", "condition", "message_retry_count"]
+
+    @classmethod
+    def metadata_columns(cls, metadata):
+        """The metadata_json and projected column values for a metadata dict,
+        for rows inserted as dicts."""
+        columns = {field: metadata.get(field) for field in cls.PROJECTED_FIELDS}
+        columns["metadata_json"] = json.dumps(metadata)
+        return columns
+
+    def set_metadata(self, metadata):
+        for column, value in self.metadata_columns(metadata).items():
+            setattr(self, column, value)
+
+Index("ix_experiment_things_experiment_id_query_index", ExperimentThing.experiment_id, ExperimentThing.query_index)
+Index("ix_experiment_things_experiment_id_ban_type", ExperimentThing.experiment_id, ExperimentThing.ban_type)
 
 class ExperimentThingSnapshot(Base):
     __tablename__       = 'experiment_thing_snapshots'
@@ -187,6 +284,31 @@ class ExperimentAction(Base):
     action_object_id    = Column(String(256), index=True)
     metadata_json       = Column(MEDIUMTEXT)
   
+# posts whose comments an experiment wants to follow. Comments on these posts
+# are copied into experiment_comments as they are archived (app/comment_index.py)
+class ExperimentWatchedPost(Base):
+    __tablename__       = "experiment_watched_posts"
+    __table_args__      = (UniqueConstraint("experiment_id", "post_id"),)
+    id                  = Column(Integer, primary_key = True)
+    created_at          = Column(DateTime, default = datetime.datetime.utcnow)
+    experiment_id       = Column(Integer, nullable=False)
+    post_id             = Column(String(32), nullable=False, index = True)
+
+class ExperimentComment(Base):
+    __tablename__       = "experiment_comments"
+    __table_args__      = (UniqueConstraint("experiment_id", "comment_id"),)
+    id                  = Column(Integer, primary_key = True)
+    experiment_id       = Column(Integer, nullable=False)
+    comment_id          = Column(String(32), nullable=False)
+    post_id             = Column(String(32), nullable=False)
+    parent_id           = Column(String(32)) # fullname, e.g. t1_abc or t3_xyz
+    created_utc         = Column(DateTime)
+    # for replies to a treatment comment, the id of that treatment comment
+    root_id             = Column(String(32))
+
+Index("ix_experiment_comments_experiment_id_post_id", ExperimentComment.experiment_id, ExperimentComment.post_id)
+Index("ix_experiment_comments_experiment_id_parent_id", ExperimentComment.experiment_id, ExperimentComment.parent_id)
+
 class EventHook(Base):
     __tablename__       = "event_hooks"
     id                  = Column(Integer, primary_key=True)
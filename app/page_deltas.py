@@ -0,0 +1,246 @@
+"""
+Subreddit and front pages stored as deltas against the previous poll.
+
+A PageDeltaCache keeps the last page it stored for each subreddit (or the
+front page) and page type, and stores each new poll as a delta against it:
+
+    {"base":    the id of the page the delta is against,
+     "order":   the new order, as previous ranks for posts that stay on the
+                page and ids for posts that are new to it,
+     "added":   {id: post} for the posts that are new to the page,
+     "changed": {id: {field: value}} for the fields of the remaining posts
+                that changed}
+
+with empty keys left out. Every KEYFRAME_INTERVAL pages the full page is
+stored as a keyframe, and a delta row's keyframe_id is the keyframe its chain
+starts from. iter_pages() reads a series of pages; page_posts() reads one.
+"""
+
+from collections import namedtuple
+import simplejson as json
+from sqlalchemy import or_
+from app.models import SubredditPage, ArchivedSubredditPage, FrontPage, ArchivedFrontPage
+
+KEYFRAME_INTERVAL = 24
+ITER_BATCH_SIZE = 1000
+
+# the tables a chain of pages in each table may be spread over, since the
+# retention job moves the oldest rows of a chain first
+CHAIN_MODELS = {
+    SubredditPage: [SubredditPage, ArchivedSubredditPage],
+    ArchivedSubredditPage: [ArchivedSubredditPage],
+    FrontPage: [FrontPage, ArchivedFrontPage],
+    ArchivedFrontPage: [ArchivedFrontPage],
+}
+
+# the tables the pages of a series may be in, oldest pages first
+SERIES_MODELS = {
+    SubredditPage: [ArchivedSubredditPage, SubredditPage],
+    FrontPage: [ArchivedFrontPage, FrontPage],
+}
+
+CachedPage = namedtuple("CachedPage", ["page_id", "keyframe_id", "chain_length", "posts"])
+
+def page_model(subreddit_id):
+    """FrontPage when subreddit_id is None, SubredditPage otherwise."""
+    return FrontPage if subreddit_id is None else SubredditPage
+
+def series_query(db_session, subreddit_id, page_type, model=None):
+    """The pages of a subreddit's (or the front page's) page_type, in model's
+    table, by default the live one."""
+    if model is None:
+        model = page_model(subreddit_id)
+    query = db_session.query(model).filter(model.page_type == page_type.value)
+    if subreddit_id is not None:
+        query = query.filter(model.subreddit_id == subreddit_id)
+    return query
+
+def diff_page(previous, current):
+    """The delta that turns the previous list of posts into the current one,
+    or None when the pages can't be diffed (e.g. a post listed twice)."""
+    previous_ranks = {post['id']: rank for rank, post in enumerate(previous)}
+    order = []
+    added = {}
+    changed = {}
+    for post in current:
+        rank = previous_ranks.get(post['id'])
+        if rank is None:
+            order.append(post['id'])
+            added[post['id']] = post
+            continue
+        order.append(rank)
+        fields = {key: value for key, value in post.items() if previous[rank].get(key) != value}
+        if fields:
+            changed[post['id']] = fields
+
+    delta = {}
+    if order != list(range(len(previous))):
+        delta["order"] = order
+    if added:
+        delta["added"] = added
+    if changed:
+        delta["changed"] = changed
+    if apply_delta(previous, delta) != current:
+        return None
+    return delta
+
+def apply_delta(previous, delta):
+    """The list of posts a delta from diff_page() turns previous into."""
+    added = delta.get("added", {})
+    changed = delta.get("changed", {})
+    posts = []
+    for item in delta.get("order", range(len(previous))):
+        post = previous[item] if isinstance(item, int) else added[item]
+        if post['id'] in changed:
+            post = dict(post, **changed[post['id']])
+        posts.append(post)
+    return posts
+
+def chain_rows(db_session, model, keyframe_id, last_page_id):
+    """The keyframe and the deltas after it, up to and including
+    last_page_id, in order."""
+    rows = {}
+    for chain_model in CHAIN_MODELS[model]:
+        table = chain_model.__table__
+        for row in db_session.execute(
+                table.select()
+                .where(or_(table.c.id == keyframe_id, table.c.keyframe_id == keyframe_id))
+                .where(table.c.id <= last_page_id)
+                .order_by(table.c.id)):
+            rows[row.id] = row
+        if keyframe_id in rows:
+            break
+    return [rows[page_id] for page_id in sorted(rows)]
+
+def delta_base(delta, previous_id):
+    """The id of the page a delta is against. Deltas stored before bases
+    were recorded are against the page before them."""
+    return delta.get("base", previous_id)
+
+def replay_chain(rows):
+    """{page id: posts} for the rows of a chain: its keyframe, then deltas."""
+    chain = {}
+    previous_id = None
+    for row in rows:
+        if previous_id is None:
+            chain[row.id] = json.loads(row.page_data)
+        else:
+            delta = json.loads(row.page_data)
+            base_id = delta_base(delta, previous_id)
+            if base_id not in chain:
+                raise Exception("Missing base page {0} of page {1}".format(base_id, row.id))
+            chain[row.id] = apply_delta(chain[base_id], delta)
+        previous_id = row.id
+    return chain
+
+def page_posts(db_session, page):
+    """The list of posts on a stored page, of any of the page tables."""
+    if page.keyframe_id is None:
+        return json.loads(page.page_data)
+    rows = chain_rows(db_session, type(page), page.keyframe_id, page.id)
+    if len(rows) == 0 or rows[0].id != page.keyframe_id:
+        raise Exception("Missing keyframe {0} of {1} {2}".format(
+            page.keyframe_id, page.__tablename__, page.id))
+    return replay_chain(rows)[page.id]
+
+def iter_pages(db_session, subreddit_id, page_type, start=None, end=None, batch_size=ITER_BATCH_SIZE):
+    """Yield (page, posts) for each page of a subreddit's page_type (the front
+    page's when subreddit_id is None) created between start and end, in the
+    order they were stored, from the archive table and then the live one.
+    Pages are read batch_size at a time, and the posts of the current chain's
+    pages are kept, so that each delta is applied to its base once; only a
+    delta whose chain started before start replays its chain."""
+    chain_posts = {}
+    chain_keyframe_id = None
+    previous_id = None
+    for page in _series_pages(db_session, subreddit_id, page_type, start, end, batch_size):
+        if page.keyframe_id is None:
+            posts = json.loads(page.page_data)
+            chain_keyframe_id = page.id
+            chain_posts = {}
+        else:
+            delta = json.loads(page.page_data)
+            base_id = delta_base(delta, previous_id)
+            if page.keyframe_id == chain_keyframe_id and base_id in chain_posts:
+                posts = apply_delta(chain_posts[base_id], delta)
+            else:
+                posts = page_posts(db_session, page)
+                chain_keyframe_id = page.keyframe_id
+                chain_posts = {}
+        chain_posts[page.id] = posts
+        previous_id = page.id
+        yield page, posts
+
+def _series_pages(db_session, subreddit_id, page_type, start, end, batch_size):
+    """The rows of a series created between start and end, in order of id
+    across its tables. The retention job moves the oldest pages, so the
+    archived pages come before the live ones."""
+    last_id = 0
+    for model in SERIES_MODELS[page_model(subreddit_id)]:
+        query = series_query(db_session, subreddit_id, page_type, model)
+        if start is not None:
+            query = query.filter(model.created_at >= start)
+        if end is not None:
+            query = query.filter(model.created_at <= end)
+        while True:
+            pages = query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            for page in pages:
+                yield page
+            if len(pages) > 0:
+                last_id = pages[-1].id
+            if len(pages) < batch_size:
+                break
+
+class PageDeltaCache:
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.last_pages = {}
+
+    def load(self, db_session, model, page_id):
+        """Read the last stored page back from the database, when this
+        process hasn't stored it."""
+        page = db_session.query(model).filter(model.id == page_id).first()
+        if page.keyframe_id is None:
+            return CachedPage(page.id, page.id, 1, json.loads(page.page_data))
+        chain_length = db_session.query(model).filter(
+            model.keyframe_id == page.keyframe_id,
+            model.id <= page.id).count() + 1
+        return CachedPage(page.id, page.keyframe_id, chain_length, page_posts(db_session, page))
+
+    def store(self, db_session, subreddit_id, page_type, posts):
+        """Insert a page of posts for a subreddit (or the front page, when
+        subreddit_id is None), as a delta against the previous page of that
+        page type when there is one. Returns the id of the new page."""
+        model = page_model(subreddit_id)
+        key = (subreddit_id, page_type.value)
+        latest_id = series_query(db_session, subreddit_id, page_type).with_entities(
+            model.id).order_by(model.id.desc()).limit(1).scalar()
+
+        # another process (or the retention job) may have written since
+        previous = self.last_pages.get(key)
+        if latest_id is None:
+            previous = None
+        elif previous is None or previous.page_id != latest_id:
+            previous = self.load(db_session, model, latest_id)
+
+        delta = None
+        if previous is not None and previous.chain_length < self.keyframe_interval:
+            delta = diff_page(previous.posts, posts)
+
+        row = {"page_type": page_type.value,
+               "is_utc": True}
+        if subreddit_id is not None:
+            row["subreddit_id"] = subreddit_id
+        if delta is None:
+            row.update(page_data = json.dumps(posts), keyframe_id = None)
+        else:
+            delta["base"] = previous.page_id
+            row.update(page_data = json.dumps(delta), keyframe_id = previous.keyframe_id)
+        result = db_session.insert_retryable(model, row)
+        page_id = result.inserted_primary_key[0]
+
+        if delta is None:
+            self.last_pages[key] = CachedPage(page_id, page_id, 1, posts)
+        else:
+            self.last_pages[key] = CachedPage(page_id, previous.keyframe_id, previous.chain_length + 1, posts)
+        return page_id
@@ -4,12 +4,12 @@ import simplejson as json
 import datetime
 from utils.common import PageType, DbEngine 
 from app.models import Base, SubredditPage, FrontPage
+from app.page_deltas import iter_pages
 
+# pages: (page, posts) pairs, from app.page_deltas.iter_pages
 def construct_rank_vectors(pages):
     rank_vectors = {}   # {pid: {time: rank}}
-    for page in pages:
-        posts = json.loads(page.page_data)
-
+    for page, posts in pages:
         for i,post in enumerate(posts):
             pid = post['id']
             if pid not in rank_vectors:
@@ -60,12 +60,8 @@ def time_on_page(post_id, subreddit_id, page_type, rank_limit=100, start_time=da
     ENV = os.environ['CS_ENV']
     db_session = DbEngine(os.path.join(BASE_DIR, "config") + "/{env}.json".format(env=ENV)).new_session()
 
-    pages = []
-    if not subreddit_id:
-        # then query FrontPage
-        pages = db_session.query(FrontPage).filter(FrontPage.page_type == page_type.value, FrontPage.created_at >= start_time, FrontPage.created_at <= end_time)
-    else:
-        pages = db_session.query(SubredditPage).filter(SubredditPage.page_type == page_type.value, SubredditPage.created_at >= start_time, SubredditPage.created_at <= end_time, SubredditPage.subreddit_id == subreddit_id)
+    # pages are stored as deltas; iter_pages replays them. if not subreddit_id, then query FrontPage
+    pages = iter_pages(db_session, subreddit_id or None, page_type, start_time, end_time)
 
     rank_vectors = construct_rank_vectors(pages)
     if post_id not in rank_vectors:
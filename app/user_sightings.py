@@ -0,0 +1,40 @@
+"""
+Batched updates of when each redditor was first and last seen.
+
+A UserSightings collects the earliest and latest time each user was seen, and
+flush() writes them all with one INSERT ... ON DUPLICATE KEY UPDATE that only
+moves last_seen forward.
+"""
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert
+from app.models import User
+
+class UserSightings:
+    def __init__(self):
+        self.seen = {}
+
+    def __len__(self):
+        return len(self.seen)
+
+    def add(self, username, seen_at):
+        if username is None:
+            return
+        first_seen, last_seen = self.seen.get(username, (seen_at, seen_at))
+        self.seen[username] = (min(first_seen, seen_at), max(last_seen, seen_at))
+
+    def flush(self, db_session, commit=True):
+        """Write every sighting since the last flush. Returns the number of
+        users written."""
+        if len(self.seen) == 0:
+            return 0
+        # in name order, so that concurrent flushes lock rows in the same order
+        rows = [{"name": name, "first_seen": first_seen, "last_seen": last_seen}
+                for name, (first_seen, last_seen) in sorted(self.seen.items())]
+        statement = insert(User.__table__)
+        statement = statement.on_duplicate_key_update(last_seen = func.greatest(
+            func.coalesce(User.__table__.c.last_seen, statement.inserted.last_seen),
+            statement.inserted.last_seen))
+        db_session.execute_retryable(statement, rows, commit=commit)
+        self.seen = {}
+        return len(rows)
@@ -0,0 +1,72 @@
+"""rq workers that do the app.controller setup once, instead of once per job.
+
+The default rq worker forks a work horse for every job, and the work horse
+imports app.controller when it resolves the job function: it creates the
+database engines and logger, constructs reddit.connection.Connect (which
+verifies the praw patch, see reddit/praw_patch.py), and imports
+every controller module (and numpy). WarmWorker does all of that, and parses
+the experiment configs, in the worker process before it starts taking jobs, so
+every work horse is forked with it already done.
+
+Before each fork the worker empties its connection pools, so a work horse
+never shares a MySQL connection with the worker or with another work horse.
+
+WarmSimpleWorker runs jobs in the worker process itself, as rq's SimpleWorker
+does, so whatever jobs cache (experiment configs, parsed by mtime) also
+survives from one job to the next. Sessions are rolled back between jobs so
+no ORM state leaks into the next job.
+
+    rqworker -w app.worker.WarmWorker production
+    rqworker -w app.worker.WarmSimpleWorker --max-jobs 1000 production
+
+benchmarks/worker_startup.py measures the per-job startup overhead of both.
+"""
+import glob
+import os
+import time
+
+import yaml
+from rq import SimpleWorker, Worker
+
+from utils.common import load_yaml_cached
+
+
+def warm():
+    """Do the per-process setup of app.controller jobs in this process, and
+    leave it holding no database connections. Returns the seconds it took."""
+    start = time.perf_counter()
+    import app.controller
+
+    # experiment controllers look up their config on every job
+    for path in glob.glob(os.path.join(app.controller.BASE_DIR, "config", "experiments", "*.yml")):
+        try:
+            load_yaml_cached(path)
+        except yaml.YAMLError:
+            pass # reported by the job that loads it
+
+    app.controller.reset_db_sessions(dispose=True)
+    return time.perf_counter() - start
+
+
+class WarmWorkerMixin:
+    # dispose of the connection pools before every job, so that a forked work
+    # horse starts without inherited connections
+    dispose_between_jobs = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log.info("Preloaded app.controller in %.2fs", warm())
+
+    def execute_job(self, job, queue):
+        import app.controller
+        app.controller.reset_db_sessions(dispose=self.dispose_between_jobs)
+        return super().execute_job(job, queue)
+
+
+class WarmWorker(WarmWorkerMixin, Worker):
+    pass
+
+
+class WarmSimpleWorker(WarmWorkerMixin, SimpleWorker):
+    # jobs run in this process, so keep the pooled connections between jobs
+    dispose_between_jobs = False
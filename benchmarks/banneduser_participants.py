@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Measure the banned user experiment's participant queries at scale.
+
+Seeds `--users` enrolled users (100,000 by default) into experiment_things for
+a benchmark-only experiment id, then times, for each query:
+
+- json: the previous approach, loading every user thing of the experiment and
+  filtering on the ban_type in its metadata_json
+- indexed: filtering on the projected ExperimentThing.ban_type and
+  query_index columns
+
+    CS_ENV=test python -m benchmarks.banneduser_participants -u 100000 -n 5
+
+Only the seeded rows are deleted afterwards, but use the docker test or
+development databases (`make docker-up`).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from statistics import mean, median
+
+import simplejson as json
+
+from app.controllers.banneduser_experiment_controller import BannedUserQueryIndex
+from app.models import ExperimentThing
+from utils.common import BASE_DIR, DbEngine, ThingType
+
+ENV = os.environ["CS_ENV"]
+EXPERIMENT_ID = 2000000000 # out of the range of real experiments
+BATCH_SIZE = 1000
+BAN_TYPES = [("temporary", 0.2), ("permanent", 0.3), ("unbanned", 0.5)]
+STATES = [BannedUserQueryIndex.FIRST_BANSTART_PENDING, BannedUserQueryIndex.FIRST_BANSTART_COMPLETE,
+          BannedUserQueryIndex.SECOND_BANOVER_PENDING, BannedUserQueryIndex.SECOND_BANOVER_COMPLETE]
+
+
+def new_session():
+    return DbEngine(os.path.join(BASE_DIR, "config", "{env}.json".format(env=ENV))).new_session()
+
+
+def clear_users(db_session):
+    db_session.query(ExperimentThing).filter(
+        ExperimentThing.experiment_id == EXPERIMENT_ID).delete(synchronize_session=False)
+    db_session.commit()
+
+
+def seed_users(db_session, users):
+    rng = random.Random(0)
+    ban_types, weights = zip(*BAN_TYPES)
+    rows = []
+    for i in range(users):
+        metadata = {
+            "condition": "lurker_tempban",
+            "randomization": {"treatment": i % 2},
+            "arm": "arm_%d" % (i % 2),
+            "ban_duration_days": 7,
+            "ban_reason": "benchmark",
+            "ban_start_time": 1704154715,
+            "ban_type": rng.choices(ban_types, weights)[0],
+            "actual_ban_end_time": None,
+        }
+        rows.append({
+            "id": uuid.uuid4().hex,
+            "thing_id": "benchmark_user_%d" % i,
+            "experiment_id": EXPERIMENT_ID,
+            "object_type": ThingType.USER.value,
+            "query_index": rng.choice(STATES),
+            **ExperimentThing.metadata_columns(metadata),
+        })
+        if len(rows) == BATCH_SIZE:
+            db_session.insert_retryable(ExperimentThing, rows)
+            rows = []
+    if rows:
+        db_session.insert_retryable(ExperimentThing, rows)
+
+
+def user_things(db_session):
+    return db_session.query(ExperimentThing).filter(
+        ExperimentThing.object_type == ThingType.USER.value,
+        ExperimentThing.experiment_id == EXPERIMENT_ID)
+
+
+def temporary_bans_json(db_session):
+    return [ut for ut in user_things(db_session)
+            if json.loads(ut.metadata_json)["ban_type"] == "temporary"]
+
+
+def temporary_bans_indexed(db_session):
+    return db_session.query(ExperimentThing).filter(
+        ExperimentThing.experiment_id == EXPERIMENT_ID,
+        ExperimentThing.ban_type == "temporary",
+        ExperimentThing.object_type == ThingType.USER.value).all()
+
+
+def pending_banstarts(db_session):
+    return user_things(db_session).filter(
+        ExperimentThing.query_index == BannedUserQueryIndex.FIRST_BANSTART_PENDING).all()
+
+
+QUERIES = [
+    ("temporary_bans", "json", temporary_bans_json),
+    ("temporary_bans", "indexed", temporary_bans_indexed),
+    ("first_banstart_pending", "indexed", pending_banstarts),
+]
+
+
+def time_query(db_session, query, runs):
+    timings = []
+    rows = 0
+    for _ in range(runs):
+        db_session.expunge_all()
+        start = time.perf_counter()
+        rows = len(query(db_session))
+        timings.append(time.perf_counter() - start)
+        db_session.rollback()
+    return timings, rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--users",
+                        type=int,
+                        default=100000,
+                        help="Number of enrolled users to seed.")
+    parser.add_argument("-n", "--runs",
+                        type=int,
+                        default=5,
+                        help="Number of runs of each query.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if ENV == "production":
+        sys.exit("Refusing to seed benchmark users in production.")
+
+    db_session = new_session()
+    clear_users(db_session)
+    try:
+        start = time.perf_counter()
+        seed_users(db_session, args.users)
+        print("Seeded %d users in %.1fs" % (args.users, time.perf_counter() - start))
+
+        print("%-26s%-10s%10s%12s%12s%12s" % ("query", "method", "rows", "mean_ms", "median_ms", "max_ms"))
+        for name, method, query in QUERIES:
+            timings, rows = time_query(db_session, query, args.runs)
+            print("%-26s%-10s%10d%12.1f%12.1f%12.1f" % (
+                name, method, rows, mean(timings) * 1000, median(timings) * 1000, max(timings) * 1000))
+    finally:
+        clear_users(db_session)
+
+
+if __name__ == "__main__":
+    main()
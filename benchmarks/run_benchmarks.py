@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""End-to-end benchmarks for the app.controller entry points.
+
+Every run of a benchmark reseeds the database for CS_ENV, then runs one
+app.controller job against reddit.fake_reddit.FakeReddit in a forked child
+process, the way an rq workhorse would. For every run we record wall time, the number of statements
+sent to the database, the rows the job added and the peak RSS of the child.
+Results are compared with a stored baseline so regressions in hot paths show
+up before deploy.
+
+    CS_ENV=test python -m benchmarks.run_benchmarks
+    CS_ENV=test python -m benchmarks.run_benchmarks --save-baseline
+    CS_ENV=test python -m benchmarks.run_benchmarks -b fetch_last_thousand_comments -n 5
+
+The benchmarks clear every archive table in the CS_ENV database, so only run
+them against the docker test/development databases.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+
+import simplejson as json
+
+BENCHMARKS_DIR = str(Path(__file__).resolve().parent)
+FAKE_REDDIT_CONFIG = str(Path(BENCHMARKS_DIR, "fake_reddit.json"))
+BASELINE_PATH = str(Path(BENCHMARKS_DIR, "baseline.json"))
+
+os.environ.setdefault("CS_FAKE_REDDIT", FAKE_REDDIT_CONFIG)
+os.environ.setdefault("CS_PRAW_DIFFS_REQUIRED", "0")
+
+from app.models import *
+from reddit.fake_reddit import FakeReddit
+from utils import querystats
+from utils.common import BASE_DIR, LOGS_DIR, DbEngine, PageType
+
+ENV = os.environ["CS_ENV"]
+RESULTS_DIR = str(Path(LOGS_DIR, "benchmarks"))
+RESULTS_FILENAME = "%s_benchmarks.json"
+RESULTS_DATETIME = "%Y%m%d%H%M%S"
+TOLERANCE = 0.2
+
+# name -> (app.controller job, args, experiments initialized before the run)
+BENCHMARKS = OrderedDict([
+    ("fetch_last_thousand_comments", ("fetch_last_thousand_comments", ["science"], [])),
+    ("fetch_mod_action_history", ("fetch_mod_action_history", ["science"], [])),
+    ("fetch_subreddit_front", ("fetch_subreddit_front", ["science", PageType.HOT], [])),
+    ("fetch_reddit_front", ("fetch_reddit_front", [PageType.TOP], [])),
+    ("banneduser_mod_action_callbacks", ("fetch_mod_action_history", ["catlabreddit_testbu1"],
+                                         ["banneduser_experiment_test"])),
+    ("banneduser_update_experiment", ("conduct_banuser_experiment", ["banneduser_experiment_test"],
+                                      ["banneduser_experiment_test"])),
+    ("sticky_comment_post_callbacks", ("fetch_subreddit_front", ["iama", PageType.NEW],
+                                       ["sticky_comment_messaging_experiment_test"])),
+    ("sticky_comment_update_experiment", ("conduct_sticky_comment_experiment", ["sticky_comment_messaging_experiment_test"],
+                                          ["sticky_comment_messaging_experiment_test"])),
+])
+
+# (metric, higher is worse); wall time is compared as the median over runs
+COMPARED_METRICS = [("wall_time", True), ("db_statements", True),
+                    ("rows_per_sec", False), ("peak_rss_kb", True)]
+
+COUNTED_TABLES = [FrontPage, SubredditPage, Subreddit, Post, User, ModAction,
+                  Comment, Experiment, ExperimentThing, ExperimentAction,
+                  ExperimentThingSnapshot, MessageLog]
+
+
+def new_session():
+    return DbEngine(os.path.join(BASE_DIR, "config", "{env}.json".format(env=ENV))).new_session()
+
+
+def count_rows(db_session):
+    return {model.__tablename__: db_session.query(model).count() for model in COUNTED_TABLES}
+
+
+def clear_tables(db_session):
+    db_session.execute("UNLOCK TABLES")
+    for model in COUNTED_TABLES + [EventHook]:
+        db_session.query(model).delete()
+    db_session.commit()
+
+
+def seed_database(db_session, fake_reddit, history):
+    """Start every benchmark from the same database: the fake subreddits and
+    `history` posts, comments and moderation actions per subreddit that are
+    older than anything the fake reddit will return from a listing."""
+    clear_tables(db_session)
+    for subreddit in fake_reddit.subreddits.values():
+        db_session.insert_retryable(Subreddit, {"id": subreddit.id, "name": subreddit.display_name})
+
+        posts = fake_reddit.older_things(subreddit.display_name, "posts", history)
+        for i in range(0, len(posts), 1000):
+            db_session.insert_retryable(Post, [{
+                "id": p["id"],
+                "subreddit_id": subreddit.id,
+                "created": datetime.fromtimestamp(p["created_utc"]),
+                "post_data": json.dumps(p)} for p in posts[i:i + 1000]])
+
+        comments = fake_reddit.older_things(subreddit.display_name, "comments", history)
+        for i in range(0, len(comments), 1000):
+            db_session.insert_retryable(Comment, [{
+                "id": c["id"],
+                "subreddit_id": subreddit.id,
+                "created_utc": datetime.utcfromtimestamp(c["created_utc"]),
+                "post_id": c["link_id"].replace("t3_", ""),
+                "user_id": c["author"],
+                "comment_data": json.dumps(c)} for c in comments[i:i + 1000]])
+
+        actions = fake_reddit.older_things(subreddit.display_name, "mod_actions", history)
+        for i in range(0, len(actions), 1000):
+            db_session.insert_retryable(ModAction, [{
+                "id": a["id"],
+                "created_utc": datetime.fromtimestamp(a["created_utc"]),
+                "subreddit_id": a["sr_id36"],
+                "mod": a["mod"],
+                "target_author": a["target_author"],
+                "action": a["action"],
+                "target_fullname": a["target_fullname"],
+                "action_data": json.dumps(a)} for a in actions[i:i + 1000]])
+
+
+def run_job(job, args, experiments, results):
+    """Runs in a forked child so that every run starts from a cold
+    app.controller, and so that ru_maxrss is the peak of this run alone."""
+    import app.controller
+
+    db_session = app.controller.db_session
+    # registers the experiment and its event hooks, outside of the measurement
+    for experiment_name in experiments:
+        app.controller.get_experiment_class(experiment_name)(
+            experiment_name = experiment_name,
+            db_session = db_session,
+            r = app.controller.conn.connect(controller=experiment_name),
+            log = app.controller.log)
+    rows_before = count_rows(db_session)
+    fake_reddit = FakeReddit.shared(os.environ["CS_FAKE_REDDIT"])
+    reddit_calls_before = sum(fake_reddit.call_counts.values())
+
+    with querystats.scope(job) as query_stats:
+        start = time.perf_counter()
+        getattr(app.controller, job)(*args)
+        wall_time = time.perf_counter() - start
+
+    rows_after = count_rows(db_session)
+    rows = sum(rows_after[t] - rows_before[t] for t in rows_after)
+
+    results.put({
+        "wall_time": wall_time,
+        "db_statements": query_stats.count,
+        "db_time": query_stats.total_time,
+        "rows": rows,
+        "rows_per_sec": rows / wall_time if wall_time else 0.0,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "reddit_calls": sum(fake_reddit.call_counts.values()) - reddit_calls_before,
+    })
+
+
+def reseed(fake_reddit, history):
+    db_session = new_session()
+    seed_database(db_session, fake_reddit, history)
+    db_session.close()
+    # the forked child mustn't share this process's connections
+    db_session.get_bind().dispose()
+
+
+def run_benchmark(name, runs, fake_reddit, history):
+    job, args, experiments = BENCHMARKS[name]
+    context = multiprocessing.get_context("fork")
+    measurements = []
+    for _ in range(runs):
+        # every run starts from the same database, rather than from what
+        # the run before it stored
+        reseed(fake_reddit, history)
+        results = context.Queue()
+        process = context.Process(target=run_job, args=(job, args, experiments, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError("benchmark %s failed with exit code %d" % (name, process.exitcode))
+        measurements.append(results.get())
+
+    total_rows = sum(m["rows"] for m in measurements)
+    total_time = sum(m["wall_time"] for m in measurements)
+    return {
+        "runs": runs,
+        "wall_time": median(m["wall_time"] for m in measurements),
+        "db_statements": median(m["db_statements"] for m in measurements),
+        "db_time": median(m["db_time"] for m in measurements),
+        "rows": total_rows,
+        "rows_per_sec": total_rows / total_time if total_time else 0.0,
+        "peak_rss_kb": max(m["peak_rss_kb"] for m in measurements),
+        "reddit_calls": median(m["reddit_calls"] for m in measurements),
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Returns a list of (benchmark, metric, baseline value, value) for every
+    metric that is more than `tolerance` worse than the baseline."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS:
+            expected, actual = baseline[name].get(metric), result.get(metric)
+            if not expected or actual is None:
+                continue
+            change = (actual - expected) / float(expected)
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append((name, metric, expected, actual))
+    return regressions
+
+
+def print_results(results, baseline, stream=sys.stdout):
+    stream.write("%-36s%10s%10s%10s%12s%12s\n" % (
+        "benchmark", "wall_s", "base_s", "stmts", "rows/s", "rss_kb"))
+    for name, result in results.items():
+        base = baseline.get(name, {}).get("wall_time")
+        stream.write("%-36s%10.3f%10s%10d%12.1f%12d\n" % (
+            name, result["wall_time"], "%.3f" % base if base else "-",
+            result["db_statements"], result["rows_per_sec"], result["peak_rss_kb"]))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--benchmarks",
+                        nargs="+",
+                        choices=list(BENCHMARKS.keys()),
+                        default=list(BENCHMARKS.keys()),
+                        help="The benchmarks to run.")
+    parser.add_argument("-n", "--runs",
+                        type=int,
+                        default=3,
+                        help="Number of runs of each benchmark.")
+    parser.add_argument("-H", "--history",
+                        type=int,
+                        default=10000,
+                        help="Rows of history seeded per subreddit for posts, comments and mod actions.")
+    parser.add_argument("-B", "--baseline",
+                        default=BASELINE_PATH,
+                        help="Path of the baseline results.")
+    parser.add_argument("-s", "--save-baseline",
+                        action="store_true",
+                        help="Overwrite the baseline with these results.")
+    parser.add_argument("-t", "--tolerance",
+                        type=float,
+                        default=TOLERANCE,
+                        help="Allowed relative regression before failing.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if ENV == "production":
+        sys.exit("The benchmarks clear the database; refusing to run in production.")
+
+    fake_reddit = FakeReddit.from_config(os.environ["CS_FAKE_REDDIT"])
+    results = OrderedDict()
+    for name in args.benchmarks:
+        results[name] = run_benchmark(name, args.runs, fake_reddit, args.history)
+
+    Path(RESULTS_DIR).mkdir(parents=True, exist_ok=True)
+    results_path = str(Path(RESULTS_DIR, RESULTS_FILENAME % datetime.now().strftime(RESULTS_DATETIME)))
+    with open(results_path, "w") as f:
+        f.write(json.dumps(results, indent=2))
+
+    baseline = {}
+    if Path(args.baseline).is_file():
+        with open(args.baseline, "r") as f:
+            baseline = json.loads(f.read())
+
+    print_results(results, baseline)
+    print("Results saved to %s" % results_path)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            f.write(json.dumps(baseline, indent=2, sort_keys=True))
+        print("Baseline saved to %s" % args.baseline)
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, metric, expected, actual in regressions:
+        print("REGRESSION %s %s: baseline %.3f, now %.3f" % (name, metric, expected, actual))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Measure the startup overhead an rq worker adds to every job.
+
+For each worker class, fork a work horse the way rq does and time it from the
+fork until it is ready to call the job function:
+
+- cold: the default rq worker, whose work horse imports app.controller
+- warm: app.worker.WarmWorker, which imported app.controller before forking
+- simple: app.worker.WarmSimpleWorker, which runs the job in the worker
+  process and only resets its database sessions
+
+    CS_ENV=test python -m benchmarks.worker_startup -n 20
+
+The database is not queried, but app.controller needs the CS_ENV config.
+"""
+import argparse
+import os
+import sys
+import time
+from statistics import mean, median
+
+os.environ.setdefault("CS_PRAW_DIFFS_REQUIRED", "0")
+
+
+def fork_work_horse(setup):
+    """Seconds from forking a child until it has run setup()."""
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        setup()
+        os.write(write_fd, b"1")
+        os._exit(0)
+    os.close(write_fd)
+    os.read(read_fd, 1)
+    elapsed = time.perf_counter() - start
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return elapsed
+
+
+def import_controller():
+    import app.controller
+
+
+def reset_sessions():
+    import app.controller
+    app.controller.reset_db_sessions()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs",
+                        type=int,
+                        default=10,
+                        help="Number of jobs to start with each worker.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if "app.controller" in sys.modules:
+        sys.exit("app.controller is already imported; the cold measurement would be warm.")
+
+    timings = {}
+    timings["cold"] = [fork_work_horse(import_controller) for _ in range(args.runs)]
+
+    from app.worker import warm
+    print("Preloaded app.controller in %.3fs" % warm())
+    timings["warm"] = [fork_work_horse(lambda: None) for _ in range(args.runs)]
+
+    timings["simple"] = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        reset_sessions()
+        timings["simple"].append(time.perf_counter() - start)
+
+    print("%-10s%12s%12s%12s" % ("worker", "mean_ms", "median_ms", "max_ms"))
+    for name, values in timings.items():
+        print("%-10s%12.1f%12.1f%12.1f" % (
+            name, mean(values) * 1000, median(values) * 1000, max(values) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,17 @@ class MockRedditData(DictObject):
         super().__init__(*args, **kw)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def metrics_dir(tmp_path_factory):
+    # @profilable appends a record for every job to utils.jobmetrics.METRICS_DIR;
+    # session scoped, since session fixtures (e.g. in test_perftest) run jobs too
+    import utils.jobmetrics
+    path = tmp_path_factory.mktemp("metrics")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(utils.jobmetrics, "METRICS_DIR", str(path))
+        yield path
+
+
 @pytest.fixture
 def db_session():
     config_file = os.path.join(BASE_DIR, "config", f"{ENV}.json")
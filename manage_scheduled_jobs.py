@@ -3,6 +3,7 @@ from redis import Redis
 from rq_scheduler import Scheduler
 from datetime import datetime, timedelta
 import app.controller
+from utils.scheduling import job_stats
 import os
 
 #documentation at
@@ -37,7 +38,20 @@ def main():
         print("=================================")
         print("\n")
         for job in scheduler.get_jobs(until=timedelta(hours=24), with_times=True):
-            print("ID: {1}\n    Job: {0}\n    Time: {2}\tInterval: {3}\n".format(job[0].description, job[0].id, job[1], job[0].meta["interval"]))
+            print("ID: {1}\n    Job: {0}\n    Time: {2}\tInterval: {3}\tQueue: {4}".format(job[0].description, job[0].id, job[1], job[0].meta["interval"], job[0].origin))
+            stats = job_stats(scheduler.connection, job[0])
+            if "last_started_at" in stats:
+                print("    Last run: {0}\tDuration: {1:.0f}s".format(
+                    datetime.utcfromtimestamp(stats["last_started_at"]).strftime("%Y-%m-%d %H:%M:%S"),
+                    stats.get("last_duration", 0)))
+            if "adaptive" in job[0].meta:
+                print("    Adaptive interval: {min_interval}-{max_interval}s, aiming for {target_items} new items per run".format(
+                    **job[0].meta["adaptive"]) + ("\tNew items last run: {0:.0f}".format(stats["new_items"]) if "new_items" in stats else ""))
+            print("    Queue lag: {0:.0f}s (max {1:.0f}s)\tSkipped ticks: {2:.0f} while running, {3:.0f} merged\n".format(
+                stats.get("last_lag", 0),
+                stats.get("max_lag", 0),
+                stats.get("skipped_running", 0),
+                stats.get("skipped_merged", 0)))
     elif(args.action == "remove"):
         if(args.object is None):
             print("Please specify the job to remove")
@@ -0,0 +1,248 @@
+"""An asyncio client for the read-only reddit endpoints the archive jobs use.
+
+AsyncReddit requests the OAuth endpoints with aiohttp, using the access token
+stored in praw_keys, and every request waits its turn at a shared
+RateLimiter. Things are returned as RedditThing objects with the same shape
+the archive controllers read from praw objects.
+
+    async with AsyncReddit.from_praw_key(db_session, "FetchComments") as r:
+        comments = await r.get_comments("science", limit=1000)
+
+aiohttp is optional; without it is_available() is False.
+"""
+import asyncio
+import os
+import time
+
+from app.models import PrawKey
+from reddit.connection import USER_AGENT
+from utils import jobmetrics
+from utils.common import PageType
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+ENV = os.environ["CS_ENV"]
+OAUTH_URL = "https://oauth.reddit.com"
+LISTING_PAGE_SIZE = 100
+INFO_CHUNK_SIZE = 100
+# praw 3.5 waits api_request_delay (2 seconds) between requests
+DEFAULT_REQUESTS_PER_MINUTE = 30
+REQUEST_TIMEOUT = 60
+MAX_ATTEMPTS = 5
+
+
+def is_available():
+    return aiohttp is not None
+
+
+class AsyncRedditError(Exception):
+    pass
+
+
+class RedditThing(dict):
+    """A reddit thing as a dict, with attribute access and a json_dict like
+    a praw object."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def json_dict(self):
+        return self
+
+    @property
+    def fullname(self):
+        return self["name"]
+
+
+class RateLimiter:
+    """Spaces requests evenly, requests_per_minute at most, across every
+    coroutine that shares it, and pauses all of them until the reset when
+    reddit reports no requests remaining."""
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        self.interval = 60.0 / requests_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = 0.0
+        self.paused_until = 0.0
+
+    async def wait(self):
+        now = self.clock()
+        # reserve a slot before sleeping, so concurrent waiters queue up
+        at = max(now, self.next_at, self.paused_until)
+        self.next_at = at + self.interval
+        if at > now:
+            await self.sleep(at - now)
+
+    def update(self, headers):
+        remaining = headers.get("x-ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset")
+        if remaining is None or reset is None:
+            return
+        if float(remaining) < 1:
+            self.paused_until = max(self.paused_until, self.clock() + float(reset))
+
+
+class AsyncReddit:
+    def __init__(self, access_token, rate_limiter=None, refresh=None,
+                 session=None, user_agent=USER_AGENT):
+        """refresh, if given, is called (in a thread) when reddit rejects the
+        access token, and returns a new one."""
+        self.access_token = access_token
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.refresh = refresh
+        self.refresh_lock = asyncio.Lock()
+        self.session = session
+        self.owns_session = session is None
+        self.user_agent = user_agent
+
+    @classmethod
+    def from_praw_key(cls, db_session, controller, rate_limiter=None, conn=None, env=ENV):
+        """A client with the access token reddit.connection.Connect stored
+        for this controller. With conn, rejected tokens are refreshed through
+        praw and saved back to praw_keys."""
+        db_praw_id = PrawKey.get_praw_id(env, controller)
+        pk = db_session.query(PrawKey).filter_by(id=db_praw_id).first()
+        if pk is None:
+            raise AsyncRedditError("No stored access token for {0}; connect once with praw first".format(db_praw_id))
+        refresh = praw_key_refresher(conn, controller) if conn is not None else None
+        return cls(pk.access_token, rate_limiter=rate_limiter, refresh=refresh)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None and self.owns_session:
+            await self.session.close()
+            self.session = None
+
+    def _session(self):
+        if self.session is None:
+            if aiohttp is None:
+                raise AsyncRedditError("aiohttp is not installed")
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        return self.session
+
+    async def request(self, path, params=None):
+        """GET an OAuth endpoint and return the decoded json."""
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        refreshed = False
+        for attempt in range(MAX_ATTEMPTS):
+            await self.rate_limiter.wait()
+            headers = {"Authorization": "bearer " + self.access_token,
+                       "User-Agent": self.user_agent}
+            start = time.perf_counter()
+            try:
+                async with self._session().get(OAUTH_URL + path, params=params, headers=headers) as response:
+                    self.rate_limiter.update(response.headers)
+                    if response.status == 401 and self.refresh is not None and not refreshed:
+                        refreshed = True
+                        await self._refresh_access_token(headers["Authorization"])
+                        continue
+                    if response.status == 429:
+                        # rate_limiter.update has paused every request until the reset
+                        continue
+                    if response.status != 200:
+                        raise AsyncRedditError("GET {0} returned HTTP {1}".format(path, response.status))
+                    return await response.json()
+            finally:
+                jobmetrics.record_reddit_call(time.perf_counter() - start)
+        raise AsyncRedditError("GET {0} was rate limited {1} times".format(path, MAX_ATTEMPTS))
+
+    async def _refresh_access_token(self, rejected_authorization):
+        async with self.refresh_lock:
+            # concurrent requests rejected with the same token refresh it once
+            if "bearer " + self.access_token == rejected_authorization:
+                loop = asyncio.get_running_loop()
+                self.access_token = await loop.run_in_executor(None, self.refresh)
+
+    async def get_listing(self, path, limit=25, params=None):
+        """Page through a listing, LISTING_PAGE_SIZE things at a time, until
+        limit things are returned or the listing ends."""
+        params = dict(params or {})
+        things = []
+        while limit is None or len(things) < limit:
+            page_size = LISTING_PAGE_SIZE if limit is None else min(LISTING_PAGE_SIZE, limit - len(things))
+            listing = await self.request(path, dict(params, limit=page_size))
+            children = listing["data"]["children"]
+            things.extend(RedditThing(child["data"]) for child in children)
+            params["after"] = listing["data"].get("after")
+            if len(children) == 0 or params["after"] is None:
+                break
+        return things
+
+    ## THE READ-ONLY PART OF THE PRAW API THAT THE ARCHIVE CONTROLLERS USE
+
+    async def get_subreddit(self, subreddit_name):
+        about = await self.request("/r/{0}/about".format(subreddit_name))
+        return RedditThing(about["data"])
+
+    async def get_new(self, subreddit_name, limit=25, params=None):
+        return await self.get_listing("/r/{0}/new".format(subreddit_name), limit, params)
+
+    async def get_top(self, subreddit_name, limit=25, params=None):
+        return await self.get_listing("/r/{0}/top".format(subreddit_name), limit, params)
+
+    async def get_hot(self, subreddit_name, limit=25, params=None):
+        return await self.get_listing("/r/{0}/hot".format(subreddit_name), limit, params)
+
+    async def get_controversial(self, subreddit_name, limit=25, params=None):
+        return await self.get_listing("/r/{0}/controversial".format(subreddit_name), limit, params)
+
+    async def get_subreddit_page(self, subreddit_name, page_type, limit=25):
+        """The listing SubredditPageController.fetch_subreddit_page requests
+        for a PageType."""
+        sort = {PageType.TOP: "top", PageType.CONTR: "controversial",
+                PageType.NEW: "new", PageType.HOT: "hot"}[page_type]
+        return await self.get_listing("/r/{0}/{1}".format(subreddit_name, sort), limit)
+
+    async def get_comments(self, subreddit_name, limit=25, params=None):
+        return await self.get_listing("/r/{0}/comments".format(subreddit_name), limit, params)
+
+    async def get_mod_log(self, subreddit_name, limit=25, params=None):
+        return await self.get_listing("/r/{0}/about/log".format(subreddit_name), limit, params)
+
+    async def get_info(self, thing_ids):
+        things = []
+        for i in range(0, len(thing_ids), INFO_CHUNK_SIZE):
+            listing = await self.request("/api/info", {"id": ",".join(thing_ids[i:i + INFO_CHUNK_SIZE])})
+            things.extend(RedditThing(child["data"]) for child in listing["data"]["children"])
+        return things
+
+
+def praw_key_refresher(conn, controller):
+    """Refresh the controller's access token through praw, the way the
+    synchronous jobs do, saving it to praw_keys."""
+    def refresh():
+        r = conn.connect(controller=controller)
+        saved_credentials = conn.credentials(r)
+        r.refresh_access_information(r.refresh_token)
+        conn.save_credentials(PrawKey.get_praw_id(conn.env, controller), r, saved_credentials)
+        return r.access_token
+    return refresh
+
+
+def gather(coroutines, limit=None):
+    """Run the coroutines concurrently, at most limit at a time, and return
+    their results (or the exceptions they raised) in order."""
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def _run(coroutine):
+        if semaphore is None:
+            return await coroutine
+        async with semaphore:
+            return await coroutine
+
+    return asyncio.gather(*[_run(c) for c in coroutines], return_exceptions=True)
@@ -1,7 +1,7 @@
 import praw
 from praw.handlers import MultiprocessHandler
 import pickle
-import os, inspect
+import os, inspect, time
 from app.models import PrawKey
 import simplejson as json
 from sqlalchemy import create_engine
@@ -9,9 +9,32 @@ from sqlalchemy.orm import sessionmaker
 from app.models import Base
 import sqlalchemy
 from utils.common import DbEngine
-from reddit.praw_patch import PrawPatch
+import reddit.praw_patch
+from reddit.fake_reddit import FakeReddit
+from utils import jobmetrics
 
 ENV =  os.environ['CS_ENV']
+FAKE_REDDIT_CONFIG = os.environ.get("CS_FAKE_REDDIT")
+USER_AGENT = "Test version of CivilServant by u/natematias"
+
+class InstrumentedHandler(MultiprocessHandler):
+  """Reports the latency of every request to reddit to utils.jobmetrics."""
+
+  def request(self, **kwargs):
+    start = time.perf_counter()
+    try:
+      return super().request(**kwargs)
+    finally:
+      jobmetrics.record_reddit_call(time.perf_counter() - start)
+
+# reddit access tokens last an hour; clients are rebuilt a little before that
+ACCESS_TOKEN_LIFETIME = 3300
+
+class CachedClient:
+  def __init__(self, r, expires_at, saved_credentials):
+    self.r = r
+    self.expires_at = expires_at
+    self.saved_credentials = saved_credentials
 
 class Connect:
 
@@ -20,9 +43,8 @@ class Connect:
   # this may become a pattern that we should break out
   # into its own class eventually
   def __init__(self, db_session = None, base_dir="", env=None):
-    praw_patch = PrawPatch()
-    if praw_patch.required:
-      praw_patch.ensure_applied()
+    if reddit.praw_patch.is_required():
+      reddit.praw_patch.ensure_applied()
 
     self.base_dir = base_dir
     if(env):
@@ -36,15 +58,33 @@ class Connect:
       self.db_session = DbEngine(os.path.join(self.base_dir, "config","{env}.json".format(env=self.env))).new_session()
     else:
       self.db_session = db_session
+
+    # authenticated praw clients by praw key id; see connect()
+    self.clients = {}
     
   def connect(self, controller="Main"):
+    # Load testing against synthetic subreddits; see reddit/fake_reddit.py
+    if FAKE_REDDIT_CONFIG:
+      return FakeReddit.shared(FAKE_REDDIT_CONFIG)
+
+    start = time.perf_counter()
+    db_praw_id = PrawKey.get_praw_id(self.env, controller)
+
+    # REUSE THE CLIENT FROM AN EARLIER CALL IN THIS PROCESS UNTIL ITS TOKEN EXPIRES
+    client = self.clients.get(db_praw_id)
+    if client is not None and client.expires_at > time.time():
+      # praw refreshes an expired token on its own; save it if it has
+      self.save_credentials(db_praw_id, client.r, client.saved_credentials)
+      client.saved_credentials = self.credentials(client.r)
+      jobmetrics.record_connect(time.perf_counter() - start, cached=True)
+      return client.r
+
     r = None #Praw Connection Object
-    handler = MultiprocessHandler()
+    handler = InstrumentedHandler()
 
     # Check the Database for a Stored Praw Key
-    db_praw_id = PrawKey.get_praw_id(self.env, controller)
     pk = self.db_session.query(PrawKey).filter_by(id=db_praw_id).first()
-    r = praw.Reddit(user_agent="Test version of CivilServant by u/natematias", handler=handler)
+    r = praw.Reddit(user_agent=USER_AGENT, handler=handler)
     
     access_information = {}
     
@@ -58,9 +98,6 @@ class Connect:
     
     r.set_access_credentials(**access_information)
 
-    new_access_information = {}
-    update_praw_key = False
-
     # SAVE OR UPDATE THE ACCESS TOKEN IF NECESSARY
     if(pk is None):
       pk = PrawKey(id=db_praw_id,
@@ -70,12 +107,26 @@ class Connect:
                    authorized_username = r.user.json_dict['name'],
                    authorized_user_id = r.user.json_dict['id'])
       self.db_session.add(pk)
+      self.db_session.commit()
+    else:
+      self.save_credentials(db_praw_id, r, (access_information['access_token'], access_information['refresh_token']), pk)
 
-    elif(access_information['access_token'] != r.access_token or
-       access_information['refresh_token'] != r.refresh_token):
-       pk.access_token = r.access_token
-       pk.refresh_token = r.refresh_token
-       pk.scope = json.dumps(list(r._authentication))
-      
-    self.db_session.commit()
+    self.clients[db_praw_id] = CachedClient(r, time.time() + ACCESS_TOKEN_LIFETIME, self.credentials(r))
+    jobmetrics.record_connect(time.perf_counter() - start, cached=False)
     return r
+
+  def credentials(self, r):
+    return (r.access_token, r.refresh_token)
+
+  # only write to praw_keys when the tokens have changed
+  def save_credentials(self, db_praw_id, r, saved_credentials, pk=None):
+    if self.credentials(r) == saved_credentials:
+      return
+    if pk is None:
+      pk = self.db_session.query(PrawKey).filter_by(id=db_praw_id).first()
+      if pk is None:
+        return
+    pk.access_token = r.access_token
+    pk.refresh_token = r.refresh_token
+    pk.scope = json.dumps(list(r._authentication))
+    self.db_session.commit()
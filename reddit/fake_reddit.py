@@ -0,0 +1,520 @@
+"""An offline stand-in for praw.Reddit, for load testing the pipeline.
+
+FakeReddit implements the part of the praw 3.5 API surface that CivilServant
+uses (get_subreddit().get_new/get_top/get_hot/get_controversial, get_comments,
+get_mod_log, get_info, get_submission, send_message, plus add_comment,
+distinguish and remove on the returned things). Posts, comments and moderation
+actions are generated for a configurable set of synthetic subreddits at a
+configurable rate per minute, and every call can be delayed by a configurable
+latency to approximate the round trip to reddit.
+
+Generated content is a pure function of (seed, subreddit, stream, index), and
+the index is derived from the wall clock, so separate processes using the same
+config (for example rq workhorses) see the same listings and produce the same
+duplicates a real deployment would. Things created through the API (comments
+added with add_comment, removals) only live in the FakeReddit instance.
+
+Set the CS_FAKE_REDDIT environment variable to the path of a JSON config to
+have reddit.connection.Connect hand out FakeReddit objects instead of
+connecting to reddit. See config/fake_reddit.json.example.
+"""
+import collections
+import math
+import random
+import time
+
+import simplejson as json
+
+from utils import jobmetrics
+
+DEFAULT_EPOCH = 1500000000
+DEFAULT_HISTORY = 1000
+
+POST_ID_BASE = 36 ** 5
+COMMENT_ID_BASE = 36 ** 6
+MODACTION_ID_BASE = 36 ** 6
+ADDED_ID_BASE = 36 ** 8
+
+MOD_ACTIONS = ["removecomment", "removelink", "approvecomment", "approvelink",
+               "banuser", "unbanuser", "distinguish", "sticky", "editflair"]
+BAN_DETAILS = ["permanent", "1 days", "3 days", "7 days", "30 days"]
+
+SUBREDDIT_DEFAULTS = {
+    "posts_per_minute": 1.0,
+    "comments_per_minute": 20.0,
+    "mod_actions_per_minute": 2.0,
+    "users": 10000,
+    "moderators": 10,
+    "active_posts": 25,
+    "reply_rate": 0.5,
+}
+
+
+def to_base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        result = digits[remainder] + result
+        if number == 0:
+            return result
+
+
+class FakeRedditException(Exception):
+    pass
+
+
+class FakeThing(dict):
+    """A reddit thing. Behaves like the dicts in tests/fixture_data and like
+    a praw object with a json_dict, so controllers can treat it either way."""
+
+    def __init__(self, reddit, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__dict__["reddit_session"] = reddit
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    @property
+    def json_dict(self):
+        return self
+
+    @property
+    def fullname(self):
+        return self["name"]
+
+
+class FakeComment(FakeThing):
+    @property
+    def replies(self):
+        return []
+
+    def remove(self, spam=False):
+        self.reddit_session._call("remove")
+        self.reddit_session.removed[self["id"]] = "spam" if spam else "remove"
+        self["banned_by"] = self.reddit_session.username
+        return {"errors": []}
+
+    def distinguish(self, as_made_by="mod", sticky=False):
+        self.reddit_session._call("distinguish")
+        self["distinguished"] = "moderator"
+        self["stickied"] = sticky
+        return {"errors": [], "data": {"things": [{"id": self["id"]}]}}
+
+
+class FakeSubmission(FakeThing):
+    @property
+    def comments(self):
+        return self.reddit_session._submission_comments(self)
+
+    def replace_more_comments(self, limit=32, threshold=1):
+        return []
+
+    def add_comment(self, text):
+        return self.reddit_session._add_comment(self, text)
+
+
+class FakeSubreddit(object):
+    def __init__(self, reddit, name, index, settings):
+        self.reddit_session = reddit
+        self.display_name = name
+        self.index = index
+        self.settings = dict(SUBREDDIT_DEFAULTS, **settings)
+        self.id = self.settings.get("id") or to_base36(36 ** 4 + index * 7919)
+        self.fullname = "t5_" + self.id
+
+    def __repr__(self):
+        return "<FakeSubreddit %s>" % self.display_name
+
+    def _listing(self, method, sort_key, limit):
+        self.reddit_session._call(method)
+        posts = self.reddit_session._posts(self)
+        if sort_key:
+            posts = sorted(posts, key=sort_key, reverse=True)
+        return iter(posts[:limit])
+
+    def get_new(self, limit=25, *args, **kwargs):
+        return self._listing("get_new", None, limit)
+
+    def get_top(self, limit=25, *args, **kwargs):
+        return self._listing("get_top", lambda p: p["score"], limit)
+
+    def get_hot(self, limit=25, *args, **kwargs):
+        return self._listing("get_hot", lambda p: (
+            math.log10(max(abs(p["score"]), 1)) + p["created_utc"] / 45000.0), limit)
+
+    def get_controversial(self, limit=25, *args, **kwargs):
+        return self._listing("get_controversial", lambda p: (
+            p["num_comments"] / float(abs(p["score"]) + 1)), limit)
+
+
+class FakeAllSubreddit(FakeSubreddit):
+    """r/all: the listings of every configured subreddit merged together."""
+
+    def __init__(self, reddit):
+        super().__init__(reddit, "all", -1, {})
+        self.id = "all"
+        self.fullname = "t5_all"
+
+    def _listing(self, method, sort_key, limit):
+        self.reddit_session._call(method)
+        posts = []
+        for subreddit in self.reddit_session.subreddits.values():
+            posts.extend(self.reddit_session._posts(subreddit))
+        posts.sort(key=sort_key or (lambda p: p["created_utc"]), reverse=True)
+        return iter(posts[:limit])
+
+
+class FakeReddit(object):
+    """Configuration keys (all optional except subreddits):
+
+        seed          -- changes every generated thing
+        epoch         -- unix time that stream indexes are counted from
+        history       -- how many items a listing can page back through
+        latency       -- seconds added to every API call
+        latency_jitter -- uniform random seconds added on top of latency
+        username      -- the account the fake reddit is authorized as
+        subreddits    -- {name: {id, posts_per_minute, comments_per_minute,
+                          mod_actions_per_minute, users, moderators,
+                          active_posts, reply_rate}}
+    """
+
+    _shared = {}
+
+    def __init__(self, config=None, clock=time.time, sleep=time.sleep):
+        config = config or {}
+        self.config = config
+        self.seed = config.get("seed", 0)
+        self.epoch = config.get("epoch", DEFAULT_EPOCH)
+        self.history = config.get("history", DEFAULT_HISTORY)
+        self.latency = config.get("latency", 0.0)
+        self.latency_jitter = config.get("latency_jitter", 0.0)
+        self.username = config.get("username", "CivilServantBot")
+        self.clock = clock
+        self.sleep = sleep
+        self.jitter_random = random.Random(self.seed)
+
+        self.subreddits = collections.OrderedDict()
+        for index, name in enumerate(sorted(config.get("subreddits", {}).keys())):
+            self.subreddits[name.lower()] = FakeSubreddit(
+                self, name, index, config["subreddits"][name])
+
+        self.user = FakeThing(self, {"name": self.username, "id": to_base36(36 ** 5)})
+        self.access_token = "fake-access-token"
+        self.refresh_token = "fake-refresh-token"
+        self._authentication = {"identity", "read", "modlog", "modposts",
+                                "privatemessages", "submit"}
+
+        self.call_counts = collections.Counter()
+        self.call_seconds = collections.Counter()
+        self.added_comments = collections.OrderedDict()
+        self.removed = {}
+        self.sent_messages = []
+
+    @classmethod
+    def from_config(cls, path):
+        with open(path, "r") as f:
+            return cls(json.loads(f.read()))
+
+    @classmethod
+    def shared(cls, path):
+        """One FakeReddit per config file per process, so that comments
+        added in one job are visible to the next."""
+        if path not in cls._shared:
+            cls._shared[path] = cls.from_config(path)
+        return cls._shared[path]
+
+    ## PRAW API SURFACE
+
+    def set_access_credentials(self, scope, access_token, refresh_token=None,
+                               update_user=True):
+        self._call("set_access_credentials")
+        self._authentication = set(scope)
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+
+    def get_subreddit(self, subreddit_name, *args, **kwargs):
+        self._call("get_subreddit")
+        return self._subreddit(subreddit_name)
+
+    def get_comments(self, subreddit, gilded_only=False, limit=25, params=None, *args, **kwargs):
+        self._call("get_comments")
+        subreddit = self._subreddit(subreddit)
+        after = (params or {}).get("after")
+        end = self._stream_count(subreddit, "comments")
+        if after:
+            end = min(end, self._stream_index(subreddit, after[len("t1_"):], COMMENT_ID_BASE))
+        start = max(end - limit, self._stream_count(subreddit, "comments") - self.history, 0)
+        return iter([self._comment(subreddit, k) for k in range(end - 1, start - 1, -1)])
+
+    def get_mod_log(self, subreddit, mod=None, action=None, limit=25, params=None, *args, **kwargs):
+        self._call("get_mod_log")
+        subreddit = self._subreddit(subreddit)
+        after = (params or {}).get("after")
+        end = self._stream_count(subreddit, "mod_actions")
+        if after:
+            end = min(end, self._stream_index(subreddit, after[len("ModAction_"):], MODACTION_ID_BASE))
+        start = max(end - limit, self._stream_count(subreddit, "mod_actions") - self.history, 0)
+        return iter([self._mod_action(subreddit, k) for k in range(end - 1, start - 1, -1)])
+
+    def get_info(self, url=None, thing_id=None, *args, **kwargs):
+        self._call("get_info")
+        if isinstance(thing_id, str):
+            return self._thing(thing_id)
+        things = [self._thing(t) for t in (thing_id or [])]
+        return [t for t in things if t is not None]
+
+    def get_submission(self, url=None, submission_id=None, *args, **kwargs):
+        self._call("get_submission")
+        return self._thing("t3_" + submission_id)
+
+    def send_message(self, recipient, subject, message, from_sr=None,
+                     captcha=None, **kwargs):
+        self._call("send_message")
+        self.sent_messages.append({"recipient": str(recipient), "subject": subject,
+                                   "message": message, "sent_at": self.clock()})
+        return {"errors": []}
+
+    def older_things(self, subreddit_name, stream, count):
+        """The count things of a stream ("posts", "comments" or
+        "mod_actions") that are just too old to be returned by a listing,
+        newest first. Used to seed a database with history."""
+        subreddit = self._subreddit(subreddit_name)
+        make_thing = {"posts": self._post, "comments": self._comment,
+                      "mod_actions": self._mod_action}[stream]
+        end = max(self._stream_count(subreddit, stream) - self.history, 0)
+        return [make_thing(subreddit, k) for k in range(end - 1, max(end - count, 0) - 1, -1)]
+
+    ## INSTRUMENTATION
+
+    def _call(self, method):
+        delay = self.latency
+        if self.latency_jitter:
+            delay += self.jitter_random.uniform(0, self.latency_jitter)
+        if delay > 0:
+            self.sleep(delay)
+        self.call_counts[method] += 1
+        self.call_seconds[method] += delay
+        jobmetrics.record_reddit_call(delay)
+
+    def stats(self):
+        return {"calls": dict(self.call_counts),
+                "seconds": dict(self.call_seconds),
+                "added_comments": len(self.added_comments),
+                "removed": len(self.removed),
+                "sent_messages": len(self.sent_messages)}
+
+    ## SYNTHETIC STREAMS
+
+    def _subreddit(self, subreddit):
+        name = getattr(subreddit, "display_name", subreddit).lower()
+        if name == "all":
+            return FakeAllSubreddit(self)
+        if name not in self.subreddits:
+            raise FakeRedditException("subreddit not configured: " + name)
+        return self.subreddits[name]
+
+    def _random(self, subreddit, stream, k):
+        return random.Random("%s:%s:%s:%d" % (self.seed, subreddit.display_name, stream, k))
+
+    def _rate(self, subreddit, stream):
+        return subreddit.settings[stream + "_per_minute"]
+
+    def _stream_count(self, subreddit, stream):
+        rate = self._rate(subreddit, stream)
+        if rate <= 0:
+            return 0
+        return int((self.clock() - self.epoch) * rate / 60.0) + 1
+
+    def _stream_time(self, subreddit, stream, k):
+        return self.epoch + k * 60.0 / self._rate(subreddit, stream)
+
+    def _thing_id(self, subreddit, k, base):
+        return to_base36(base + k * len(self.subreddits) + subreddit.index)
+
+    def _stream_index(self, subreddit, thing_id, base):
+        n = int(thing_id, 36) - base
+        return n // len(self.subreddits)
+
+    def _decode(self, thing_id, base):
+        n = int(thing_id, 36) - base
+        if n < 0:
+            return None, None
+        subreddit = list(self.subreddits.values())[n % len(self.subreddits)]
+        return subreddit, n // len(self.subreddits)
+
+    def _author(self, subreddit, rand):
+        return "fake_user_%d" % rand.randrange(subreddit.settings["users"])
+
+    def _moderator(self, subreddit, rand):
+        return "fake_mod_%d" % rand.randrange(subreddit.settings["moderators"])
+
+    def _posts(self, subreddit):
+        end = self._stream_count(subreddit, "posts")
+        return [self._post(subreddit, k) for k in range(end - 1, max(end - self.history, 0) - 1, -1)]
+
+    def _post(self, subreddit, k):
+        rand = self._random(subreddit, "posts", k)
+        post_id = self._thing_id(subreddit, k, POST_ID_BASE)
+        created = self._stream_time(subreddit, "posts", k)
+        age_minutes = max(self.clock() - created, 0) / 60.0
+        popularity = rand.expovariate(0.2)
+        score = int(popularity * math.sqrt(age_minutes))
+        is_self = rand.random() < 0.5
+        permalink = "/r/{0}/comments/{1}/fake_post_{1}/".format(subreddit.display_name, post_id)
+        return FakeSubmission(self, {
+            "id": post_id,
+            "name": "t3_" + post_id,
+            "title": "Fake post %s" % post_id,
+            "author": self._author(subreddit, rand),
+            "author_flair_text": None,
+            "subreddit": subreddit.display_name,
+            "subreddit_id": subreddit.fullname,
+            "created": created,
+            "created_utc": created,
+            "score": score,
+            "ups": score,
+            "downs": 0,
+            "num_comments": int(score * rand.uniform(0.1, 0.5)),
+            "num_reports": 0,
+            "user_reports": [],
+            "mod_reports": [],
+            "link_flair_css_class": rand.choice([None, "news", "question"]),
+            "domain": "self." + subreddit.display_name if is_self else "example.com",
+            "is_self": is_self,
+            "selftext": "Fake self text" if is_self else "",
+            "url": "https://www.reddit.com" + permalink if is_self else "https://example.com/" + post_id,
+            "permalink": permalink,
+            "locked": False,
+            "stickied": False,
+            "over_18": False,
+            "banned_by": None,
+        })
+
+    def _comment_post_index(self, subreddit, k):
+        rand = self._random(subreddit, "comments", k)
+        created = self._stream_time(subreddit, "comments", k)
+        newest_post = int((created - self.epoch) * self._rate(subreddit, "posts") / 60.0)
+        return max(newest_post - rand.randrange(subreddit.settings["active_posts"]), 0)
+
+    def _comment(self, subreddit, k):
+        rand = self._random(subreddit, "comments", k)
+        comment_id = self._thing_id(subreddit, k, COMMENT_ID_BASE)
+        created = self._stream_time(subreddit, "comments", k)
+        post_index = self._comment_post_index(subreddit, k)
+        post_id = self._thing_id(subreddit, post_index, POST_ID_BASE)
+
+        parent_id = "t3_" + post_id
+        if rand.random() < subreddit.settings["reply_rate"]:
+            added = [c for c in self.added_comments.values()
+                     if c["link_id"] == parent_id and c["created_utc"] < created]
+            if added and rand.random() < 0.5:
+                parent_id = rand.choice(added)["name"]
+            else:
+                for previous in range(k - 1, max(k - 50, 0) - 1, -1):
+                    if self._comment_post_index(subreddit, previous) == post_index:
+                        parent_id = "t1_" + self._thing_id(subreddit, previous, COMMENT_ID_BASE)
+                        break
+
+        return FakeComment(self, {
+            "id": comment_id,
+            "name": "t1_" + comment_id,
+            "link_id": "t3_" + post_id,
+            "parent_id": parent_id,
+            "author": self._author(subreddit, rand),
+            "body": "Fake comment %s" % comment_id,
+            "subreddit": subreddit.display_name,
+            "subreddit_id": subreddit.fullname,
+            "created": created,
+            "created_utc": created,
+            "score": rand.randint(-5, 50),
+            "ups": 1,
+            "downs": 0,
+            "distinguished": None,
+            "stickied": False,
+            "banned_by": self.username if comment_id in self.removed else None,
+        })
+
+    def _mod_action(self, subreddit, k):
+        rand = self._random(subreddit, "mod_actions", k)
+        action_id = self._thing_id(subreddit, k, MODACTION_ID_BASE)
+        created = self._stream_time(subreddit, "mod_actions", k)
+        action = rand.choice(MOD_ACTIONS)
+        post_index = max(int((created - self.epoch) * self._rate(subreddit, "posts") / 60.0)
+                         - rand.randrange(subreddit.settings["active_posts"]), 0)
+        post_id = self._thing_id(subreddit, post_index, POST_ID_BASE)
+        permalink = "/r/{0}/comments/{1}/fake_post_{1}/".format(subreddit.display_name, post_id)
+        target_fullname = "t3_" + post_id
+        if action.endswith("comment"):
+            comment_index = max(self._stream_count(subreddit, "comments") - 1 - rand.randrange(self.history), 0)
+            comment_id = self._thing_id(subreddit, comment_index, COMMENT_ID_BASE)
+            target_fullname = "t1_" + comment_id
+            permalink += comment_id + "/"
+        details = rand.choice(BAN_DETAILS) if action == "banuser" else None
+        return FakeThing(self, {
+            "id": "ModAction_" + action_id,
+            "created_utc": created,
+            "sr_id36": subreddit.id,
+            "subreddit": subreddit.display_name,
+            "mod": self._moderator(subreddit, rand),
+            "mod_id36": to_base36(36 ** 3 + rand.randrange(subreddit.settings["moderators"])),
+            "action": action,
+            "target_author": self._author(subreddit, rand),
+            "target_fullname": target_fullname if action not in ("banuser", "unbanuser") else None,
+            "target_permalink": permalink if action not in ("banuser", "unbanuser") else None,
+            "target_title": "Fake post %s" % post_id,
+            "target_body": None,
+            "details": details,
+            "description": "fake mod action",
+        })
+
+    def _thing(self, fullname):
+        prefix, thing_id = fullname.split("_", 1)
+        if prefix == "t1":
+            if thing_id in self.added_comments:
+                return self.added_comments[thing_id]
+            subreddit, k = self._decode(thing_id, COMMENT_ID_BASE)
+            return self._comment(subreddit, k) if subreddit else None
+        if prefix == "t3":
+            subreddit, k = self._decode(thing_id, POST_ID_BASE)
+            return self._post(subreddit, k) if subreddit else None
+        raise FakeRedditException("unsupported thing type: " + fullname)
+
+    def _submission_comments(self, submission):
+        subreddit = self._subreddit(submission["subreddit"])
+        end = self._stream_count(subreddit, "comments")
+        comments = [self._comment(subreddit, k) for k in range(max(end - self.history, 0), end)]
+        comments = [c for c in comments if c["link_id"] == submission["name"]]
+        comments.extend(c for c in self.added_comments.values() if c["link_id"] == submission["name"])
+        return comments
+
+    def _add_comment(self, submission, text):
+        self._call("add_comment")
+        comment_id = to_base36(ADDED_ID_BASE + len(self.added_comments))
+        created = self.clock()
+        comment = FakeComment(self, {
+            "id": comment_id,
+            "name": "t1_" + comment_id,
+            "link_id": submission["name"],
+            "parent_id": submission["name"],
+            "author": self.username,
+            "body": text,
+            "subreddit": submission["subreddit"],
+            "subreddit_id": submission["subreddit_id"],
+            "created": created,
+            "created_utc": created,
+            "score": 1,
+            "ups": 1,
+            "downs": 0,
+            "distinguished": None,
+            "stickied": False,
+            "banned_by": None,
+        })
+        self.added_comments[comment_id] = comment
+        return comment
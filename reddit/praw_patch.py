@@ -7,12 +7,22 @@ import praw
 import subprocess
 import tempfile
 
-from utils.common import BASE_DIR
+import simplejson as json
+
+from utils.common import BASE_DIR, LOGS_DIR
 
 PRAW_LIB_DIR = str(Path(praw.__file__).parent)
 PRAW_DIFFS_DIR = str(Path(BASE_DIR, "reddit", "praw_patches"))
 Path(PRAW_DIFFS_DIR).mkdir(parents=True, exist_ok=True)
 
+# Verifying the patch reads and hashes the patched praw sources. The result is
+# saved here with the mtime and size of every file involved, and is reused
+# until one of them changes.
+STATE_PATH = str(Path(LOGS_DIR, "praw_patch_state.json"))
+
+# versions verified by this process; the praw modules it imported can't change
+_verified = set()
+
 class PrawPatch:
     def __init__(self, version=praw.__version__):
         self.version = version
@@ -68,11 +78,55 @@ class PrawPatch:
     
     @property
     def required(self):
-        return bool(int(os.environ.get("CS_PRAW_DIFFS_REQUIRED", True)))
+        return is_required()
 
 class PrawPatchException(Exception):
     pass
 
+def is_required():
+    return bool(int(os.environ.get("CS_PRAW_DIFFS_REQUIRED", True)))
+
+def _fingerprint(version):
+    files = []
+    for diff_path in sorted(Path(PRAW_DIFFS_DIR, version).rglob("*.diff")):
+        md5_path = diff_path.with_name(diff_path.stem + ".md5")
+        for path in [diff_path, md5_path, Path(PRAW_LIB_DIR, diff_path.stem)]:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                return None
+            files.append([str(path), stat.st_mtime_ns, stat.st_size])
+    return {"version": version, "files": files}
+
+def _read_state(state_path):
+    try:
+        with open(state_path, "r") as f:
+            return json.loads(f.read())
+    except (IOError, ValueError):
+        return None
+
+def _write_state(state_path, fingerprint):
+    tmp_path = "%s.%d.tmp" % (state_path, os.getpid())
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(fingerprint))
+    os.replace(tmp_path, state_path)
+
+def ensure_applied(version=praw.__version__, state_path=STATE_PATH):
+    """PrawPatch(version).ensure_applied(), skipping the hashing when this
+    process or the last verification in state_path has seen the same files."""
+    if version in _verified:
+        return
+    fingerprint = _fingerprint(version)
+    if fingerprint is not None and fingerprint["files"] and _read_state(state_path) == fingerprint:
+        _verified.add(version)
+        return
+
+    PrawPatch(version).ensure_applied()
+    # fingerprint again, in case the files changed while we were hashing them
+    if fingerprint is not None and fingerprint == _fingerprint(version):
+        _write_state(state_path, fingerprint)
+    _verified.add(version)
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--version", required=False, type=str,
@@ -3,7 +3,9 @@ from rq_scheduler import Scheduler
 from datetime import datetime
 import app.controller
 import os, argparse, sys
+import yaml
 from utils.common import PageType
+from utils import sharding
 
 #documentation at
 #https://github.com/ui/rq-scheduler
@@ -32,8 +34,18 @@ def main():
                         required = False,
                         action = 'store_true',
                         help="Run the performance profiler and save the results in the logs/profiles directory")
+    parser.add_argument("-S", "--sample",
+                        required = False,
+                        action = 'store_true',
+                        help="Run the low-overhead sampling profiler and merge its stacks into daily files in the logs/profiles directory")
+    parser.add_argument("--shards",
+                        type = int,
+                        required = False,
+                        help="Route the job to the queue of the experiment subreddit's shard (default: the CS_QUEUE_SHARDS environment variable, or one unsharded queue)")
 
     args = parser.parse_args()
+    if args.sample:
+        args.profile = "sample"
 
     # if the user specified the environment, set it here
     if args.env!=None:
@@ -53,6 +65,11 @@ def main():
         print("File {0} not found. Ignoring schedule command.".format(experiment_file))
         sys.exit(1)
 
+    ## experiment jobs run on the queue of their subreddit's shard, see utils/sharding.py
+    with open(experiment_file, "r") as f:
+        experiment_config = (yaml.full_load(f) or {}).get(os.environ['CS_ENV']) or {}
+    job_queue_name = sharding.queue_name(experiment_config.get("subreddit"), args.shards)
+
 
     if(args.job == "sticky_comment_intervene"):
         scheduler.schedule(
@@ -63,7 +80,8 @@ def main():
                 interval=int(args.interval),
                 repeat=None,
                 timeout = timeout_seconds,
-                result_ttl = ttl)
+                result_ttl = ttl,
+                queue_name = job_queue_name)
     elif(args.job == "tidy"):
         scheduler.schedule(
                 scheduled_time=datetime.utcnow(),
@@ -73,7 +91,8 @@ def main():
                 interval=int(args.interval),
                 repeat=None,
                 timeout = timeout_seconds,
-                result_ttl = ttl)
+                result_ttl = ttl,
+                queue_name = job_queue_name)
     elif(args.job == "archive_submissions"):
         scheduler.schedule(
                 scheduled_time=datetime.utcnow(),
@@ -83,7 +102,8 @@ def main():
                 interval=int(args.interval),
                 repeat=None,
                 timeout = timeout_seconds,
-                result_ttl = ttl)
+                result_ttl = ttl,
+                queue_name = job_queue_name)
     elif(args.job == "send_newcomer_messages"):
         scheduler.schedule(
                 scheduled_time=datetime.utcnow(),
@@ -93,7 +113,8 @@ def main():
                 interval=int(args.interval),
                 repeat=None,
                 timeout = timeout_seconds,
-                result_ttl = ttl)
+                result_ttl = ttl,
+                queue_name = job_queue_name)
     # NOTE: experiment is run via callbacks from mod archiving.
     # elif(args.job == "conduct_banuser_experiment"):
     #     scheduler.schedule(
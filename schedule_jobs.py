@@ -4,6 +4,7 @@ from datetime import datetime
 import app.controller
 import os,argparse
 from utils.common import PageType
+from utils import sharding
 
 #documentation at
 #https://github.com/ui/rq-scheduler
@@ -13,11 +14,11 @@ def main():
     parser = argparse.ArgumentParser()
 
     parser.add_argument("sub",
-                        help="The subreddit to query (or all for the frontpage)")
+                        help="The subreddit to query (or all for the frontpage). Several comma-separated subreddits are fetched concurrently by one job")
 
     parser.add_argument("pagetype",
-                        choices=["new", "top", "contr", "hot", "comments", "modactions"],
-                        help="For front pages, what page to query")
+                        choices=["new", "top", "contr", "hot", "comments", "modactions", "retention"],
+                        help="For front pages, what page to query. For retention, sub is the table to archive (or all)")
     parser.add_argument("interval",
                         default = 120, # default 2 minutes
                         help="Interval between tasks in seconds (default 2 minutes)")
@@ -30,6 +31,23 @@ def main():
                         action = 'store_true',
                         help="Run the performance profiler and save the results in the logs/profiles directory")
 
+    parser.add_argument("--min-interval",
+                        type = int,
+                        required = False,
+                        help="For comments and modactions, adapt the interval to the subreddit's activity, polling no more often than this (seconds)")
+    parser.add_argument("--max-interval",
+                        type = int,
+                        required = False,
+                        help="With --min-interval, poll at least this often (seconds)")
+    parser.add_argument("--target-items",
+                        type = int,
+                        default = 100,
+                        help="With --min-interval, the number of new comments or mod actions to aim for in each poll (default 100)")
+    parser.add_argument("--shards",
+                        type = int,
+                        required = False,
+                        help="Route subreddit jobs to one of this many queues (default: the CS_QUEUE_SHARDS environment variable, or one unsharded queue)")
+
     args = parser.parse_args()
 
     # if the user specified the environment, set it here
@@ -42,13 +60,35 @@ def main():
 
     page_type = args.pagetype.lower()
 
+    ## adaptive intervals start at the given interval and are adjusted
+    ## after each run by utils.scheduling
+    meta = None
+    if(args.min_interval is not None):
+        if(page_type not in ["comments", "modactions"]):
+            parser.error("--min-interval is only supported for comments and modactions")
+        max_interval = args.max_interval or max(int(args.interval), args.min_interval)
+        meta = {"adaptive": {
+            "min_interval": args.min_interval,
+            "max_interval": max_interval,
+            "target_items": args.target_items}}
+
     timeout_seconds = 172800 ## two days in seconds
-    if(timeout_seconds <= int(args.interval) + 3600):
-        timeout_seconds = int(args.interval) + 3600
+    if(timeout_seconds <= max(int(args.interval), args.max_interval or 0) + 3600):
+        timeout_seconds = max(int(args.interval), args.max_interval or 0) + 3600
     ttl = timeout_seconds + 180
 
 
-    if(args.sub =="all"):
+    if(page_type == "retention"):
+        scheduler.schedule(
+                scheduled_time=datetime.utcnow(),
+                func=app.controller.archive_cold_rows,
+                args=[None if args.sub == "all" else args.sub],
+                kwargs={'_profile': args.profile},
+                interval=int(args.interval),
+                repeat=None,
+                timeout = timeout_seconds,
+                result_ttl = ttl)
+    elif(args.sub =="all"):
         page_type = getattr(PageType, args.pagetype.upper())
         scheduler.schedule(
                 scheduled_time=datetime.utcnow(),
@@ -59,6 +99,28 @@ def main():
                 repeat=None,
                 timeout = timeout_seconds,
                 result_ttl = ttl)
+    elif("," in args.sub):
+        ## one job for several subreddits, see app.controller.fetch_concurrently.
+        ## with sharded queues, one job for the subreddits of each shard
+        subs = [sub.strip() for sub in args.sub.split(",") if sub.strip()]
+        for queue_name, queue_subs in sharding.group_by_queue(subs, args.shards).items():
+            if(page_type == "comments"):
+                func, func_args = app.controller.fetch_last_thousand_comments_for, [queue_subs]
+            elif(page_type == "modactions"):
+                func, func_args = app.controller.fetch_mod_action_histories, [queue_subs]
+            else:
+                func, func_args = app.controller.fetch_subreddit_fronts, [queue_subs, getattr(PageType, args.pagetype.upper())]
+            scheduler.schedule(
+                    scheduled_time=datetime.utcnow(),
+                    func=func,
+                    args=func_args,
+                    kwargs={'_profile': args.profile},
+                    interval=int(args.interval),
+                    repeat=None,
+                    timeout = timeout_seconds,
+                    result_ttl = ttl,
+                    queue_name = queue_name,
+                    meta = meta)
     else:
         if(page_type == "comments"):
             scheduler.schedule(
@@ -69,7 +131,9 @@ def main():
                     interval=int(args.interval),
                     repeat=None,
                     timeout = timeout_seconds,
-                    result_ttl = ttl)
+                    result_ttl = ttl,
+                    queue_name = sharding.queue_name(args.sub, args.shards),
+                    meta = meta)
         elif(page_type == "modactions"):
             scheduler.schedule(
                     scheduled_time=datetime.utcnow(),
@@ -79,7 +143,9 @@ def main():
                     interval=int(args.interval),
                     repeat=None,
                     timeout = timeout_seconds,
-                    result_ttl = ttl)
+                    result_ttl = ttl,
+                    queue_name = sharding.queue_name(args.sub, args.shards),
+                    meta = meta)
         else:
             page_type = getattr(PageType, args.pagetype.upper())
             scheduler.schedule(
@@ -90,7 +156,8 @@ def main():
                     interval=int(args.interval),
                     repeat=None,
                     timeout = timeout_seconds,
-                    result_ttl = ttl)
+                    result_ttl = ttl,
+                    queue_name = sharding.queue_name(args.sub, args.shards))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,128 @@
+import os
+import asyncio
+import pytest
+
+os.environ['CS_ENV'] = "test"
+
+from reddit.async_client import AsyncReddit, AsyncRedditError, RateLimiter, RedditThing, gather
+from utils.common import PageType
+
+class FakeResponse:
+    def __init__(self, status, body=None, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def json(self):
+        return self.body
+
+class FakeSession:
+    """Answers GETs with the queued responses, recording each request."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, params=None, headers=None):
+        self.requests.append((url, dict(params or {}), dict(headers or {})))
+        return self.responses.pop(0)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def listing(ids, after=None):
+    return FakeResponse(200, {"kind": "Listing", "data": {
+        "after": after,
+        "children": [{"kind": "t1", "data": {"id": i, "name": "t1_" + i}} for i in ids]}})
+
+def client(responses, refresh=None):
+    clock = FakeClock()
+    session = FakeSession(responses)
+    r = AsyncReddit("token-1", rate_limiter=RateLimiter(60, clock=clock, sleep=clock.sleep),
+                    refresh=refresh, session=session)
+    return r, session, clock
+
+def test_get_listing_pages_until_limit():
+    r, session, clock = client([
+        listing(["a%d" % i for i in range(100)], after="t1_a99"),
+        listing(["b%d" % i for i in range(100)], after="t1_b99"),
+        listing(["c%d" % i for i in range(50)], after="t1_c49")])
+    comments = asyncio.run(r.get_comments("science", limit=250))
+
+    assert len(comments) == 250
+    assert type(comments[0]) is RedditThing
+    assert comments[0].id == "a0"
+    assert comments[0].json_dict["name"] == "t1_a0"
+    assert comments[-1].fullname == "t1_c49"
+
+    assert [url for url, params, headers in session.requests] == ["https://oauth.reddit.com/r/science/comments"] * 3
+    assert [params for url, params, headers in session.requests] == [
+        {"limit": 100}, {"limit": 100, "after": "t1_a99"}, {"limit": 50, "after": "t1_b99"}]
+    assert session.requests[0][2]["Authorization"] == "bearer token-1"
+    # one request a second
+    assert clock.sleeps == [1.0, 1.0]
+
+def test_get_listing_stops_at_end():
+    r, session, clock = client([listing(["a", "b"], after=None)])
+    posts = asyncio.run(r.get_subreddit_page("science", PageType.NEW, limit=300))
+    assert [p.id for p in posts] == ["a", "b"]
+    assert session.requests[0][0] == "https://oauth.reddit.com/r/science/new"
+
+def test_get_info_in_chunks():
+    ids = ["t3_%d" % i for i in range(150)]
+    r, session, clock = client([listing(ids[:100]), listing(ids[100:])])
+    things = asyncio.run(r.get_info(ids))
+    assert len(things) == 150
+    assert session.requests[0][1] == {"id": ",".join(ids[:100])}
+    assert session.requests[1][1] == {"id": ",".join(ids[100:])}
+
+def test_rejected_token_is_refreshed_once():
+    refreshes = []
+    def refresh():
+        refreshes.append(True)
+        return "token-2"
+    r, session, clock = client([FakeResponse(401), listing(["a"])], refresh=refresh)
+    comments = asyncio.run(r.get_comments("science", limit=1))
+    assert [c.id for c in comments] == ["a"]
+    assert len(refreshes) == 1
+    assert session.requests[1][2]["Authorization"] == "bearer token-2"
+
+    r, session, clock = client([FakeResponse(401), FakeResponse(401)], refresh=refresh)
+    with pytest.raises(AsyncRedditError):
+        asyncio.run(r.get_comments("science", limit=1))
+
+def test_rate_limit_headers_pause_requests():
+    r, session, clock = client([
+        FakeResponse(429, headers={"x-ratelimit-remaining": "0", "x-ratelimit-reset": "30"}),
+        listing(["a"])])
+    start = clock.now
+    comments = asyncio.run(r.get_mod_log("science", limit=1))
+    assert [c.id for c in comments] == ["a"]
+    assert session.requests[0][0] == "https://oauth.reddit.com/r/science/about/log"
+    assert clock.now - start == 30
+
+def test_gather_returns_exceptions_in_order():
+    async def ok(value):
+        return value
+    async def fail():
+        raise AsyncRedditError("nope")
+    async def run():
+        return await gather([ok(1), fail(), ok(3)], limit=2)
+    results = asyncio.run(run())
+    assert results[0] == 1
+    assert isinstance(results[1], AsyncRedditError)
+    assert results[2] == 3
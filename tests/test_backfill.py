@@ -0,0 +1,121 @@
+import os
+import datetime
+import pytest
+from mock import Mock
+
+ENV = os.environ['CS_ENV'] = "test"
+
+from sqlalchemy import create_engine, Column, Integer, DateTime
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from app.models import BackfillChunk
+from utils import querystats
+from utils.backfill import Backfill, split_ranges, encode, decode
+
+Base = declarative_base()
+
+class Thing(Base):
+    __tablename__ = "things"
+    id            = Column(Integer, primary_key = True)
+    created_at    = Column(DateTime)
+    value         = Column(Integer)
+    pid           = Column(Integer)
+
+START = datetime.datetime(2026, 10, 19)
+
+@pytest.fixture
+def new_session(tmp_path):
+    # a file rather than :memory:, so that forked workers see the same rows
+    engine = create_engine("sqlite:///{0}".format(tmp_path / "backfill.db"))
+    querystats.instrument(engine)
+    Base.metadata.create_all(engine)
+    BackfillChunk.__table__.create(engine)
+    engine.dispose()
+    def new_session():
+        return sessionmaker(bind=create_engine("sqlite:///{0}".format(tmp_path / "backfill.db")))()
+    db_session = new_session()
+    db_session.add_all([Thing(id=i, created_at=START + datetime.timedelta(hours=i // 2))
+                        for i in range(1, 11)])
+    db_session.commit()
+    return new_session
+
+def double_id(db_session, things):
+    for thing in things:
+        thing.value = thing.id * 2
+        thing.pid = os.getpid()
+
+def backfill(new_session, process=double_id, **kwargs):
+    kwargs.setdefault("workers", 0)
+    return Backfill("double_id", Thing, process, chunk_size=3, new_session=new_session, **kwargs)
+
+def test_split_ranges(new_session):
+    db_session = new_session()
+    assert split_ranges(db_session, Thing.__table__.c.id, 3) == [(1, 4), (4, 7), (7, 10), (10, None)]
+    # two things an hour, and the things of an hour stay together
+    ranges = split_ranges(db_session, Thing.__table__.c.created_at, 3)
+    assert ranges == [(START, START + datetime.timedelta(hours=2)),
+                      (START + datetime.timedelta(hours=2), START + datetime.timedelta(hours=4)),
+                      (START + datetime.timedelta(hours=4), None)]
+    assert split_ranges(db_session, BackfillChunk.__table__.c.id, 3) == []
+
+def test_encode_and_decode():
+    column = Thing.__table__.c.created_at
+    assert decode(column, encode(START)) == START
+    assert decode(Thing.__table__.c.id, encode(12)) == 12
+    assert decode(column, None) is None
+
+def test_failed_chunks_are_retried(new_session):
+    def fail_on_five(db_session, things):
+        double_id(db_session, things)
+        if any(thing.id == 5 for thing in things):
+            raise ValueError("five")
+
+    assert backfill(new_session, fail_on_five).run(new_session()) == 7
+    db_session = new_session()
+    assert [t.value for t in db_session.query(Thing).order_by(Thing.id)] == [2, 4, 6, None, None, None, 14, 16, 18, 20]
+    assert db_session.query(BackfillChunk).filter(BackfillChunk.completed_at == None).count() == 1
+
+    # the second run only processes the chunk that failed
+    retry = backfill(new_session)
+    assert retry.run(new_session()) == 3
+    assert retry.completed == 1
+    assert [t.value for t in new_session().query(Thing).order_by(Thing.id)] == [i * 2 for i in range(1, 11)]
+    assert backfill(new_session).run(new_session()) == 0
+
+def test_chunks_by_created_at_in_worker_processes(new_session):
+    runner = backfill(new_session, column="created_at", workers=2)
+    assert runner.run(new_session()) == 10
+    assert runner.completed == 3
+    things = new_session().query(Thing).order_by(Thing.id).all()
+    assert [t.value for t in things] == [i * 2 for i in range(1, 11)]
+    assert os.getpid() not in set(t.pid for t in things)
+
+def test_throttles_to_max_qps(new_session):
+    clock = Mock(return_value=100.0)
+    runner = backfill(new_session, max_qps=10, clock=clock, sleep=Mock())
+    runner.chunk_finished(1, 3, 5)
+    runner.chunk_finished(2, 3, 20)
+    # 25 statements take 2.5s at 10 per second, less 1s of burst
+    runner.throttle()
+    runner.sleep.assert_called_once_with(pytest.approx(1.5))
+
+def test_waits_for_the_replica(new_session):
+    runner = backfill(new_session, max_replica_lag=10, replica_config_path="replica.json",
+                      clock=Mock(return_value=100.0), sleep=Mock())
+    runner.replica_lag = Mock(side_effect=[30, None, 2])
+    runner.throttle()
+    assert runner.sleep.call_count == 2
+    # and doesn't ask again until REPLICA_CHECK_INTERVAL has passed
+    runner.throttle()
+    assert runner.replica_lag.call_count == 3
+
+def test_checks_the_alembic_revision(new_session):
+    db_session = new_session()
+    db_session.execute("CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL)")
+    db_session.execute("INSERT INTO alembic_version VALUES ('4f9e0b27c8d5')")
+    db_session.commit()
+    # past d3f81b6a2c49, not yet at a85c3e1d7f62
+    assert backfill(new_session, revision="d3f81b6a2c49").run(new_session()) == 10
+    with pytest.raises(ValueError):
+        backfill(new_session, revision="a85c3e1d7f62").run(new_session())
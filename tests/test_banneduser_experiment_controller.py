@@ -463,6 +463,7 @@ class TestPrivateMethods:
         if want_duration:
             assert meta["ban_duration_days"] == want_duration
         assert meta["ban_type"] == want_type
+        assert user.ban_type == want_type
 
         if want_actual_ban_end_time == "static_now_placeholder":
             want_actual_ban_end_time = static_now
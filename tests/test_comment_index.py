@@ -0,0 +1,105 @@
+import pytest
+import os
+import simplejson as json
+import datetime
+
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+BASE_DIR  = os.path.join(TEST_DIR, "../")
+ENV = os.environ['CS_ENV'] = "test"
+
+import app.comment_index
+from utils.common import DbEngine
+from app.models import Comment, ExperimentWatchedPost, ExperimentComment
+
+db_session = DbEngine(os.path.join(TEST_DIR, "../", "config") + "/{env}.json".format(env=ENV)).new_session()
+
+EXPERIMENT_ID = 1
+
+def clear_all_tables():
+    db_session.query(Comment).delete()
+    db_session.query(ExperimentWatchedPost).delete()
+    db_session.query(ExperimentComment).delete()
+    db_session.commit()
+
+def setup_function(function):
+    clear_all_tables()
+
+def teardown_function(function):
+    clear_all_tables()
+
+def load_comment_tree():
+    with open(os.path.join(TEST_DIR, "fixture_data", "comment_tree_0.json"), "r") as f:
+        return json.loads(f.read())
+
+def archive_comments(comments):
+    db_session.insert_retryable(Comment, [{
+        "id": comment['id'],
+        "subreddit_id": "mouw",
+        "created_utc": datetime.datetime.utcfromtimestamp(comment['created_utc']),
+        "post_id": comment['link_id'].replace("t3_", ""),
+        "user_id": comment['author'],
+        "comment_data": json.dumps(comment)} for comment in comments])
+
+def test_index_comments_on_watched_posts():
+    comments = load_comment_tree()
+    post_ids = sorted(set(c['link_id'].replace("t3_", "") for c in comments))
+    watched_post_id = post_ids[0]
+
+    # nothing is indexed until an experiment watches a post
+    assert app.comment_index.index_comments(db_session, comments) == 0
+
+    assert app.comment_index.watch_posts(db_session, EXPERIMENT_ID, [watched_post_id]) == 1
+    assert app.comment_index.watch_posts(db_session, EXPERIMENT_ID, [watched_post_id]) == 0
+
+    watched_comments = [c for c in comments if c['link_id'] == "t3_" + watched_post_id]
+    assert app.comment_index.index_comments(db_session, comments) == len(watched_comments)
+    # comments that are already indexed are ignored
+    assert app.comment_index.index_comments(db_session, comments) == 0
+
+    indexed = app.comment_index.get_comments(db_session, EXPERIMENT_ID)
+    assert sorted(c.id for c in indexed) == sorted(c['id'] for c in watched_comments)
+    assert [c.created_utc for c in indexed] == sorted(c.created_utc for c in indexed)
+    assert app.comment_index.get_comments(db_session, EXPERIMENT_ID + 1) == []
+
+def test_watch_posts_indexes_archived_comments():
+    comments = load_comment_tree()
+    archive_comments(comments)
+    post_ids = set(c['link_id'].replace("t3_", "") for c in comments)
+
+    assert app.comment_index.watch_posts(db_session, EXPERIMENT_ID, post_ids) == len(post_ids)
+    assert db_session.query(ExperimentComment).count() == len(comments)
+
+def test_get_descendants():
+    comments = load_comment_tree()
+    archive_comments(comments)
+    app.comment_index.watch_posts(db_session, EXPERIMENT_ID, set(c['link_id'].replace("t3_", "") for c in comments))
+
+    comment_tree = Comment.get_comment_tree(db_session, sqlalchemyfilter = Comment.subreddit_id == "mouw")
+    toplevel = list(comment_tree['all_toplevel'].values())
+    expected = sorted(child.id for comment in toplevel for child in comment.get_all_children())
+
+    descendants = app.comment_index.get_descendants(db_session, EXPERIMENT_ID, [c.id for c in toplevel])
+    assert sorted(descendants) == expected
+
+def test_find_replies_across_batches():
+    comments = sorted(load_comment_tree(), key=lambda c: c['created_utc'])
+    toplevel_ids = set(c['id'] for c in comments if c['parent_id'] == c['link_id'])
+    parents = {c['id']: c['parent_id'].replace("t1_", "") for c in comments}
+
+    def root(comment_id):
+        while comment_id in parents and comment_id not in toplevel_ids:
+            comment_id = parents[comment_id]
+        return comment_id if comment_id in toplevel_ids else None
+    expected = {c: root(c) for c in parents if c not in toplevel_ids and root(c)}
+    assert len(expected) > 0
+
+    # the second batch has replies to replies that are only in the first
+    found = {}
+    for batch in [comments[:15], comments[15:]]:
+        replies = app.comment_index.find_replies(db_session, EXPERIMENT_ID, toplevel_ids, batch)
+        app.comment_index.record_replies(db_session, EXPERIMENT_ID, replies, batch)
+        found.update(replies)
+    assert found == expected
+
+    # recorded replies are not returned again
+    assert app.comment_index.find_replies(db_session, EXPERIMENT_ID, toplevel_ids, comments) == {}
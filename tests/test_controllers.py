@@ -11,11 +11,14 @@ import app.controllers.front_page_controller
 import app.controllers.subreddit_controller
 import app.controllers.comment_controller
 import app.controllers.moderator_controller
+import app.page_deltas
+import utils.export.export_pages
 from utils.common import PageType, DbEngine, json2obj
 
 ### LOAD THE CLASSES TO TEST
 from app.models import Base, FrontPage, SubredditPage, Subreddit, Post 
 from app.models import ModAction, Comment, User, EventHook
+from app.models import ArchivedSubredditPage, ArchivedFrontPage
 import app.cs_logger
 
 ## SET UP THE DATABASE ENGINE
@@ -30,6 +33,8 @@ def clear_all_tables():
     db_session.query(EventHook).delete()
     db_session.query(FrontPage).delete()
     db_session.query(SubredditPage).delete()
+    db_session.query(ArchivedFrontPage).delete()
+    db_session.query(ArchivedSubredditPage).delete()
     db_session.query(Subreddit).delete()
     db_session.query(Post).delete()
     db_session.query(User).delete()  
@@ -153,6 +158,164 @@ def test_archive_subreddit_page(mock_subreddit, mock_reddit):
     assert hot_pages_count == 1
 
 
+"""
+  repeated polls of a subreddit page are stored as deltas against the previous poll
+"""
+@patch('praw.Reddit', autospec=True)
+@patch('praw.objects.Subreddit', autospec=True)
+def test_archive_subreddit_page_deltas(mock_subreddit, mock_reddit):
+    test_subreddit_name = "science"
+    test_subreddit_id = "mouw"
+
+    r = mock_reddit.return_value
+    log = app.cs_logger.get_logger(ENV, BASE_DIR)
+
+    with open("{script_dir}/fixture_data/subreddit_posts_0.json".format(script_dir=TEST_DIR)) as f:
+        fixture = [x['data'] for x in json.loads(f.read())['data']['children']]
+    sub_data = [json2obj(json.dumps(post)) for post in fixture]
+    reordered_data = list(reversed(sub_data[1:]))
+
+    mock_subreddit.display_name = test_subreddit_name
+    mock_subreddit.id = test_subreddit_id
+    r.get_subreddit.return_value = mock_subreddit
+
+    sp = app.controllers.subreddit_controller.SubredditPageController(test_subreddit_name, db_session, r, log)
+    mock_subreddit.get_hot.return_value = sub_data
+    first_posts = sp.fetch_subreddit_page(PageType.HOT)
+    sp.archive_subreddit_page(PageType.HOT)
+    sp.archive_subreddit_page(PageType.HOT)
+    mock_subreddit.get_hot.return_value = reordered_data
+    second_posts = sp.fetch_subreddit_page(PageType.HOT)
+    sp.archive_subreddit_page(PageType.HOT)
+
+    keyframe, unchanged, reordered = db_session.query(SubredditPage).order_by(SubredditPage.id).all()
+    assert keyframe.keyframe_id is None
+    assert json.loads(keyframe.page_data) == first_posts
+    assert unchanged.keyframe_id == keyframe.id
+    assert json.loads(unchanged.page_data) == {"base": keyframe.id}
+    assert reordered.keyframe_id == keyframe.id
+    assert len(reordered.page_data) < len(keyframe.page_data)
+
+    assert app.page_deltas.page_posts(db_session, unchanged) == first_posts
+    assert app.page_deltas.page_posts(db_session, reordered) == second_posts
+
+    # a process without the previous page cached reads it from the database
+    app.controllers.subreddit_controller.page_deltas.last_pages.clear()
+    sp.archive_subreddit_page(PageType.HOT)
+    latest = db_session.query(SubredditPage).order_by(SubredditPage.id.desc()).first()
+    assert latest.keyframe_id == keyframe.id
+    assert json.loads(latest.page_data) == {}
+
+
+"""
+  iter_pages replays the pages of a subreddit or the front page, from any page of a chain
+"""
+@patch('praw.Reddit', autospec=True)
+@patch('praw.objects.Subreddit', autospec=True)
+def test_iter_pages(mock_subreddit, mock_reddit):
+    test_subreddit_name = "science"
+    test_subreddit_id = "mouw"
+
+    r = mock_reddit.return_value
+    log = app.cs_logger.get_logger(ENV, BASE_DIR)
+
+    with open("{script_dir}/fixture_data/subreddit_posts_0.json".format(script_dir=TEST_DIR)) as f:
+        fixture = [x['data'] for x in json.loads(f.read())['data']['children']]
+
+    mock_subreddit.display_name = test_subreddit_name
+    mock_subreddit.id = test_subreddit_id
+    r.get_subreddit.return_value = mock_subreddit
+
+    sp = app.controllers.subreddit_controller.SubredditPageController(test_subreddit_name, db_session, r, log)
+    fp = app.controllers.front_page_controller.FrontPageController(db_session, r, log)
+    stored = []
+    for i in range(5):
+        page_data = fixture[i:] + fixture[:i]
+        mock_subreddit.get_hot.return_value = [json2obj(json.dumps(post)) for post in page_data]
+        stored.append(sp.fetch_subreddit_page(PageType.HOT))
+        sp.archive_subreddit_page(PageType.HOT)
+        fp.archive_reddit_front_page(PageType.HOT)
+
+    pages = db_session.query(SubredditPage).order_by(SubredditPage.id).all()
+    assert [page.keyframe_id for page in pages] == [None] + [pages[0].id] * 4
+    front_pages = db_session.query(FrontPage).order_by(FrontPage.id).all()
+    assert [page.keyframe_id for page in front_pages] == [None] + [front_pages[0].id] * 4
+
+    for batch_size in [1, 2, 1000]:
+        replayed = list(app.page_deltas.iter_pages(db_session, test_subreddit_id, PageType.HOT, batch_size=batch_size))
+        assert [page.id for page, posts in replayed] == [page.id for page in pages]
+        assert [posts for page, posts in replayed] == stored
+
+    # starting from a delta replays its chain from the keyframe
+    for i, page in enumerate(pages):
+        page.created_at = datetime.datetime(2016, 7, 1) + datetime.timedelta(minutes=i)
+    db_session.commit()
+    replayed = list(app.page_deltas.iter_pages(db_session, test_subreddit_id, PageType.HOT, start=pages[2].created_at))
+    assert [posts for page, posts in replayed] == stored[2:]
+
+    front_page_posts = [posts for page, posts in app.page_deltas.iter_pages(db_session, None, PageType.HOT)]
+    assert len(front_page_posts) == 5
+    assert front_page_posts[-1] == app.page_deltas.page_posts(db_session, front_pages[-1])
+    assert [post['id'] for post in front_page_posts[1]] == [post['id'] for post in stored[1]]
+
+
+"""
+  iter_pages reads pages the retention job has moved to the archive table, then the live ones
+"""
+@patch('praw.Reddit', autospec=True)
+@patch('praw.objects.Subreddit', autospec=True)
+def test_iter_pages_across_the_archive(mock_subreddit, mock_reddit):
+    test_subreddit_name = "science"
+    test_subreddit_id = "mouw"
+
+    r = mock_reddit.return_value
+    log = app.cs_logger.get_logger(ENV, BASE_DIR)
+
+    with open("{script_dir}/fixture_data/subreddit_posts_0.json".format(script_dir=TEST_DIR)) as f:
+        fixture = [x['data'] for x in json.loads(f.read())['data']['children']]
+
+    mock_subreddit.display_name = test_subreddit_name
+    mock_subreddit.id = test_subreddit_id
+    r.get_subreddit.return_value = mock_subreddit
+
+    sp = app.controllers.subreddit_controller.SubredditPageController(test_subreddit_name, db_session, r, log)
+    stored = []
+    for i in range(5):
+        page_data = fixture[i:] + fixture[:i]
+        mock_subreddit.get_hot.return_value = [json2obj(json.dumps(post)) for post in page_data]
+        stored.append(sp.fetch_subreddit_page(PageType.HOT))
+        sp.archive_subreddit_page(PageType.HOT)
+
+    pages = db_session.query(SubredditPage).order_by(SubredditPage.id).all()
+    for i, page in enumerate(pages):
+        page.created_at = datetime.datetime(2016, 7, 1) + datetime.timedelta(minutes=i)
+    db_session.commit()
+
+    # move the keyframe and the first two deltas, as the retention job does
+    columns = [column.name for column in SubredditPage.__table__.columns]
+    for page in pages[:3]:
+        db_session.add(ArchivedSubredditPage(**{column: getattr(page, column) for column in columns}))
+        db_session.delete(page)
+    db_session.commit()
+    start = datetime.datetime(2016, 7, 1)
+    end = start + datetime.timedelta(minutes=4)
+
+    for batch_size in [1, 2, 1000]:
+        replayed = list(app.page_deltas.iter_pages(db_session, test_subreddit_id, PageType.HOT,
+                                                   start, end, batch_size=batch_size))
+        assert [page.id for page, posts in replayed] == [page.id for page in pages]
+        assert [type(page) for page, posts in replayed] == [ArchivedSubredditPage] * 3 + [SubredditPage] * 2
+        assert [posts for page, posts in replayed] == stored
+
+    # starting from an archived delta replays its chain from the archived keyframe
+    replayed = list(app.page_deltas.iter_pages(db_session, test_subreddit_id, PageType.HOT,
+                                               start + datetime.timedelta(minutes=1), end))
+    assert [posts for page, posts in replayed] == stored[1:]
+
+    assert utils.export.export_pages.series(db_session, SubredditPage, start, start) == \
+        [(test_subreddit_id, PageType.HOT)]
+
+
 @patch('praw.Reddit', autospec=True)
 @patch('praw.objects.Subreddit', autospec=True)    
 def test_archive_subreddit(mock_subreddit, mock_reddit):
@@ -555,6 +718,8 @@ def test_archive_last_thousand_comments(mock_reddit):
     assert db_session.query(Comment).count() == len(comment_fixtures[0])
     assert cc.last_subreddit_id == subreddit_id
     assert len(cc.last_queried_comments) == len(comment_fixtures[0])
+    ## commenters are tracked in users
+    assert db_session.query(User).count() == len(set(c['author'] for c in comment_fixtures[0]))
 
     db_comment = db_session.query(Comment).order_by(app.models.Comment.created_utc.asc()).first()
     assert db_comment.subreddit_id == subreddit_id
@@ -584,6 +749,25 @@ def test_archive_last_thousand_comments(mock_reddit):
     db_session.commit()
     assert db_session.query(Comment).count() == len(first_ids) + len(second_ids)
 
+@patch('praw.Reddit', autospec=True)
+def test_archive_last_thousand_comments_fetched(mock_reddit):
+    r = mock_reddit.return_value
+    log = app.cs_logger.get_logger(ENV, BASE_DIR)
+
+    with open("{script_dir}/fixture_data/comments_0.json".format(script_dir=TEST_DIR), "r") as f:
+        comments = json.loads(f.read())
+
+    db_session.add(Subreddit(id = "mouw", name = "science"))
+    db_session.commit()
+
+    ## comments fetched concurrently by reddit.async_client are stored without asking reddit
+    cc = app.controllers.comment_controller.CommentController(db_session, r, log)
+    added = cc.archive_last_thousand_comments("science", fetched = comments)
+    assert r.get_comments.call_count == 0
+    assert added == len(comments)
+    assert db_session.query(Comment).count() == len(comments)
+    assert len(cc.last_queried_comments) == len(comments)
+
 @patch('praw.Reddit', autospec=True)
 def test_archive_mod_action_page(mock_reddit):
     r = mock_reddit.return_value
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from reddit.fake_reddit import FakeReddit, FakeRedditException
+
+ENV = os.environ['CS_ENV'] = "test"
+
+NOW = 1600000000
+CONFIG = {
+    "seed": 1,
+    "subreddits": {
+        "science": {"posts_per_minute": 1, "comments_per_minute": 60,
+                    "mod_actions_per_minute": 5},
+        "feminism": {"posts_per_minute": 0.5, "comments_per_minute": 10},
+    }
+}
+
+
+def fake_reddit(now=NOW, **kwargs):
+    return FakeReddit(dict(CONFIG, **kwargs), clock=lambda: now, sleep=lambda s: None)
+
+
+def test_listings_are_deterministic_across_instances():
+    first = [c["id"] for c in fake_reddit().get_comments("science", limit=100)]
+    second = [c["id"] for c in fake_reddit().get_comments("science", limit=100)]
+    assert len(first) == 100
+    assert first == second
+
+    later = [c["id"] for c in fake_reddit(now=NOW + 60).get_comments("science", limit=100)]
+    assert len(set(later) - set(first)) == 60
+
+
+def test_get_comments_pages_with_after():
+    r = fake_reddit()
+    comments = []
+    after_id = None
+    while True:
+        page = list(r.get_comments(subreddit="science", params={"after": after_id}, limit=100))
+        if len(page) == 0:
+            break
+        comments += page
+        after_id = "t1_" + page[-1]["id"]
+
+    assert len(comments) == 1000
+    assert len(set(c["id"] for c in comments)) == 1000
+    assert all(a["created_utc"] > b["created_utc"] for a, b in zip(comments, comments[1:]))
+    assert r.call_counts["get_comments"] == 11
+
+    comment = comments[0]
+    assert comment.json_dict is comment
+    assert comment.link_id.startswith("t3_")
+    assert comment["subreddit_id"] == r.get_subreddit("science").fullname
+
+
+def test_get_mod_log():
+    r = fake_reddit()
+    actions = list(r.get_mod_log("science", limit=500))
+    assert len(actions) == 500
+    assert "json_dict" in dir(actions[0])
+    assert actions[0]["sr_id36"] == r.get_subreddit("science").id
+
+    after_id = actions[-1]["id"]
+    older = list(r.get_mod_log("science", limit=500, params={"after": after_id}))
+    assert len(older) == 500
+    assert older[0]["created_utc"] < actions[-1]["created_utc"]
+
+
+def test_subreddit_pages():
+    r = fake_reddit()
+    sub = r.get_subreddit("science")
+    new_posts = list(sub.get_new(limit=300))
+    assert len(new_posts) == 300
+    assert new_posts[0]["created_utc"] >= new_posts[-1]["created_utc"]
+    top_scores = [p.score for p in sub.get_top(limit=300)]
+    assert top_scores == sorted(top_scores, reverse=True)
+
+    all_posts = list(r.get_subreddit("all").get_hot(limit=100))
+    assert set(p["subreddit"] for p in all_posts) <= set(["science", "feminism"])
+
+    with pytest.raises(FakeRedditException):
+        r.get_subreddit("missing")
+
+
+def test_add_comment_remove_and_get_info():
+    r = fake_reddit()
+    submission = next(r.get_subreddit("science").get_new(limit=1))
+    comment = submission.add_comment("Welcome!")
+    comment.distinguish(sticky=True)
+    assert comment.stickied
+
+    existing = next(r.get_comments("science", limit=1))
+    things = r.get_info(thing_id=[comment.fullname, existing.fullname, submission.fullname])
+    assert [t["id"] for t in things] == [comment.id, existing.id, submission.id]
+    assert things[1].banned_by is None
+
+    things[1].remove()
+    assert r.get_info(thing_id=existing.fullname).banned_by is not None
+    assert comment in r.get_submission(submission_id=submission.id).comments
+
+    assert r.send_message("someone", "subject", "body", raise_captcha_exception=True) == {"errors": []}
+    assert r.stats()["sent_messages"] == 1
+
+
+def test_latency():
+    slept = []
+    r = FakeReddit(dict(CONFIG, latency=0.25), clock=lambda: NOW, sleep=slept.append)
+    list(r.get_comments("science", limit=10))
+    r.get_subreddit("science")
+    assert slept == [0.25, 0.25]
+    assert r.call_seconds["get_comments"] == 0.25
@@ -0,0 +1,79 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+ENV = os.environ['CS_ENV'] = "test"
+
+from utils import jobmetrics
+from utils.common import PageType
+from utils.perftest import profilable
+
+
+@pytest.fixture
+def metrics_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(jobmetrics, "METRICS_DIR", str(tmpdir))
+    return str(tmpdir)
+
+
+def read_all(metrics_dir):
+    now = datetime.utcnow()
+    return list(jobmetrics.read_metrics(now - timedelta(days=1), now + timedelta(minutes=1), metrics_dir))
+
+
+@profilable
+def inner_job():
+    jobmetrics.record_reddit_call(0.5)
+    jobmetrics.record_insert("comments", 100, 60)
+
+
+@profilable
+def outer_job(subreddit, page_type):
+    jobmetrics.record_reddit_call(0.25)
+    inner_job()
+    jobmetrics.record_callback("sticky_comment_0", 2.0)
+    jobmetrics.record_callback("sticky_comment_0", 1.0)
+
+
+@profilable
+def failing_job():
+    raise ValueError("failed")
+
+
+def test_job_metrics_are_written(metrics_dir):
+    outer_job("science", PageType.HOT)
+
+    records = read_all(metrics_dir)
+    assert len(records) == 1
+    record = records[0]
+    assert record["name"] == "outer_job"
+    assert record["args"] == ["science", "HOT"]
+    assert record["status"] == "ok"
+    assert record["duration"] >= 0
+    assert record["reddit_calls"] == 2
+    assert record["reddit_time"] == 0.75
+    assert record["rows_inserted"] == 60
+    assert record["rows_duplicated"] == 40
+    assert record["callbacks"] == {"sticky_comment_0": {"count": 2, "time": 3.0}}
+    assert jobmetrics.current() is None
+
+
+def test_failed_job_metrics(metrics_dir):
+    with pytest.raises(ValueError):
+        failing_job()
+    assert [r["status"] for r in read_all(metrics_dir)] == ["error"]
+
+
+def test_records_outside_a_job_are_ignored(metrics_dir):
+    jobmetrics.record_reddit_call(1.0)
+    assert read_all(metrics_dir) == []
+
+
+def test_old_files_are_removed(metrics_dir):
+    old_day = (datetime.utcnow() - timedelta(days=jobmetrics.RETENTION_DAYS + 1))
+    old_path = os.path.join(metrics_dir, jobmetrics.METRICS_FILENAME % old_day.strftime(jobmetrics.METRICS_FILENAME_DATE))
+    open(old_path, "w").close()
+
+    inner_job()
+    assert not os.path.exists(old_path)
+    assert len(read_all(metrics_dir)) == 1
@@ -0,0 +1,70 @@
+import pytest
+import os
+import datetime
+
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+BASE_DIR  = os.path.join(TEST_DIR, "../")
+ENV = os.environ['CS_ENV'] = "test"
+
+import app.membership
+from utils.common import DbEngine, ThingType
+from app.models import ExperimentThing
+
+db_session = DbEngine(os.path.join(TEST_DIR, "../", "config") + "/{env}.json".format(env=ENV)).new_session()
+
+EXPERIMENT_ID = 1
+
+def clear_all_tables():
+    db_session.query(ExperimentThing).delete()
+    db_session.commit()
+    app.membership._thing_sets.clear()
+
+def setup_function(function):
+    clear_all_tables()
+
+def teardown_function(function):
+    clear_all_tables()
+
+def add_things(ids, created_at, object_type=ThingType.SUBMISSION.value):
+    db_session.insert_retryable(ExperimentThing, [{
+        "id": thing_id,
+        "thing_id": "user_" + thing_id,
+        "created_at": created_at,
+        "object_type": object_type,
+        "experiment_id": EXPERIMENT_ID} for thing_id in ids])
+
+def test_thing_set_loads_new_things():
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    add_things(["a", "b"], now - datetime.timedelta(minutes=1))
+    add_things(["user"], now, object_type=ThingType.USER.value)
+
+    things = app.membership.get_thing_set(db_session, EXPERIMENT_ID, ThingType.SUBMISSION.value)
+    assert set(things) == set(["a", "b"])
+    # nothing has changed, so nothing is loaded
+    assert things.refresh(db_session) == False
+
+    # things from the same second as the last refresh are not missed
+    add_things(["c"], now - datetime.timedelta(minutes=1))
+    add_things(["d"], now)
+    assert app.membership.get_thing_set(db_session, EXPERIMENT_ID, ThingType.SUBMISSION.value) is things
+    assert set(things) == set(["a", "b", "c", "d"])
+
+    users = app.membership.get_thing_set(db_session, EXPERIMENT_ID, ThingType.USER.value, column="thing_id")
+    assert set(users) == set(["user_user"])
+
+def test_thing_set_reloads_after_delete():
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    add_things(["a", "b"], now - datetime.timedelta(minutes=1))
+    things = app.membership.get_thing_set(db_session, EXPERIMENT_ID, ThingType.SUBMISSION.value)
+
+    db_session.query(ExperimentThing).filter(ExperimentThing.id == "a").delete()
+    db_session.commit()
+    add_things(["c"], now)
+    things.refresh(db_session)
+    assert set(things) == set(["b", "c"])
+
+def test_add_things_without_a_query():
+    things = app.membership.get_thing_set(db_session, EXPERIMENT_ID, ThingType.SUBMISSION.value)
+    app.membership.add_things(EXPERIMENT_ID, ThingType.SUBMISSION.value, ["e"])
+    assert "e" in things
+    assert things.intersection(["e", "f"]) == set(["e"])
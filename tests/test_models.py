@@ -113,3 +113,21 @@ def test_comment_get_comment_tree():
 
 
     
+
+def test_experiment_thing_set_metadata():
+    metadata = {"condition": "lurker_tempban", "arm": "arm_1",
+                "ban_type": "temporary", "ban_duration_days": 7}
+    columns = ExperimentThing.metadata_columns(metadata)
+    assert json.loads(columns["metadata_json"]) == metadata
+    assert columns["ban_type"] == "temporary"
+    assert columns["arm"] == "arm_1"
+    assert columns["condition"] == "lurker_tempban"
+    assert columns["message_retry_count"] == None
+
+    thing = ExperimentThing(**columns)
+    metadata["ban_type"] = "permanent"
+    metadata["message_retry_count"] = 2
+    thing.set_metadata(metadata)
+    assert json.loads(thing.metadata_json) == metadata
+    assert thing.ban_type == "permanent"
+    assert thing.message_retry_count == 2
@@ -0,0 +1,69 @@
+import os
+import copy
+
+os.environ['CS_ENV'] = "test"
+
+from collections import namedtuple
+import simplejson as json
+
+from app.page_deltas import diff_page, apply_delta, replay_chain
+
+Row = namedtuple("Row", ["id", "page_data"])
+
+def post(id, score=1, num_comments=0):
+    return {"id": id, "author": "author_" + id, "score": score,
+            "num_comments": num_comments, "subreddit_id": "t5_mouw"}
+
+def test_identical_page_is_empty_delta():
+    page = [post("a"), post("b"), post("c")]
+    assert diff_page(page, copy.deepcopy(page)) == {}
+    assert apply_delta(page, {}) == page
+
+def test_delta_records_ranks_new_posts_and_changed_fields():
+    previous = [post("a"), post("b"), post("c")]
+    current = [post("b", score=5), post("d"), post("a")]
+    delta = diff_page(previous, current)
+
+    # "c" fell off the page, "d" is new, "b" moved up and its score changed
+    assert delta == {
+        "order": [1, "d", 0],
+        "added": {"d": post("d")},
+        "changed": {"b": {"score": 5}}}
+    assert apply_delta(previous, delta) == current
+    # the previous page is left as it was
+    assert previous == [post("a"), post("b"), post("c")]
+
+def test_unchanged_order_is_left_out():
+    previous = [post("a"), post("b")]
+    current = [post("a", num_comments=3), post("b")]
+    assert diff_page(previous, current) == {"changed": {"a": {"num_comments": 3}}}
+
+def test_pages_that_cant_be_diffed():
+    # reddit can list a post twice when it moves between two requests for a page
+    previous = [post("a"), post("b")]
+    current = [post("a", score=2), post("b"), post("a", score=3)]
+    assert diff_page(previous, current) is None
+
+def test_deltas_replay_in_order():
+    pages = [[post("a"), post("b")],
+             [post("c"), post("a", score=2), post("b")],
+             [post("c", score=4), post("a", score=2)],
+             [post("c", score=4), post("a", score=2)]]
+    deltas = [diff_page(pages[i], pages[i + 1]) for i in range(len(pages) - 1)]
+    posts = pages[0]
+    for delta, page in zip(deltas, pages[1:]):
+        posts = apply_delta(posts, delta)
+        assert posts == page
+
+def test_deltas_replay_against_their_base():
+    keyframe = [post("a"), post("b")]
+    first = [post("a", score=2), post("b")]
+    second = [post("b"), post("a")]
+    rows = [Row(1, json.dumps(keyframe)),
+            # two jobs stored the same page at once, both against page 1
+            Row(2, json.dumps(dict(diff_page(keyframe, first), base=1))),
+            Row(3, json.dumps(dict(diff_page(keyframe, second), base=1))),
+            Row(4, json.dumps(dict(diff_page(second, second), base=3))),
+            # stored before deltas recorded their base
+            Row(5, json.dumps(diff_page(second, first)))]
+    assert replay_chain(rows) == {1: keyframe, 2: first, 3: second, 4: second, 5: first}
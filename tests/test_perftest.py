@@ -4,6 +4,7 @@ import re
 import statistics
 import sys
 import time
+from datetime import datetime
 from pathlib import Path
 
 import utils.perftest
@@ -78,3 +79,43 @@ def test_aggregator_run_time_stats(sleep_aggregator):
     assert math.isclose(agg.summary.run_time_mean, run_time_mean, rel_tol=tol)
     assert math.isclose(agg.summary.run_time_stdev, run_time_stdev, rel_tol=tol)
     
+
+@utils.perftest.profilable
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_profilable_sampling(tmpdir):
+    profiles_dir = tmpdir.mkdir("profiles")
+    for _ in range(2):
+        spin(0.2, _profile="sample", _profiles_dir=str(profiles_dir))
+    files = profiles_dir.listdir(fil="*.collapsed")
+    assert len(files) == 1
+    assert files[0].basename.endswith("_spin.collapsed")
+
+    samples = utils.perftest.read_samples(str(files[0]))
+    assert sum(samples.values()) > 10
+    in_spin = sum(c for stack, c in samples.items() if stack.split(";")[-1].startswith("spin ("))
+    assert in_spin > 0.8 * sum(samples.values())
+
+    agg = utils.perftest.Aggregator(paths=[Path(str(profiles_dir))])
+    assert agg.samples == samples
+    assert agg.profiles == {}
+
+def test_sampler_cpu_clock():
+    sampler = utils.perftest.Sampler(interval=0.005, clock="cpu")
+    assert sampler.start()
+    assert not utils.perftest.Sampler().start()
+    spin.__wrapped__(0.2)
+    sampler.stop()
+    assert any("spin (" in stack for stack in sampler.samples)
+
+def test_aggregator_date_range(sleep_aggregator):
+    agg, sleep_times = sleep_aggregator
+    agg = utils.perftest.Aggregator(paths=list(agg.paths))
+    assert len(agg.profiles) == len(sleep_times)
+    agg.end_dt = datetime.min.replace(year=2000)
+    assert agg.results == {}
+    agg.end_dt = None
+    assert len(agg.results) > 0
@@ -0,0 +1,58 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+from mock import patch
+
+os.environ['CS_ENV'] = "test"
+
+import reddit.praw_patch
+from reddit.praw_patch import PrawPatch, PrawPatchException
+
+VERSION = "0.0.test"
+
+
+@pytest.fixture
+def praw_dirs(tmpdir, monkeypatch):
+    lib_dir = Path(str(tmpdir), "praw")
+    diffs_dir = Path(str(tmpdir), "praw_patches", VERSION)
+    lib_dir.mkdir()
+    diffs_dir.mkdir(parents=True)
+    source = "patched = True\n"
+    Path(lib_dir, "objects.py").write_text(source)
+    Path(diffs_dir, "objects.py.diff").write_text("")
+    Path(diffs_dir, "objects.py.md5").write_text(hashlib.md5(source.encode("ascii")).hexdigest() + "\n")
+
+    monkeypatch.setattr(reddit.praw_patch, "PRAW_LIB_DIR", str(lib_dir))
+    monkeypatch.setattr(reddit.praw_patch, "PRAW_DIFFS_DIR", str(Path(str(tmpdir), "praw_patches")))
+    monkeypatch.setattr(reddit.praw_patch, "_verified", set())
+    return lib_dir, str(Path(str(tmpdir), "praw_patch_state.json"))
+
+
+def test_ensure_applied_caches_verification(praw_dirs):
+    lib_dir, state_path = praw_dirs
+    with patch.object(PrawPatch, "_diff_applied", autospec=True, side_effect=PrawPatch._diff_applied) as diff_applied:
+        reddit.praw_patch.ensure_applied(VERSION, state_path)
+        assert diff_applied.call_count == 1
+        assert Path(state_path).exists()
+
+        # the same process doesn't check again
+        reddit.praw_patch.ensure_applied(VERSION, state_path)
+        assert diff_applied.call_count == 1
+
+        # a new process trusts the saved state while the files are unchanged
+        reddit.praw_patch._verified.clear()
+        reddit.praw_patch.ensure_applied(VERSION, state_path)
+        assert diff_applied.call_count == 1
+
+
+def test_ensure_applied_rechecks_changed_files(praw_dirs):
+    lib_dir, state_path = praw_dirs
+    reddit.praw_patch.ensure_applied(VERSION, state_path)
+
+    # e.g. praw was reinstalled, and the patch is no longer applied
+    Path(lib_dir, "objects.py").write_text("patched = False\n")
+    reddit.praw_patch._verified.clear()
+    with pytest.raises(PrawPatchException):
+        reddit.praw_patch.ensure_applied(VERSION, state_path)
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+ENV = os.environ['CS_ENV'] = "test"
+
+from utils import querystats
+
+
+@pytest.fixture
+def engine():
+    engine = querystats.instrument(create_engine("sqlite://"))
+    engine.execute("CREATE TABLE things (id INTEGER PRIMARY KEY, name TEXT)")
+    return engine
+
+
+def test_normalize():
+    assert querystats.normalize(
+        "SELECT * FROM comments\n WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 10"
+    ) == "SELECT * FROM comments WHERE id IN (...) AND name = ? LIMIT ?"
+    assert querystats.normalize(
+        "INSERT IGNORE INTO comments (id, name) VALUES (%s, %s), (%s, %s), (%s, %s)"
+    ) == "INSERT IGNORE INTO comments (id, name) VALUES (...)"
+
+
+def test_statements_outside_scope_are_not_recorded(engine):
+    engine.execute("SELECT 1")
+    assert querystats.current() is None
+
+
+def test_scope_counts_statements(engine):
+    with querystats.scope("outer") as outer:
+        engine.execute("INSERT INTO things (id, name) VALUES (1, 'a')")
+        with querystats.scope("inner") as inner:
+            for i in range(3):
+                engine.execute("SELECT * FROM things WHERE id = %d" % i)
+            assert querystats.current() is inner
+        assert querystats.current() is outer
+
+    assert inner.count == 3
+    assert outer.count == 4
+    assert outer.total_time >= inner.total_time > 0
+
+    slowest = {s: c for s, c, _, _ in outer.slowest()}
+    assert slowest["SELECT * FROM things WHERE id = ?"] == 3
+    assert outer.as_dict()["distinct_statements"] == 2
+    assert "outer: 4 statements" in outer.summary()
+
+
+def test_failed_statements_do_not_skew_timing(engine):
+    with querystats.scope("errors") as stats:
+        with pytest.raises(Exception):
+            engine.execute("SELECT * FROM missing_table")
+        engine.execute("SELECT 1")
+    assert stats.count == 1
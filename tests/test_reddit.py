@@ -88,3 +88,24 @@ def test_connect_to_reddit_with_auth(mock_reddit):
     conn.connect(controller = "FrontPageController")
     db_session.commit() ## update the objects
     assert db_session.query(PrawKey).count() == 2
+
+@patch('reddit.connection.praw.Reddit', autoSpec=True)
+def test_connect_reuses_client_until_token_expires(mock_reddit):
+    reddit.connection.ENV= "test"
+    conn = reddit.connection.Connect()
+
+    r = conn.connect()
+    assert conn.connect() is r
+    assert mock_reddit.call_count == 1
+
+    ## a token refreshed by praw is saved on the next connect
+    r.access_token = "refreshed_access_token"
+    conn.connect()
+    db_session.commit() ## update the objects
+    assert db_session.query(PrawKey).first().access_token == "refreshed_access_token"
+
+    ## an expired client is replaced
+    for client in conn.clients.values():
+        client.expires_at = 0
+    conn.connect()
+    assert mock_reddit.call_count == 2
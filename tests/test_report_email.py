@@ -383,3 +383,35 @@ def test_generate_experiment_action(init_experiment_actions):
             record = (label, dt.year, dt.month, dt.day, ACTIONS_PER_EXPERIMENT)
             assert record in output
 
+
+@pytest.fixture
+def init_job_metrics(tmpdir, monkeypatch):
+    import utils.jobmetrics
+    monkeypatch.setattr(utils.jobmetrics, "METRICS_DIR", str(tmpdir))
+    for day in range(DAYS):
+        for i in range(PAGES_PER_DAY):
+            metrics = utils.jobmetrics.JobMetrics("fetch_last_thousand_comments", [SUBREDDIT_NAME])
+            metrics.started_at = END_DT - timedelta(days=day)
+            metrics.duration = 30
+            metrics.reddit_calls = 10
+            metrics.record_insert("comments", 100, 40)
+            metrics.record_callback("sticky_comment_0", 6)
+            metrics.write()
+
+def test_generate_job_metrics(init_job_metrics):
+    report = importlib.reload(utils.email_db_report)
+    label = "(fetch_last_thousand_comments, %s)" % SUBREDDIT_NAME
+
+    durations = set(report.generate_job_duration(END_DT, DAYS, html=False))
+    reddit_calls = set(report.generate_job_reddit_calls(END_DT, DAYS, html=False))
+    rows = set(report.generate_job_rows(END_DT, DAYS, html=False))
+    callbacks = set(report.generate_experiment_callback_time(END_DT, DAYS, html=False))
+    assert len(durations) == DAYS
+
+    for day in range(DAYS):
+        dt = END_DT - timedelta(days=day)
+        assert (label, dt.year, dt.month, dt.day, PAGES_PER_DAY * 0.5) in durations
+        assert (label, dt.year, dt.month, dt.day, PAGES_PER_DAY * 10) in reddit_calls
+        assert ("(comments, inserted)", dt.year, dt.month, dt.day, PAGES_PER_DAY * 40) in rows
+        assert ("(comments, duplicated)", dt.year, dt.month, dt.day, PAGES_PER_DAY * 60) in rows
+        assert ("sticky_comment_0", dt.year, dt.month, dt.day, round(PAGES_PER_DAY * 0.1, 2)) in callbacks
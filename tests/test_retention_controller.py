@@ -0,0 +1,105 @@
+import pytest
+import os
+import simplejson as json
+import datetime
+import app.controllers.retention_controller
+from app.controllers.retention_controller import RetentionController
+from utils.common import DbEngine
+
+from app.models import Base, Comment, ArchivedComments, ModAction, ArchivedModAction
+from app.models import FrontPage, ArchivedFrontPage, Experiment, RetentionCheckpoint
+import app.cs_logger
+
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+BASE_DIR  = os.path.join(TEST_DIR, "../")
+ENV = os.environ['CS_ENV'] ="test"
+
+db_session = DbEngine(os.path.join(TEST_DIR, "../", "config") + "/{env}.json".format(env=ENV)).new_session()
+log = app.cs_logger.get_logger(ENV, BASE_DIR)
+
+NOW = datetime.datetime(2020, 6, 1)
+
+def clear_all_tables():
+    for model in [Comment, ArchivedComments, ModAction, ArchivedModAction,
+                  FrontPage, ArchivedFrontPage, Experiment, RetentionCheckpoint]:
+        db_session.query(model).delete()
+    db_session.commit()
+
+def setup_function(function):
+    clear_all_tables()
+
+def teardown_function(function):
+    clear_all_tables()
+
+def add_comments(subreddit_id, count, created_at):
+    db_session.insert_retryable(Comment, [{
+        "id": "{0}{1}".format(subreddit_id, i),
+        "created_at": created_at,
+        "subreddit_id": subreddit_id,
+        "post_id": "p{0}".format(i),
+        "comment_data": "{}"} for i in range(count)])
+
+def test_archive_comments_in_batches():
+    add_comments("old", 25, NOW - datetime.timedelta(days=60))
+    add_comments("new", 5, NOW - datetime.timedelta(days=1))
+
+    policies = {"comments": {"max_age_days": 42}}
+    rc = RetentionController(db_session, log, policies=policies, batch_size=10, max_batches=2)
+
+    # the first run stops after two batches and records its position
+    assert rc.archive_table("comments", now=NOW) == 20
+    checkpoint = db_session.query(RetentionCheckpoint).filter(RetentionCheckpoint.table_name == "comments").one()
+    assert checkpoint.rows_archived == 20
+    assert checkpoint.is_complete == False
+    assert db_session.query(ArchivedComments).count() == 20
+
+    # the next run continues from the checkpoint and finishes the pass
+    assert rc.archive_table("comments", now=NOW) == 5
+    db_session.refresh(checkpoint)
+    assert checkpoint.is_complete == True
+    assert checkpoint.rows_archived == 25
+
+    assert db_session.query(Comment).count() == 5
+    assert set(c.subreddit_id for c in db_session.query(Comment).all()) == set(["new"])
+    assert db_session.query(ArchivedComments).count() == 25
+
+def test_keep_active_experiment_subreddits():
+    add_comments("active", 5, NOW - datetime.timedelta(days=60))
+    add_comments("ended", 5, NOW - datetime.timedelta(days=60))
+    for name, subreddit_id, end_time in [("active_experiment", "active", NOW + datetime.timedelta(days=10)),
+                                         ("ended_experiment", "ended", NOW - datetime.timedelta(days=10))]:
+        db_session.add(Experiment(
+            name = name,
+            controller = "StickyCommentExperimentController",
+            start_time = NOW - datetime.timedelta(days=100),
+            end_time = end_time,
+            settings_json = json.dumps({"subreddit_id": subreddit_id})))
+    db_session.commit()
+
+    policies = {"comments": {"max_age_days": 42, "keep_active_experiments": True}}
+    rc = RetentionController(db_session, log, policies=policies)
+    assert rc.archive_all(now=NOW) == {"comments": 5}
+    assert set(c.subreddit_id for c in db_session.query(Comment).all()) == set(["active"])
+
+def test_archive_front_pages():
+    for days in [100, 95, 1]:
+        db_session.add(FrontPage(created_at = NOW - datetime.timedelta(days=days), page_type=1, page_data="[]"))
+    db_session.commit()
+
+    rc = RetentionController(db_session, log, policies={"front_pages": {"max_age_days": 90}})
+    assert rc.archive_all(now=NOW) == {"front_pages": 2}
+    assert db_session.query(FrontPage).count() == 1
+    assert db_session.query(ArchivedFrontPage).count() == 2
+
+def test_load_policies(tmp_path):
+    path = tmp_path / "retention.yml"
+    path.write_text("mod_actions:\n  max_age_days: 365\n  subreddit_ids: [2qh1i]\n")
+    policies = app.controllers.retention_controller.load_policies(str(path))
+    assert policies["mod_actions"] == {"max_age_days": 365, "subreddit_ids": ["2qh1i"],
+                                       "keep_active_experiments": True}
+    assert policies["front_pages"] == {"max_age_days": 90}
+
+    # front_pages has no subreddit_id to filter on
+    path.write_text("front_pages:\n  subreddit_ids: [2qh1i]\n")
+    with pytest.raises(Exception):
+        app.controllers.retention_controller.load_policies(str(path))
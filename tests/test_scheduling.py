@@ -0,0 +1,168 @@
+import os
+import signal
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from mock import Mock, patch
+from redis import Redis
+
+ENV = os.environ['CS_ENV'] = "test"
+
+from utils import scheduling
+from utils.scheduling import JobGuard, coalesced
+
+JOB_NAME = __name__ + ".scheduled_job"
+
+connection = Redis()
+calls = []
+
+
+@coalesced
+def scheduled_job(subreddit):
+    calls.append(subreddit)
+    return len(calls)
+
+
+slow_job_seconds = [60]
+
+@coalesced
+def slow_job(subreddit):
+    calls.append(subreddit)
+    time.sleep(slow_job_seconds[0])
+    return len(calls)
+
+
+def clear_keys():
+    for key in connection.keys("civilservant:test:jobs:*"):
+        connection.delete(key)
+    del calls[:]
+
+
+def setup_function(function):
+    clear_keys()
+
+
+def teardown_function(function):
+    clear_keys()
+
+
+def rq_job(enqueued_at, func_name=JOB_NAME):
+    return Mock(func_name=func_name, enqueued_at=enqueued_at, timeout=600, meta={}, connection=connection)
+
+
+def test_runs_normally_outside_a_worker():
+    with patch.object(scheduling, "get_current_job", return_value=None):
+        assert scheduled_job("science") == 1
+    # jobs called from inside another job are not guarded
+    with patch.object(scheduling, "get_current_job", return_value=rq_job(datetime.utcnow(), "app.controller.other_job")):
+        assert scheduled_job("science") == 2
+    assert connection.keys("civilservant:test:jobs:*") == []
+
+
+def test_skip_while_running():
+    guard = JobGuard(connection, JOB_NAME, ["science"])
+    assert guard.acquire()
+    with patch.object(scheduling, "get_current_job", return_value=rq_job(datetime.utcnow())):
+        assert scheduled_job("science") is None
+        # a different subreddit has its own lock
+        assert scheduled_job("politics") == 1
+    guard.release()
+    assert calls == ["politics"]
+    assert guard.stats()["skipped_running"] == 1
+
+
+def test_merge_missed_ticks():
+    enqueued_at = datetime.utcnow() - timedelta(minutes=10)
+    # three ticks piled up while the last run was in progress
+    ticks = [rq_job(enqueued_at + timedelta(minutes=i)) for i in range(3)]
+    for tick in ticks:
+        with patch.object(scheduling, "get_current_job", return_value=tick):
+            scheduled_job("science")
+    # the first tick covers the other two
+    assert calls == ["science"]
+
+    stats = JobGuard(connection, JOB_NAME, ["science"]).stats()
+    assert stats["runs"] == 1
+    assert stats["skipped_merged"] == 2
+    assert 590 < stats["last_lag"] < 610
+    assert stats["max_lag"] == stats["last_lag"]
+
+    # a tick enqueued after the run started runs again
+    with patch.object(scheduling, "get_current_job", return_value=rq_job(datetime.utcnow())):
+        assert scheduled_job("science") == 2
+
+
+@patch.object(scheduling, "LOCK_RENEW_INTERVAL", 0.2)
+@patch.object(scheduling, "LOCK_TTL", 1)
+def test_lock_of_a_killed_horse_expires():
+    guard = JobGuard(connection, __name__ + ".slow_job", ["science"])
+    pid = os.fork()
+    if pid == 0:
+        with patch.object(scheduling, "get_current_job",
+                          return_value=rq_job(datetime.utcnow(), guard.name)):
+            slow_job("science")
+        os._exit(0)
+
+    try:
+        deadline = time.time() + 5
+        while not connection.exists(guard.lock_key) and time.time() < deadline:
+            time.sleep(0.05)
+        # renewed for as long as the horse runs
+        time.sleep(1.5)
+        assert connection.exists(guard.lock_key)
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+    slow_job_seconds[0] = 0
+    try:
+        # the dead horse's lock holds up the next tick until it expires
+        with patch.object(scheduling, "get_current_job",
+                          return_value=rq_job(datetime.utcnow(), guard.name)):
+            assert slow_job("science") is None
+        time.sleep(1.5)
+        with patch.object(scheduling, "get_current_job",
+                          return_value=rq_job(datetime.utcnow(), guard.name)):
+            assert slow_job("science") == 1
+    finally:
+        slow_job_seconds[0] = 60
+    assert guard.stats()["skipped_running"] == 1
+    assert guard.stats()["runs"] == 1
+
+
+def test_adaptive_interval():
+    bounds = {"min_interval": 60, "max_interval": 3600, "target_items": 100}
+    assert scheduling.adaptive_interval(600, 100, **bounds) == 600
+    assert scheduling.adaptive_interval(600, 150, **bounds) == 400
+    # changes are limited to a factor of two per run
+    assert scheduling.adaptive_interval(600, 1000, **bounds) == 300
+    assert scheduling.adaptive_interval(600, 0, **bounds) == 1200
+    # and stay within the bounds
+    assert scheduling.adaptive_interval(100, 1000, **bounds) == 60
+    assert scheduling.adaptive_interval(3000, 0, **bounds) == 3600
+
+
+def test_adapt_interval_after_run():
+    job = rq_job(datetime.utcnow())
+    job.id = "adaptive_job"
+    job.meta = {"interval": 600, "adaptive": {"min_interval": 60, "max_interval": 3600, "target_items": 1}}
+    connection.zadd(scheduling.SCHEDULED_JOBS_KEY, {job.id: 0})
+    try:
+        with patch.object(scheduling, "get_current_job", return_value=job):
+            # the job returns the number of new items it found
+            assert scheduled_job("science") == 1
+        assert job.meta["interval"] == 600
+        assert job.save_meta.call_count == 0
+
+        calls.append("earlier")
+        job.enqueued_at = datetime.utcnow()
+        with patch.object(scheduling, "get_current_job", return_value=job):
+            assert scheduled_job("science") == 3
+        assert job.meta["interval"] == 300
+        assert job.save_meta.call_count == 1
+        next_run = connection.zscore(scheduling.SCHEDULED_JOBS_KEY, job.id)
+        assert abs(next_run - (time.time() + 300)) < 5
+        assert JobGuard(connection, JOB_NAME, ["science"]).stats()["interval"] == 300
+    finally:
+        connection.zrem(scheduling.SCHEDULED_JOBS_KEY, job.id)
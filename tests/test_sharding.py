@@ -0,0 +1,51 @@
+import os
+from mock import patch
+
+ENV = os.environ['CS_ENV'] = "test"
+
+from utils import sharding
+from utils.sharding import HashRing
+
+SUBREDDITS = ["subreddit_{0}".format(i) for i in range(2000)]
+
+def test_unsharded_queue_is_env():
+    with patch.dict(os.environ, {"CS_QUEUE_SHARDS": ""}):
+        assert sharding.shard_count() == 0
+        assert sharding.queue_name("science") == "test"
+        assert sharding.shard_queue_names() == []
+    assert sharding.queue_name("science", shards=0) == "test"
+    assert sharding.queue_name(None, shards=4) == "test"
+
+def test_queue_name_from_environment():
+    with patch.dict(os.environ, {"CS_QUEUE_SHARDS": "4"}):
+        assert sharding.shard_queue_names() == ["test:shard-0", "test:shard-1", "test:shard-2", "test:shard-3"]
+        assert sharding.queue_name("science") in sharding.shard_queue_names()
+        assert sharding.queue_name("science") == sharding.queue_name("science", shards=4)
+
+def test_shards_are_stable_and_case_insensitive():
+    shard = sharding.shard_for("science", shards=8)
+    assert sharding.shard_for("Science", shards=8) == shard
+    # a fresh ring, as in another process, puts it in the same place
+    assert HashRing(range(8)).node_for("science") == shard
+
+def test_subreddits_spread_across_shards():
+    counts = {}
+    for subreddit in SUBREDDITS:
+        shard = sharding.shard_for(subreddit, shards=4)
+        counts[shard] = counts.get(shard, 0) + 1
+    assert sorted(counts.keys()) == [0, 1, 2, 3]
+    assert min(counts.values()) > len(SUBREDDITS) / 4 * 0.75
+
+def test_adding_a_shard_moves_few_subreddits():
+    moved = [subreddit for subreddit in SUBREDDITS
+             if sharding.shard_for(subreddit, shards=4) != sharding.shard_for(subreddit, shards=5)]
+    # only to the new shard, and about a fifth of them
+    assert all(sharding.shard_for(subreddit, shards=5) == 4 for subreddit in moved)
+    assert len(moved) < len(SUBREDDITS) * 0.3
+
+def test_group_by_queue():
+    groups = sharding.group_by_queue(SUBREDDITS[:20], shards=3)
+    assert sorted(sum(groups.values(), [])) == sorted(SUBREDDITS[:20])
+    for queue_name, subreddits in groups.items():
+        assert all(sharding.queue_name(subreddit, shards=3) == queue_name for subreddit in subreddits)
+    assert sharding.group_by_queue(["a", "b"], shards=0) == {"test": ["a", "b"]}
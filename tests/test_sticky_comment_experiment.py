@@ -48,6 +48,7 @@ def clear_all_tables():
     db_session.query(EventHook).delete()
     db_session.query(ModAction).delete()
     db_session.query(ResourceLock).delete()
+    db_session.query(ExperimentComment).delete()
     db_session.commit()    
 
 def setup_function(function):
@@ -572,6 +573,7 @@ def test_make_sticky_post(mock_comment, mock_submission, mock_reddit):
         assert db_session.query(ExperimentAction).count() == 1
         assert db_session.query(ExperimentThing).filter(ExperimentThing.object_type==ThingType.COMMENT.value).count() == 1
         assert sticky_result is not None
+        assert db_session.query(ExperimentThing).filter(ExperimentThing.parent_thing_id == mock_submission.id).count() == 1
 
         ## make sure it aborts the call if we try a second time
         sticky_result = controller_instance.make_sticky_post(experiment_submission, mock_submission)
@@ -580,6 +582,50 @@ def test_make_sticky_post(mock_comment, mock_submission, mock_reddit):
 
         clear_all_tables()
 
+@patch('praw.Reddit', autospec=True)
+@patch('rq.Queue', autospec=True)
+@patch('redis.Redis', autospec=True)
+def test_enqueue_interventions(mock_redis, mock_queue, mock_reddit):
+    r = mock_reddit.return_value
+    queue = mock_queue.return_value
+    queue.enqueue.side_effect = lambda f, args, job_id, **kwargs: Mock(id=job_id)
+
+    with open("{script_dir}/fixture_data/submission_0.json".format(script_dir=TEST_DIR)) as f:
+        submission = json2obj(f.read())
+    r.get_submission.return_value = submission
+
+    experiment_name = "sticky_comment_frontpage_test"
+    controller_instance = FrontPageStickyCommentExperimentController(experiment_name, db_session, r, log)
+    controller_instance.intervention_fanout = True
+
+    experiment_submission = ExperimentThing(
+        id = submission.id,
+        object_type = ThingType.SUBMISSION.value,
+        experiment_id = controller_instance.experiment.id,
+        metadata_json = json.dumps({"randomization":{"treatment":1, "block.id":"frontpage_post.block001", "block.size":10}, "condition":"frontpage_post"}))
+    db_session.add(experiment_submission)
+    db_session.commit()
+
+    ## the scheduled job only enqueues one job per submission
+    with patch.object(controller_instance, "assign_randomized_conditions", return_value=[(experiment_submission, submission)]), \
+         patch.object(controller_instance, "run_intervention") as run_intervention:
+        job_ids = controller_instance.run_interventions([submission], ThingType.SUBMISSION)
+        assert run_intervention.call_count == 0
+    job_id = "intervention_{0}_{1}".format(controller_instance.experiment.id, submission.id)
+    assert job_ids == [job_id]
+    assert queue.enqueue.call_args[1]['args'] == [experiment_name, submission.id]
+    ## without CS_QUEUE_SHARDS, on the CS_ENV queue
+    assert mock_queue.call_args[0][0] == "test"
+
+    ## the enqueued job looks up the experiment thing and runs its intervention
+    with patch.object(controller_instance, "run_intervention", return_value=None) as run_intervention:
+        controller_instance.run_enqueued_intervention(submission.id)
+        run_intervention.assert_called_once_with(experiment_submission, submission, ThingType.SUBMISSION)
+        assert controller_instance.run_enqueued_intervention("missing") is None
+        assert run_intervention.call_count == 1
+
+    clear_all_tables()
+
 @patch('praw.Reddit', autospec=True)
 @patch('praw.objects.Submission', autospec=True)
 @patch('praw.objects.Comment', autospec=True)
@@ -770,6 +816,63 @@ def test_find_treatment_replies(mock_reddit):
         clear_all_tables()        
 
 
+@patch('praw.Reddit', autospec=True)
+def test_callback_remove_new_replies(mock_reddit):
+    r = mock_reddit.return_value
+    controller_instance = AMAStickyCommentExperimentController("sticky_comment_0", db_session, r, log)
+
+    with open(os.path.join(TEST_DIR, "fixture_data", "comment_tree_0.json"),"r") as f:
+        comments = sorted(json.loads(f.read()), key=lambda c: c['created_utc'])
+    treatment_ids = [c['id'] for c in comments if c['parent_id'] == c['link_id']]
+    for treatment_id in treatment_ids:
+        db_session.add(ExperimentThing(
+            id = treatment_id,
+            object_type = ThingType.COMMENT.value,
+            experiment_id = controller_instance.experiment.id,
+            metadata_json = json.dumps({"group":"treatment", "arm":"arm_1"})))
+    db_session.commit()
+
+    ## THE CALLBACK ONLY LOOKS AT COMMENTS FROM THE EXPERIMENT SUBREDDIT
+    comment_controller = Mock(last_subreddit_id = "other", last_queried_comments = comments)
+    assert controller_instance.callback_remove_new_replies(comment_controller) == 0
+
+    first_batch = comments[:15]
+    first_replies = [c for c in first_batch if c['parent_id'] != c['link_id']]
+
+    ## WHEN REDDIT FAILS, THE REPLIES ARE NOT RECORDED, SO THE NEXT RUN FINDS THEM AGAIN
+    r.get_info.side_effect = Exception("reddit is down")
+    comment_controller = Mock(last_subreddit_id = controller_instance.subreddit_id,
+                              last_queried_comments = first_batch)
+    with pytest.raises(Exception):
+        controller_instance.callback_remove_new_replies(comment_controller)
+    assert db_session.query(ExperimentComment).filter(ExperimentComment.root_id != None).count() == 0
+    r.get_info.side_effect = None
+
+    ## FIRST BATCH
+    r.get_info.return_value = [json2obj(json.dumps(c)) for c in first_replies]
+    comment_controller = Mock(last_subreddit_id = controller_instance.subreddit_id,
+                              last_queried_comments = first_batch)
+    assert controller_instance.callback_remove_new_replies(comment_controller) == \
+        len([c for c in first_replies if c['banned_by'] is None])
+    requested_ids = r.get_info.call_args[1]['thing_id']
+    assert sorted(requested_ids) == sorted("t1_" + c['id'] for c in first_replies)
+
+    ## SECOND BATCH: REPLIES TO REPLIES FROM THE FIRST BATCH, AND THE FIRST
+    ## BATCH AGAIN, WHICH SHOULD NOT BE REMOVED A SECOND TIME
+    second_replies = comments[15:]
+    r.get_info.return_value = [json2obj(json.dumps(c)) for c in second_replies]
+    comment_controller.last_queried_comments = comments
+    assert controller_instance.callback_remove_new_replies(comment_controller) == \
+        len([c for c in second_replies if c['banned_by'] is None])
+    requested_ids = r.get_info.call_args[1]['thing_id']
+    assert sorted(requested_ids) == sorted("t1_" + c['id'] for c in second_replies)
+
+    assert db_session.query(ExperimentComment).filter(ExperimentComment.root_id != None).count() == \
+        len(first_replies) + len(second_replies)
+    assert db_session.query(ExperimentAction).filter(ExperimentAction.action=="RemoveRepliesToTreatment").count() == 2
+    clear_all_tables()
+
+
 @patch('praw.Reddit', autospec=True)
 @patch('praw.objects.Subreddit', autospec=True)
 def test_identify_condition(mock_subreddit, mock_reddit):
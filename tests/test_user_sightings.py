@@ -0,0 +1,37 @@
+import os
+import datetime
+from mock import Mock
+
+os.environ['CS_ENV'] = "test"
+
+from sqlalchemy.dialects import mysql
+from app.user_sightings import UserSightings
+
+def test_user_sightings_flush():
+    now = datetime.datetime(2026, 10, 19, 12, 0, 0)
+    sightings = UserSightings()
+    sightings.add("merrymou", now)
+    sightings.add("natematias", now - datetime.timedelta(hours=1))
+    sightings.add("merrymou", now - datetime.timedelta(hours=2))
+    sightings.add("merrymou", now + datetime.timedelta(hours=1))
+    sightings.add(None, now)
+    assert len(sightings) == 2
+
+    db_session = Mock()
+    assert sightings.flush(db_session) == 2
+    assert len(sightings) == 0
+
+    statement, rows = db_session.execute_retryable.call_args[0]
+    assert rows == [
+        {"name": "merrymou",
+         "first_seen": now - datetime.timedelta(hours=2),
+         "last_seen": now + datetime.timedelta(hours=1)},
+        {"name": "natematias",
+         "first_seen": now - datetime.timedelta(hours=1),
+         "last_seen": now - datetime.timedelta(hours=1)}]
+    sql = str(statement.compile(dialect=mysql.dialect()))
+    assert "ON DUPLICATE KEY UPDATE last_seen = greatest(coalesce(users.last_seen, VALUES(last_seen)), VALUES(last_seen))" in sql
+
+    ## nothing to write
+    assert sightings.flush(db_session) == 0
+    assert db_session.execute_retryable.call_count == 1
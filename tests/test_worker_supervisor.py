@@ -0,0 +1,148 @@
+import os
+from datetime import datetime, timezone
+from mock import Mock, patch
+
+ENV = os.environ['CS_ENV'] = "test"
+
+from utils.scheduling import JobGuard
+from utils.worker_monitor import WorkerSupervisor, HOSTNAME, HEARTBEAT_TIMEOUT, STARTUP_GRACE
+
+NOW = 1700000000.0
+
+def utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+class FakeWorker:
+    def __init__(self, name, pid, state="idle", job=None, hostname=HOSTNAME,
+                 last_heartbeat=NOW - 10, successful=0):
+        self.name = name
+        self.pid = pid
+        self.state = state
+        self.job = job
+        self.hostname = hostname
+        self.last_heartbeat = utc(last_heartbeat)
+        self.successful_job_count = successful
+        self.failed_job_count = 0
+
+    def get_state(self):
+        return self.state
+
+    def get_current_job(self):
+        return self.job
+
+def job(job_id, started_at, timeout=3600):
+    return Mock(id=job_id, func_name="app.controller.fetch_comments",
+                started_at=utc(started_at), timeout=timeout, args=["science"])
+
+def supervisor(pids, workers, depth=0, **kwargs):
+    s = WorkerSupervisor("rqworker test", 1, "rqworker", max_count=4,
+                         connection=Mock(), clock=lambda: s.now, **kwargs)
+    s.now = NOW
+    s.fetch_worker_processes = lambda: [Mock(pid=pid) for pid in pids]
+    s.fetch_workers = lambda: workers
+    s.queue_depth = lambda: depth
+    s._stop_job = Mock()
+    s._shutdown = Mock()
+    s._kill = Mock()
+    s._screen_add_processes = Mock()
+    return s
+
+def test_target_count():
+    s = supervisor([], [])
+    assert s.target_count(0, 0) == 1
+    assert s.target_count(25, 0) == 3
+    assert s.target_count(25, 2) == 1
+    assert s.target_count(1000, 0) == 4
+
+@patch("utils.worker_monitor.job_stats", return_value={"last_duration": 200})
+def test_stuck_job_is_stopped_then_killed(mock_stats):
+    running = job("job-1", NOW - 700)
+    quick = job("job-2", NOW - 500)
+    workers = [FakeWorker("w1", 101, "busy", running), FakeWorker("w2", 102, "busy", quick)]
+    s = supervisor([101, 102], workers, depth=20)
+
+    # 700s is more than 3 times the last run, and 500s isn't
+    events = s.check()
+    s._stop_job.assert_called_once_with(running)
+    assert s._kill.call_count == 0
+    assert len(events) == 1
+
+    # still running it at the next check
+    s.now += s.poll_interval
+    events = s.check()
+    assert s._stop_job.call_count == 1
+    assert s._kill.call_args[0][0].pid == 101
+    # 20 queued jobs want both workers
+    s._screen_add_processes.assert_called_once_with(1)
+    assert events[1] == "Restarted 1 worker(s)"
+
+@patch("utils.worker_monitor.job_stats", return_value={"last_duration": 200})
+def test_stopped_and_killed_jobs_release_their_lock(mock_stats):
+    running = job("job-1", NOW - 700)
+    s = supervisor([101], [FakeWorker("w1", 101, "busy", running)])
+    lock_key = JobGuard(s.connection, running.func_name, running.args).lock_key
+    s.check()
+    s.connection.delete.assert_called_once_with(lock_key)
+    s.now += s.poll_interval
+    s.check()
+    assert s.connection.delete.call_count == 2
+    assert s.connection.delete.call_args[0] == (lock_key,)
+
+@patch("utils.worker_monitor.job_stats", return_value={})
+def test_jobs_without_history_use_stuck_after(mock_stats):
+    workers = [FakeWorker("w1", 101, "busy", job("job-1", NOW - 1000))]
+    s = supervisor([101], workers, stuck_after=1200)
+    s.check()
+    assert s._stop_job.call_count == 0
+    s.now += 300
+    s.check()
+    assert s._stop_job.call_count == 1
+
+def test_dead_and_unregistered_workers_are_killed():
+    workers = [FakeWorker("w1", 101, last_heartbeat=NOW - HEARTBEAT_TIMEOUT - 1),
+               FakeWorker("w2", 102)]
+    s = supervisor([101, 102, 103], workers)
+    s.check()
+    assert [c[0][0].pid for c in s._kill.call_args_list] == [101]
+
+    # 103 never registered with rq
+    s.now += STARTUP_GRACE + 1
+    s.check()
+    assert [c[0][0].pid for c in s._kill.call_args_list] == [101, 101, 103]
+
+def test_remote_workers_are_reported_once_and_counted():
+    remote = [FakeWorker("r1", 201, hostname="other-host"),
+              FakeWorker("r2", 202, hostname="other-host", last_heartbeat=NOW - HEARTBEAT_TIMEOUT - 1)]
+    s = supervisor([101], [FakeWorker("w1", 101)] + remote, depth=30)
+    events = s.check()
+    assert s._kill.call_count == 0
+    assert events[0] == "Worker r2 on other-host has sent no heartbeat since {0}".format(remote[1].last_heartbeat)
+    # 30 queued jobs want 3 workers; r1 is one of them
+    s._screen_add_processes.assert_called_once_with(1)
+    events = s.check()
+    assert not any("r2" in event for event in events)
+
+def test_idle_workers_are_shut_down_when_the_queue_is_empty():
+    workers = [FakeWorker("w1", 101, "busy", job("job-1", NOW)), FakeWorker("w2", 102), FakeWorker("w3", 103)]
+    with patch("utils.worker_monitor.job_stats", return_value={}):
+        s = supervisor([101, 102, 103], workers)
+        events = s.check()
+    s._shutdown.assert_called_once_with(workers[1])
+    assert s._screen_add_processes.call_count == 0
+    assert "Scaled down" in events[0]
+
+def test_throughput():
+    workers = [FakeWorker("w1", 101, successful=10), FakeWorker("w2", 102, successful=5)]
+    s = supervisor([101, 102], workers)
+    assert s.throughput(workers, NOW) is None
+    workers[0].successful_job_count = 16
+    assert s.throughput(workers, NOW + 30) == 12.0
+
+@patch("utils.worker_monitor.job_stats", return_value={})
+def test_events_are_emailed(mock_stats):
+    s = supervisor([], [], notify=True)
+    s._send_email = Mock()
+    s.respawn()
+    subject, body = s._send_email.call_args[0]
+    assert subject == "1 worker event(s) on {0}".format(HOSTNAME)
+    assert body.startswith("Scaled up to 1 worker(s) for 0 queued job(s)")
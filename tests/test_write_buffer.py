@@ -0,0 +1,101 @@
+import os
+import pytest
+from mock import Mock, patch
+
+os.environ['CS_ENV'] = "test"
+
+from app.models import ExperimentAction, ExperimentThing
+from utils.common import RetryableDbSession
+
+def result(rowcount):
+    return Mock(rowcount=rowcount)
+
+@pytest.fixture
+def session():
+    session = RetryableDbSession()
+    with patch.object(session, "execute", return_value=result(0)), \
+         patch.object(session, "commit"), \
+         patch.object(session, "rollback"):
+        yield session
+
+def test_write_buffer_flushes_at_max_rows(session):
+    write_buffer = session.write_buffer(max_rows=3, max_age=3600)
+    write_buffer.add(ExperimentAction, {"action": "Intervention"})
+    write_buffer.add(ExperimentThing, [{"id": "a"}])
+    assert session.execute.call_count == 0
+    assert len(write_buffer) == 2
+
+    session.execute.side_effect = [result(1), result(2)]
+    write_buffer.add(ExperimentThing, {"id": "b"})
+    assert len(write_buffer) == 0
+    assert session.commit.call_count == 1
+
+    # one executemany per model, in the order they were first added
+    (action_clause, action_rows), (thing_clause, thing_rows) = [c[0] for c in session.execute.call_args_list]
+    assert action_clause.table.name == "experiment_actions"
+    assert action_rows == [{"action": "Intervention"}]
+    assert thing_clause.table.name == "experiment_things"
+    assert thing_rows == [{"id": "a"}, {"id": "b"}]
+
+def test_write_buffer_flushes_at_max_age(session):
+    write_buffer = session.write_buffer(max_rows=100, max_age=0)
+    write_buffer.add(ExperimentThing, {"id": "a"})
+    assert session.execute.call_count == 1
+    assert len(write_buffer) == 0
+
+def test_write_buffer_without_commit(session):
+    write_buffer = session.write_buffer(commit=False)
+    write_buffer.add(ExperimentThing, {"id": "a"})
+    write_buffer.flush()
+    assert session.execute.call_count == 1
+    assert session.commit.call_count == 0
+
+def test_insert_buffered(session):
+    # outside a write_buffer block rows are inserted and committed right away
+    session.insert_buffered(ExperimentThing, {"id": "a"})
+    assert session.execute.call_count == 1
+    assert session.commit.call_count == 1
+
+    with session.write_buffer() as outer:
+        session.insert_buffered(ExperimentThing, {"id": "b"})
+        with session.write_buffer() as inner:
+            session.insert_buffered(ExperimentThing, {"id": "c"})
+            assert len(inner) == 1
+        assert session.execute.call_count == 2
+        session.insert_buffered(ExperimentThing, {"id": "d"})
+        assert len(outer) == 2
+    assert session.execute.call_count == 3
+    assert session.execute.call_args[0][1] == [{"id": "b"}, {"id": "d"}]
+
+def test_write_buffer_flushes_on_exception(session):
+    with pytest.raises(ValueError):
+        with session.write_buffer() as write_buffer:
+            write_buffer.add(ExperimentThing, {"id": "a"})
+            raise ValueError()
+    assert session.execute.call_count == 1
+    assert session.commit.call_count == 1
+
+@patch("utils.retry.time.sleep")
+def test_write_buffer_retries_failed_flush(mock_sleep, session):
+    session.execute.side_effect = [Exception("Deadlock found"), result(1)]
+    write_buffer = session.write_buffer()
+    write_buffer.add(ExperimentThing, {"id": "a"})
+    assert write_buffer.flush() == 1
+    assert session.rollback.call_count == 1
+    assert session.execute.call_count == 2
+    assert session.execute.call_args[0][1] == [{"id": "a"}]
+    assert len(write_buffer) == 0
+
+def test_write_buffer_groups_rows_by_keys(session):
+    # control non-actions have no subject; an executemany takes its
+    # columns from the first row, so these go out separately
+    control = {"action": "Intervention", "action_object_id": "a"}
+    treatment = {"action": "Intervention", "action_object_id": "b",
+                 "action_subject_type": 2, "action_subject_id": "c1"}
+    session.execute.side_effect = [result(2), result(1)]
+    write_buffer = session.write_buffer()
+    write_buffer.add(ExperimentAction, [control, treatment, dict(control, action_object_id="d")])
+    assert write_buffer.flush() == 3
+    assert [c[0][1] for c in session.execute.call_args_list] == [
+        [control, dict(control, action_object_id="d")], [treatment]]
+    assert session.commit.call_count == 1
@@ -0,0 +1,271 @@
+"""Runs a data migration over a whole table in several processes, resumably.
+
+A Backfill splits the table into ranges of its primary key (or of another
+indexed column) recorded in backfill_chunks, and processes them in forked
+workers, committing each range together with its checkpoint. Running it again
+with the same name processes only the ranges it hadn't finished.
+
+    Backfill("experiment_thing_metadata", ExperimentThing, project_metadata,
+             revision="d3f81b6a2c49", max_qps=500).run(db_session)
+"""
+import datetime
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from sqlalchemy import func
+
+from app.models import BackfillChunk
+from utils import querystats
+from utils.common import BASE_DIR, DbEngine
+
+ALEMBIC_DIR = os.path.join(BASE_DIR, "alembic")
+CHUNK_SIZE = 1000
+WORKERS = 4
+# how far max_qps may be overrun in a burst, in seconds of statements
+QPS_BURST = 1.0
+# how often to ask the replica how far behind it is
+REPLICA_CHECK_INTERVAL = 5
+PROGRESS_INTERVAL = 30
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def encode(value):
+    """A range boundary as stored in backfill_chunks."""
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIME_FORMAT)
+    return str(value)
+
+
+def decode(column, value):
+    """A range boundary from backfill_chunks, as a value of column."""
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime.datetime:
+        return datetime.datetime.strptime(value, TIME_FORMAT)
+    if python_type is int:
+        return int(value)
+    return value
+
+
+def split_ranges(db_session, column, chunk_size=CHUNK_SIZE):
+    """[(start, end)] ranges of column that together cover every row, with
+    about chunk_size rows in each. start is inclusive and end exclusive; the
+    last range has no end, so it also covers rows added since."""
+    if column.type.python_type is int:
+        low, high = db_session.query(func.min(column), func.max(column)).one()
+        if low is None:
+            return []
+        starts = list(range(low, high + 1, chunk_size))
+    else:
+        # strings and times can't be counted off, so walk the index to every
+        # chunk_size-th value. Rows sharing a value stay in one range.
+        starts = []
+        start = db_session.query(func.min(column)).scalar()
+        while start is not None:
+            starts.append(start)
+            start = db_session.query(column).filter(column > start).order_by(
+                column).offset(chunk_size - 1).limit(1).scalar()
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def check_revision(db_session, revision):
+    """Raise ValueError unless the database has been migrated to revision."""
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    script = ScriptDirectory(ALEMBIC_DIR)
+    heads = MigrationContext.configure(db_session.connection()).get_current_heads()
+    for head in heads:
+        if any(rev.revision == revision for rev in script.iterate_revisions(head, "base")):
+            return
+    raise ValueError("The database is at {0}, not yet at alembic revision {1}".format(
+        ", ".join(heads) or "no revision", revision))
+
+
+# the backfill and database session of a worker process
+_worker = {}
+
+def _init_worker(backfill):
+    _worker["backfill"] = backfill
+    _worker["db_session"] = backfill.new_session()
+
+def _run_in_worker(chunk_id):
+    return _worker["backfill"].run_chunk(_worker["db_session"], chunk_id)
+
+
+class Backfill:
+    def __init__(self, name, model, process, column=None, chunk_size=CHUNK_SIZE,
+                 workers=WORKERS, max_qps=None, max_replica_lag=None,
+                 replica_config_path=None, revision=None, new_session=None,
+                 clock=time.time, sleep=time.sleep):
+        """process(db_session, rows) is called with the rows of each range, in
+        order of column (the primary key unless given), and returns the number
+        of rows it changed, or None to count them all. With workers=0 the
+        ranges are processed in this process. new_session opens a worker's
+        database session, by default on config/CS_ENV.json."""
+        if max_replica_lag is not None and replica_config_path is None:
+            raise ValueError("max_replica_lag needs a replica_config_path")
+        self.name = name
+        self.model = model
+        self.process = process
+        if column is None:
+            self.column = model.__mapper__.primary_key[0]
+        else:
+            self.column = model.__table__.c[column]
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_qps = max_qps
+        self.max_replica_lag = max_replica_lag
+        self.replica_config_path = replica_config_path
+        self.revision = revision
+        if new_session is None:
+            config_path = os.path.join(BASE_DIR, "config", "{0}.json".format(os.environ["CS_ENV"]))
+            new_session = DbEngine(config_path).new_session
+        self.new_session = new_session
+        self.clock = clock
+        self.sleep = sleep
+        self.replica = None
+
+        self.ready_at = 0
+        self.next_replica_check = 0
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rows_processed = 0
+        self.last_progress = 0
+
+    def plan(self, db_session):
+        """The ids of the chunks not yet completed, splitting the table into
+        chunks the first time the backfill runs."""
+        chunks = db_session.query(BackfillChunk).filter(BackfillChunk.backfill_name == self.name)
+        if chunks.first() is None:
+            ranges = split_ranges(db_session, self.column, self.chunk_size)
+            db_session.add_all([BackfillChunk(backfill_name=self.name,
+                                              range_start=encode(start),
+                                              range_end=None if end is None else encode(end))
+                                for start, end in ranges])
+            db_session.commit()
+        return [chunk.id for chunk in chunks.filter(
+            BackfillChunk.completed_at == None).order_by(BackfillChunk.id)]
+
+    def chunk_query(self, db_session, chunk):
+        """The rows of a chunk."""
+        query = db_session.query(self.model).filter(
+            self.column >= decode(self.column, chunk.range_start))
+        if chunk.range_end is not None:
+            query = query.filter(self.column < decode(self.column, chunk.range_end))
+        return query.order_by(self.column)
+
+    def run_chunk(self, db_session, chunk_id):
+        """Process a chunk and mark it complete in one transaction. Returns
+        (rows processed, statements sent)."""
+        with querystats.scope("backfill:" + self.name) as stats:
+            try:
+                chunk = db_session.query(BackfillChunk).get(chunk_id)
+                rows = self.chunk_query(db_session, chunk).all()
+                processed = self.process(db_session, rows)
+                if processed is None:
+                    processed = len(rows)
+                chunk.rows_processed = processed
+                chunk.completed_at = datetime.datetime.utcnow()
+                db_session.commit()
+            except Exception:
+                db_session.rollback()
+                raise
+        return processed, stats.count
+
+    def replica_lag(self):
+        """Seconds the replica is behind, or None when it isn't replicating."""
+        if self.replica is None:
+            self.replica = DbEngine(self.replica_config_path).new_engine()
+        status = self.replica.execute("SHOW SLAVE STATUS").first()
+        if status is None:
+            raise ValueError("{0} is not a replica".format(self.replica_config_path))
+        return status["Seconds_Behind_Master"]
+
+    def throttle(self):
+        """Wait until another chunk can be handed out without going over
+        max_qps, or while the replica is more than max_replica_lag behind."""
+        if self.max_qps:
+            wait_time = self.ready_at - self.clock()
+            if wait_time > 0:
+                self.sleep(wait_time)
+        if self.max_replica_lag is None:
+            return
+        while self.clock() >= self.next_replica_check:
+            lag = self.replica_lag()
+            if lag is not None and lag <= self.max_replica_lag:
+                self.next_replica_check = self.clock() + REPLICA_CHECK_INTERVAL
+                break
+            print("Backfill {0}: waiting for the replica, {1} behind".format(
+                self.name, "not replicating" if lag is None else "{0}s".format(lag)))
+            self.sleep(REPLICA_CHECK_INTERVAL)
+
+    def chunk_finished(self, chunk_id, processed, statements):
+        self.completed += 1
+        self.rows_processed += processed
+        if self.max_qps:
+            # a leaky bucket: each chunk's statements push back when the
+            # next may start, allowing QPS_BURST seconds of slack
+            now = self.clock()
+            self.ready_at = max(self.ready_at, now - QPS_BURST) + statements / self.max_qps
+        self.print_progress()
+
+    def chunk_failed(self, chunk_id, error):
+        self.failed += 1
+        print("Backfill {0}: chunk {1} failed: {2}: {3}".format(
+            self.name, chunk_id, error.__class__.__name__, error))
+
+    def print_progress(self, force=False):
+        now = self.clock()
+        if force or now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            print("Backfill {0}: {1} of {2} chunks done, {3} rows processed".format(
+                self.name, self.completed, self.pending, self.rows_processed))
+
+    def run(self, db_session):
+        """Process every chunk not yet completed. Returns the number of rows
+        processed."""
+        if self.revision is not None:
+            check_revision(db_session, self.revision)
+        chunk_ids = self.plan(db_session)
+        self.pending = len(chunk_ids)
+        self.last_progress = self.clock()
+        print("Backfill {0}: {1} chunks to process".format(self.name, self.pending))
+
+        if self.workers == 0:
+            for chunk_id in chunk_ids:
+                self.throttle()
+                try:
+                    self.chunk_finished(chunk_id, *self.run_chunk(db_session, chunk_id))
+                except Exception as e:
+                    self.chunk_failed(chunk_id, e)
+        else:
+            # forked workers mustn't share this process's connections
+            db_session.close()
+            db_session.get_bind().dispose()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(self.workers, mp_context=context,
+                                     initializer=_init_worker, initargs=(self,)) as pool:
+                queued = list(reversed(chunk_ids))
+                running = {}
+                while queued or running:
+                    while queued and len(running) < self.workers:
+                        self.throttle()
+                        chunk_id = queued.pop()
+                        running[pool.submit(_run_in_worker, chunk_id)] = chunk_id
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk_id = running.pop(future)
+                        try:
+                            self.chunk_finished(chunk_id, *future.result())
+                        except Exception as e:
+                            self.chunk_failed(chunk_id, e)
+
+        self.print_progress(force=True)
+        if self.failed > 0:
+            print("Backfill {0}: {1} chunks failed; run it again to retry them".format(
+                self.name, self.failed))
+        return self.rows_processed
@@ -3,8 +3,10 @@ import contextlib
 import pathlib
 import simplejson as json
 import sqlalchemy.orm.session
+import time
 import warnings
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from utils import jobmetrics
 from utils.retry import retryable
 
 BASE_DIR = str(pathlib.Path(__file__).parents[1])
@@ -57,8 +59,23 @@ class RetryableDbSession(sqlalchemy.orm.session.Session):
         clause = model.__table__.insert()
         if ignore_dupes:
             clause = clause.prefix_with("IGNORE")
-        return self.execute_retryable(clause, params, commit)
+        result = self.execute_retryable(clause, params, commit)
+        attempted = len(params) if isinstance(params, list) else 1
+        jobmetrics.record_insert(model.__tablename__, attempted, result.rowcount)
+        return result
     
+    def write_buffer(self, **kwargs):
+        """A WriteBuffer for this session; see WriteBuffer."""
+        return WriteBuffer(self, **kwargs)
+
+    def insert_buffered(self, model, one_or_many):
+        """Insert rows through the innermost open `with session.write_buffer()`
+        block, or right away (and commit) when there is none."""
+        write_buffer = getattr(self, "_active_write_buffer", None)
+        if write_buffer is not None:
+            return write_buffer.add(model, one_or_many)
+        return self.insert_retryable(model, one_or_many, ignore_dupes=False)
+
     def new_sibling_session(self):
         from sqlalchemy.orm import sessionmaker
         engine = self.get_bind()
@@ -86,28 +103,141 @@ class RetryableDbSession(sqlalchemy.orm.session.Session):
         finally:
             lock_session.close()
 
+def _group_by_keys(rows):
+    """Rows grouped by their set of keys, in the order each set first appears."""
+    groups = OrderedDict()
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    return list(groups.values())
+
+WRITE_BUFFER_MAX_ROWS = 100
+WRITE_BUFFER_MAX_AGE = 5 # seconds
+
+class WriteBuffer:
+    """Row dicts collected per model and inserted together.
+
+    Intervention loops record an ExperimentAction (and often an
+    ExperimentThing) for every item, and add_retryable sends each one through
+    the unit of work, usually with its own commit. A WriteBuffer inserts each
+    model's rows with one executemany per set of keys (an executemany takes
+    its columns from the first row), and commits once, when max_rows rows
+    are waiting, when max_age seconds have passed since the oldest of them,
+    and when it is flushed or its `with` block ends.
+
+    A flush is retried with backoff, rolling back the session after a failed
+    attempt, like add_retryable; rows stay in the buffer until a flush
+    succeeds. The rows record things that already happened (messages sent,
+    comments posted), so the buffer is flushed even when its `with` block
+    ends with an exception.
+    """
+    def __init__(self, session, max_rows=WRITE_BUFFER_MAX_ROWS,
+                 max_age=WRITE_BUFFER_MAX_AGE, commit=True, ignore_dupes=False):
+        self.session = session
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.commit = commit
+        self.ignore_dupes = ignore_dupes
+        self.rows = OrderedDict()
+        self.size = 0
+        self.oldest = None
+        self._outer = None
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        self._outer = getattr(self.session, "_active_write_buffer", None)
+        self.session._active_write_buffer = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.session._active_write_buffer = self._outer
+        self.flush()
+        return False
+
+    def add(self, model, one_or_many):
+        rows = one_or_many if isinstance(one_or_many, list) else [one_or_many]
+        self.rows.setdefault(model, []).extend(rows)
+        self.size += len(rows)
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        if self.size >= self.max_rows or time.monotonic() - self.oldest >= self.max_age:
+            self.flush()
+
+    def flush(self):
+        """Insert every waiting row. Returns the number of rows inserted."""
+        if self.size == 0:
+            return 0
+
+        @retryable(backoff=True, session=self.session, rollback=True)
+        def _perform_flush():
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", r"\(1062, \"Duplicate entry")
+                results = []
+                for model, rows in self.rows.items():
+                    clause = model.__table__.insert()
+                    if self.ignore_dupes:
+                        clause = clause.prefix_with("IGNORE")
+                    rowcount = 0
+                    for key_rows in _group_by_keys(rows):
+                        rowcount += self.session.execute(clause, key_rows).rowcount
+                    results.append((model, len(rows), rowcount))
+            if self.commit:
+                self.session.commit()
+            return results
+
+        inserted = 0
+        for model, attempted, rowcount in _perform_flush():
+            jobmetrics.record_insert(model.__tablename__, attempted, rowcount)
+            inserted += rowcount
+        self.rows = OrderedDict()
+        self.size = 0
+        self.oldest = None
+        return inserted
+
 class DbEngine:
 	def __init__(self, config_path):
 		self.config_path = config_path
     
-	def new_session(self):
+	def new_engine(self):
 		with open(self.config_path, "r") as config:
 		    DBCONFIG = json.loads(config.read())
 
 		from sqlalchemy import create_engine
-		from sqlalchemy.orm import sessionmaker
-		from app.models import Base
+		from utils import querystats
 		db_engine = create_engine("mysql://{user}:{password}@{host}/{database}".format(
 		    host = DBCONFIG['host'],
 		    user = DBCONFIG['user'],
 		    password = DBCONFIG['password'],
 		    database = DBCONFIG['database']), pool_recycle=3600)
+		querystats.instrument(db_engine)
+		return db_engine
+
+	def new_session(self):
+		from sqlalchemy.orm import sessionmaker
+		from app.models import Base
+		db_engine = self.new_engine()
 
 		Base.metadata.bind = db_engine
 		DBSession = sessionmaker(bind=db_engine, class_=RetryableDbSession)
 		db_session = DBSession()
 		return db_session
 
+_yaml_cache = {}
+
+def load_yaml_cached(path):
+    """Parse a yaml file, reusing the last parse while the file's mtime and
+    size are unchanged. Each caller gets its own copy, since experiment
+    controllers modify their config."""
+    import copy, os, yaml
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _yaml_cache.get(path)
+    if cached is None or cached[0] != key:
+        with open(path, "r") as f:
+            cached = _yaml_cache[path] = (key, yaml.full_load(f))
+    return copy.deepcopy(cached[1])
+
 def _index_or_none(l, obj):
     try:
         return l.index(obj)
@@ -0,0 +1,44 @@
+import os, sys
+BASE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../", "../")
+sys.path.append(BASE_DIR)
+import simplejson as json
+
+# ONE-TIME BACKFILL OF THE experiment_things METADATA PROJECTION
+# (alembic revision d3f81b6a2c49): ban_type, arm, condition and
+# message_retry_count are copied out of metadata_json so experiments
+# can filter on them with an index instead of parsing every thing.
+# Runs in worker processes through utils/backfill.py, resuming where
+# it stopped. Safe to run more than once.
+#
+#   CS_ENV=production python3 10.19.2026.backfill_experiment_thing_metadata_columns.py [workers] [max qps]
+
+from app.models import ExperimentThing
+from utils.backfill import Backfill, WORKERS
+from utils.common import DbEngine
+
+ENV = os.environ['CS_ENV']
+db_session = DbEngine(os.path.join(BASE_DIR, "config") + "/{env}.json".format(env=ENV)).new_session()
+
+def project_metadata(db_session, things):
+    updated = 0
+    for thing in things:
+        if not thing.metadata_json:
+            continue
+        try:
+            metadata = json.loads(thing.metadata_json)
+        except ValueError:
+            continue
+        if not isinstance(metadata, dict):
+            continue
+        # leave metadata_json as it was stored
+        for field in ExperimentThing.PROJECTED_FIELDS:
+            setattr(thing, field, metadata.get(field))
+        updated += 1
+    return updated
+
+workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+max_qps = int(sys.argv[2]) if len(sys.argv) > 2 else None
+updated = Backfill("experiment_thing_metadata_columns", ExperimentThing, project_metadata,
+                   workers=workers, max_qps=max_qps, revision="d3f81b6a2c49").run(db_session)
+
+print("Finished: projected metadata of {0} experiment things".format(updated))
@@ -0,0 +1,53 @@
+import os, sys
+BASE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../", "../")
+sys.path.append(BASE_DIR)
+import simplejson as json
+
+# ONE-TIME BACKFILL OF experiment_things.parent_thing_id
+# (alembic revision 9a4c17e3b852), which replaces looking up the
+# sticky comment of a post with a LIKE on metadata_json.
+#   sticky comments and mod actions: metadata_json['submission_id']
+#   stylesheet experiment comments: query_index, which holds the post id
+# Safe to run more than once; only things without a parent_thing_id are read.
+
+from sqlalchemy import and_
+from app.models import ExperimentThing
+from utils.common import DbEngine, ThingType
+
+ENV = os.environ['CS_ENV']
+db_session = DbEngine(os.path.join(BASE_DIR, "config") + "/{env}.json".format(env=ENV)).new_session()
+
+BATCH_SIZE = 1000
+
+def parent_thing_id(thing):
+    if thing.metadata_json:
+        try:
+            submission_id = json.loads(thing.metadata_json).get("submission_id")
+        except (ValueError, AttributeError):
+            submission_id = None
+        if submission_id:
+            return submission_id
+    if thing.object_type == ThingType.COMMENT.value:
+        return thing.query_index
+    return None
+
+last_id = ""
+updated = 0
+while True:
+    things = db_session.query(ExperimentThing).filter(and_(
+        ExperimentThing.id > last_id,
+        ExperimentThing.parent_thing_id == None,
+        ExperimentThing.object_type.in_([ThingType.COMMENT.value, ThingType.MODACTION.value]))).order_by(
+        ExperimentThing.id).limit(BATCH_SIZE).all()
+    if len(things) == 0:
+        break
+    for thing in things:
+        parent_id = parent_thing_id(thing)
+        if parent_id:
+            thing.parent_thing_id = parent_id
+            updated += 1
+    last_id = things[-1].id
+    db_session.commit()
+    print("Set parent_thing_id on {0} experiment things (up to id {1})".format(updated, last_id))
+
+print("Finished: set parent_thing_id on {0} experiment things".format(updated))
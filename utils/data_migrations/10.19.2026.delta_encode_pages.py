@@ -0,0 +1,98 @@
+import os, sys
+BASE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../", "../")
+sys.path.append(BASE_DIR)
+import simplejson as json
+
+# ONE-TIME RE-ENCODING OF subreddit_pages AND front_pages AS DELTAS
+# (alembic revisions e7c24b9f5a13 and 4f9e0b27c8d5): pages stored in full
+# before the page jobs stored deltas are rewritten as chains of a keyframe
+# followed by deltas against the previous page (see app/page_deltas.py).
+#
+# The latest chain of each series is left alone, since a running page job
+# may be adding to it, as are keyframes that deltas already point at.
+# Pages in the archived_* tables are not re-encoded.
+# Safe to run more than once, and to stop at any point.
+
+from app.models import SubredditPage, FrontPage
+from app.page_deltas import KEYFRAME_INTERVAL, diff_page, apply_delta, delta_base, page_posts
+from utils.common import DbEngine, PageType
+
+ENV = os.environ['CS_ENV']
+db_session = DbEngine(os.path.join(BASE_DIR, "config") + "/{env}.json".format(env=ENV)).new_session()
+
+BATCH_SIZE = 1000
+
+def series_filter(model, subreddit_id, page_type):
+    conditions = [model.page_type == page_type]
+    if model is SubredditPage:
+        conditions.append(model.subreddit_id == subreddit_id)
+    return conditions
+
+def encode_series(model, subreddit_id, page_type):
+    conditions = series_filter(model, subreddit_id, page_type)
+    latest = db_session.query(model).filter(*conditions).order_by(model.id.desc()).first()
+    before_id = latest.keyframe_id or latest.id
+    referenced = set(row.keyframe_id for row in db_session.query(model.keyframe_id).filter(
+        *conditions, model.keyframe_id != None).distinct())
+
+    posts = None
+    previous_id = None
+    chain_posts = {}
+    chain_keyframe_id = None
+    chain_length = 0
+    encoded = 0
+    last_id = 0
+    while True:
+        pages = db_session.query(model).filter(
+            *conditions, model.id > last_id, model.id < before_id).order_by(model.id).limit(BATCH_SIZE).all()
+        if len(pages) == 0:
+            break
+        for page in pages:
+            if page.keyframe_id is not None:
+                # already a delta
+                delta = json.loads(page.page_data)
+                base_id = delta_base(delta, previous_id)
+                if page.keyframe_id == chain_keyframe_id and base_id in chain_posts:
+                    posts = apply_delta(chain_posts[base_id], delta)
+                else:
+                    posts = page_posts(db_session, page)
+                    chain_posts = {}
+                chain_keyframe_id = page.keyframe_id
+                chain_length += 1
+                chain_posts[page.id] = posts
+                previous_id = page.id
+                continue
+
+            page_posts_list = json.loads(page.page_data)
+            delta = None
+            if page.id not in referenced and posts is not None and chain_length < KEYFRAME_INTERVAL:
+                delta = diff_page(posts, page_posts_list)
+            if delta is None:
+                chain_keyframe_id = page.id
+                chain_length = 1
+                chain_posts = {}
+            else:
+                delta["base"] = previous_id
+                page.page_data = json.dumps(delta)
+                page.keyframe_id = chain_keyframe_id
+                chain_length += 1
+                encoded += 1
+            posts = page_posts_list
+            chain_posts[page.id] = posts
+            previous_id = page.id
+        last_id = pages[-1].id
+        db_session.commit()
+    return encoded
+
+for model in [FrontPage, SubredditPage]:
+    if model is FrontPage:
+        series = [(None, row.page_type) for row in db_session.query(FrontPage.page_type).distinct()]
+    else:
+        series = db_session.query(SubredditPage.subreddit_id, SubredditPage.page_type).distinct().all()
+    total = 0
+    for subreddit_id, page_type in series:
+        encoded = encode_series(model, subreddit_id, page_type)
+        total += encoded
+        print("Encoded {0} {1} pages of {2} {3} as deltas".format(
+            encoded, model.__tablename__, subreddit_id or "the front page", PageType(page_type).name))
+    print("Finished: encoded {0} {1} as deltas".format(total, model.__tablename__))
@@ -10,6 +10,7 @@ BASE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
 sys.path.append(BASE_DIR)
 
 from utils.common import PageType, ThingType
+from utils import jobmetrics
 
 with open(os.path.join(BASE_DIR, "config") + "/{env}.json".format(env=ENV), "r") as config:
   DBCONFIG = json.loads(config.read())
@@ -382,6 +383,73 @@ def generate_experiment_action(today=datetime.datetime.utcnow(), days=7, html=Tr
 
 
 
+######################################################################
+######### JOB METRICS (logs/metrics, see utils/jobmetrics.py) ########
+######################################################################
+
+def run_rollup_for_days(values_fn, today, days=7):
+    from_dt = today - datetime.timedelta(days=days)
+    totals = {}
+    for record in jobmetrics.read_metrics(from_dt, today):
+        started_at = str_to_date(record["started_at"], by_day=False)
+        for label, value in values_fn(record):
+            key = (label, started_at.year, started_at.month, started_at.day)
+            totals[key] = totals.get(key, 0) + value
+    return [(*key, round(value, 2)) for key, value in totals.items()]
+
+def job_label(record):
+    return "({0})".format(", ".join([record["name"]] + record["args"]))
+
+def generate_job_duration(today=datetime.datetime.utcnow(), days=7, html=True):
+    result = run_rollup_for_days(lambda r: [(job_label(r), r["duration"] / 60)], today, days=days)
+    if not html:
+        return result
+    return generate_html_table(result,
+                               str_to_date(date_to_str(today)),
+                               "Job worker minutes, by (job, args)")
+
+def generate_job_reddit_calls(today=datetime.datetime.utcnow(), days=7, html=True):
+    result = run_rollup_for_days(lambda r: [(job_label(r), r["reddit_calls"])], today, days=days)
+    if not html:
+        return result
+    return generate_html_table(result,
+                               str_to_date(date_to_str(today)),
+                               "Job reddit API calls, by (job, args)")
+
+def generate_job_db_statements(today=datetime.datetime.utcnow(), days=7, html=True):
+    result = run_rollup_for_days(lambda r: [(job_label(r), r["db_statements"])], today, days=days)
+    if not html:
+        return result
+    return generate_html_table(result,
+                               str_to_date(date_to_str(today)),
+                               "Job database statements, by (job, args)")
+
+def generate_job_rows(today=datetime.datetime.utcnow(), days=7, html=True):
+    def _values(record):
+        values = []
+        for table, counts in record["inserts"].items():
+            values.append(("({0}, inserted)".format(table), counts["inserted"]))
+            values.append(("({0}, duplicated)".format(table), counts["attempted"] - counts["inserted"]))
+        return values
+    result = run_rollup_for_days(_values, today, days=days)
+    if not html:
+        return result
+    return generate_html_table(result,
+                               str_to_date(date_to_str(today)),
+                               "Rows inserted by jobs, by (table, outcome)")
+
+def generate_experiment_callback_time(today=datetime.datetime.utcnow(), days=7, html=True):
+    def _values(record):
+        return [(str(experiment), counts["time"] / 60) for experiment, counts in record["callbacks"].items()]
+    result = run_rollup_for_days(_values, today, days=days)
+    if not html:
+        return result
+    return generate_html_table(result,
+                               str_to_date(date_to_str(today)),
+                               "Experiment callback minutes, by experiment")
+
+
+
 ######################################################################
 ######### GENERATE REPORT  ###########################################
 ######################################################################
@@ -436,6 +504,14 @@ def generate_report(today=datetime.datetime.utcnow(), days=7):
     html += generate_experiment_thing_snapshot(today, days)
     html += generate_experiment_action(today, days)    
     html += "</table>"    
+    html += "<h2>Job metrics per day</h2>"
+    html += "<table>"
+    html += generate_job_duration(today, days)
+    html += generate_job_reddit_calls(today, days)
+    html += generate_job_db_statements(today, days)
+    html += generate_job_rows(today, days)
+    html += generate_experiment_callback_time(today, days)
+    html += "</table>"
     html += "</body></html>"
     return html
 
@@ -5,8 +5,10 @@ echo "    $1"
 echo "    $2"
 end_time=($2)
 
-declare -a tables=(posts comments front_pages subreddit_pages)
-declare -a strip_tables=(front_pages subreddit_pages)
+declare -a tables=(posts comments)
+# pages are stored as deltas against earlier pages, so they are exported
+# with every post on each page, and without primary keys
+declare -a page_tables=(front_pages subreddit_pages)
 
 for table in "${tables[@]}"
 do
@@ -21,11 +23,9 @@ do
 		> "${end_time[0]}-${table}.sql"
 done
 
-echo "Stripping primary keys"
-
-for table in "${strip_tables[@]}"
+for table in "${page_tables[@]}"
 do
-	echo "Stripping: $table"
-	python3 strip_export_key.py "${end_time[0]}-${table}.sql"
+	echo "Exporting: $table"
+	CS_ENV=${CS_ENV:-production} python3 export_pages.py $table "$1" "$2"
 done
 echo "Done"
@@ -0,0 +1,80 @@
+import os
+import sys
+import datetime
+BASE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../", "../")
+sys.path.append(BASE_DIR)
+
+from sqlalchemy import String, literal
+from sqlalchemy.dialects import mysql
+from app.models import SubredditPage, FrontPage
+from app.page_deltas import iter_pages, SERIES_MODELS
+from utils.common import DbEngine, PageType
+import simplejson as json
+
+## Export the subreddit_pages or front_pages created between two times as
+## INSERT IGNORE statements without primary keys, like strip_export_key.py
+## writes for a mysqldump of the table. Pages are stored as deltas against
+## the previous page (see app/page_deltas.py), which would point at the
+## wrong keyframes once the ids are stripped, so every exported page holds
+## all of its posts. Pages the retention job has moved to the archive tables
+## are exported too.
+##
+##   CS_ENV=production python3 export_pages.py subreddit_pages "2016-07-01 00:00:00" "2016-07-08 00:00:00"
+
+MODELS = {"subreddit_pages": SubredditPage, "front_pages": FrontPage}
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+def parse_time(value):
+    try:
+        return datetime.datetime.strptime(value, TIME_FORMAT)
+    except ValueError:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+
+def insert_statement(model, page, posts):
+    values = {
+        "created_at": literal(page.created_at.strftime(TIME_FORMAT), String()),
+        "page_type": page.page_type,
+        "page_data": json.dumps(posts),
+        "is_utc": page.is_utc,
+    }
+    if model is SubredditPage:
+        values["subreddit_id"] = page.subreddit_id
+    statement = model.__table__.insert().values(**values).prefix_with("IGNORE")
+    return str(statement.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+
+def series(db_session, model, start, end):
+    """(subreddit_id, page_type) of each series of pages in the range, in the
+    live or the archive table."""
+    found = []
+    for series_model in SERIES_MODELS[model]:
+        if model is FrontPage:
+            columns = [series_model.page_type]
+        else:
+            columns = [series_model.subreddit_id, series_model.page_type]
+        rows = db_session.query(*columns).filter(
+            series_model.created_at >= start, series_model.created_at <= end).distinct().all()
+        for row in rows:
+            key = (None if model is FrontPage else row.subreddit_id, PageType(row.page_type))
+            if key not in found:
+                found.append(key)
+    return found
+
+def export_pages(db_session, table_name, start, end, out):
+    model = MODELS[table_name]
+    exported = 0
+    for subreddit_id, page_type in series(db_session, model, start, end):
+        for page, posts in iter_pages(db_session, subreddit_id, page_type, start, end):
+            out.write(insert_statement(model, page, posts) + ";\n")
+            exported += 1
+    return exported
+
+if __name__ == "__main__":
+    table_name, start, end = sys.argv[1:4]
+    ENV = os.environ["CS_ENV"]
+    db_session = DbEngine(os.path.join(BASE_DIR, "config") + "/{env}.json".format(env=ENV)).new_session()
+
+    out_file = "{0}-{1}-noid.sql".format(end.split()[0], table_name)
+    with open(out_file, "x") as out:
+        exported = export_pages(db_session, table_name, parse_time(start), parse_time(end), out)
+    print("Exported {0} {1} to {2}".format(exported, table_name, out_file))
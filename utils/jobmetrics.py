@@ -0,0 +1,183 @@
+"""Per-job metrics for the rq jobs in app.controller.
+
+@profilable opens a job() around every job. While it is open, the reddit
+connection, RetryableDbSession.insert_retryable and the event handler report
+into it: reddit API calls and their latency, time spent connecting to reddit
+(and how many connects reused a cached client), rows inserted and rows dropped as
+duplicates per table, and time spent in each experiment's callbacks. When the
+job finishes, its duration and the statement counts from utils.querystats are
+added and the record is appended as one JSON line to a daily file in
+logs/metrics, so we can see which subreddit or experiment is using the workers.
+utils/email_db_report.py rolls these files up in the daily report.
+"""
+import contextlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import simplejson as json
+
+BASE_DIR = str(Path(__file__).parents[1])
+METRICS_DIR = str(Path(BASE_DIR, "logs", "metrics"))
+METRICS_FILENAME = "jobs_%s.jsonl"
+METRICS_FILENAME_DATE = "%Y%m%d"
+RETENTION_DAYS = 30
+
+_local = threading.local()
+
+
+class JobMetrics:
+    def __init__(self, name, args=None):
+        self.name = name
+        self.args = [a.name if hasattr(a, "name") else str(a) for a in (args or [])]
+        self.started_at = datetime.utcnow()
+        self.duration = None
+        self.status = None
+        self.reddit_calls = 0
+        self.reddit_time = 0.0
+        self.reddit_connects = 0
+        self.reddit_connects_cached = 0
+        self.reddit_connect_time = 0.0
+        self.db_statements = 0
+        self.db_time = 0.0
+        # table -> [rows attempted, rows inserted]
+        self.inserts = {}
+        # experiment name -> [callbacks run, seconds]
+        self.callbacks = {}
+
+    def __repr__(self):
+        return "<JobMetrics name=%s args=%s>" % (self.name, self.args)
+
+    def record_reddit_call(self, duration):
+        self.reddit_calls += 1
+        self.reddit_time += duration
+
+    def record_connect(self, duration, cached):
+        self.reddit_connects += 1
+        self.reddit_connects_cached += int(cached)
+        self.reddit_connect_time += duration
+
+    def record_insert(self, table, attempted, inserted):
+        counts = self.inserts.setdefault(table, [0, 0])
+        counts[0] += attempted
+        counts[1] += inserted
+
+    def record_callback(self, experiment, duration):
+        counts = self.callbacks.setdefault(experiment, [0, 0.0])
+        counts[0] += 1
+        counts[1] += duration
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "args": self.args,
+            "started_at": self.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "duration": self.duration,
+            "status": self.status,
+            "pid": os.getpid(),
+            "reddit_calls": self.reddit_calls,
+            "reddit_time": self.reddit_time,
+            "reddit_connects": self.reddit_connects,
+            "reddit_connects_cached": self.reddit_connects_cached,
+            "reddit_connect_time": self.reddit_connect_time,
+            "db_statements": self.db_statements,
+            "db_time": self.db_time,
+            "rows_inserted": sum(i for _, i in self.inserts.values()),
+            "rows_duplicated": sum(a - i for a, i in self.inserts.values()),
+            "inserts": {t: {"attempted": a, "inserted": i} for t, (a, i) in self.inserts.items()},
+            "callbacks": {e: {"count": c, "time": t} for e, (c, t) in self.callbacks.items()},
+        }
+
+    def write(self, metrics_dir=None):
+        metrics_dir = metrics_dir or METRICS_DIR
+        Path(metrics_dir).mkdir(parents=True, exist_ok=True)
+        path = Path(metrics_dir, METRICS_FILENAME % self.started_at.strftime(METRICS_FILENAME_DATE))
+        is_new_file = not path.exists()
+        # a single short append is atomic, so workers can share the file
+        with open(str(path), "a") as f:
+            f.write(json.dumps(self.as_dict()) + "\n")
+        if is_new_file:
+            remove_old_files(metrics_dir, self.started_at)
+
+
+def current():
+    return getattr(_local, "job", None)
+
+
+@contextlib.contextmanager
+def job(name, args=None, metrics_dir=None):
+    """Collect metrics for a job and write them when it finishes. Jobs called
+    from inside another job are counted as part of the outer job."""
+    if current() is not None:
+        yield current()
+        return
+
+    metrics = _local.job = JobMetrics(name, args)
+    start = time.perf_counter()
+    try:
+        yield metrics
+        metrics.status = "ok"
+    except:
+        metrics.status = "error"
+        raise
+    finally:
+        metrics.duration = time.perf_counter() - start
+        _local.job = None
+        metrics.write(metrics_dir)
+
+
+def record_reddit_call(duration):
+    metrics = current()
+    if metrics is not None:
+        metrics.record_reddit_call(duration)
+
+
+def record_connect(duration, cached):
+    metrics = current()
+    if metrics is not None:
+        metrics.record_connect(duration, cached)
+
+
+def record_insert(table, attempted, inserted):
+    metrics = current()
+    if metrics is not None:
+        metrics.record_insert(table, attempted, inserted)
+
+
+def record_callback(experiment, duration):
+    metrics = current()
+    if metrics is not None:
+        metrics.record_callback(experiment, duration)
+
+
+def remove_old_files(metrics_dir=None, now=None, days=RETENTION_DAYS):
+    metrics_dir = metrics_dir or METRICS_DIR
+    now = now or datetime.utcnow()
+    oldest = (now - timedelta(days=days)).strftime(METRICS_FILENAME_DATE)
+    for path in Path(metrics_dir).glob(METRICS_FILENAME % "*"):
+        if path.stem[len("jobs_"):] < oldest:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass # removed by another worker
+
+
+def read_metrics(start, end, metrics_dir=None):
+    """Yield the job records that started between the start and end datetimes."""
+    metrics_dir = metrics_dir or METRICS_DIR
+    day = datetime.combine(start.date(), datetime.min.time())
+    while day <= end:
+        path = Path(metrics_dir, METRICS_FILENAME % day.strftime(METRICS_FILENAME_DATE))
+        if path.exists():
+            with open(str(path), "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # a partially written line from a killed worker
+                    started_at = datetime.strptime(record["started_at"], "%Y-%m-%d %H:%M:%S")
+                    if start <= started_at <= end:
+                        yield record
+        day += timedelta(days=1)
@@ -2,55 +2,207 @@
 
 import argparse
 import cProfile, pstats
+import fcntl
+import os
+import signal
 import sys
-from collections import defaultdict, namedtuple
+import threading
+from collections import Counter, defaultdict, namedtuple
 from datetime import datetime, date, time, timedelta
 from functools import wraps
-from io import StringIO
 from pathlib import Path
 from statistics import mean, median, stdev
 
-from utils.common import LOGS_DIR
+import app.cs_logger
+from utils import jobmetrics, querystats
+from utils.common import BASE_DIR, LOGS_DIR
+_log = app.cs_logger.get_logger(os.environ["CS_ENV"], BASE_DIR)
+
 PROFILES_DIR = str(Path(LOGS_DIR, "profiles"))
 Path(PROFILES_DIR).mkdir(parents=True, exist_ok=True)
 
 ARG_DATE = "%Y%m%d"
 ARG_DATETIME = "%s-%%H%%M" % ARG_DATE
-CPROFILE_DATETIME = "%a %b %d %H:%M:%S %Y"
 FILENAME = "%s_%s_%s.%s"
 FILENAME_DATETIME = "%Y%m%d%H%M%S%f"
+SAMPLES_FILENAME = "%s_%s.collapsed"
+SAMPLES_FILENAME_DATE = "%Y%m%d"
+SAMPLES_RETENTION_DAYS = 14
 SORT_KEY = "cum_time_mean"
 
+# _profile=True (or "cprofile") runs a full cProfile of the job.
+# _profile="sample" runs the sampling profiler, which is cheap enough to run on
+# every job; setting CS_PROFILE_SAMPLING=1 makes it the default for all jobs.
+PROFILE_CPROFILE = "cprofile"
+PROFILE_SAMPLE = "sample"
+SAMPLING_DEFAULT = bool(int(os.environ.get("CS_PROFILE_SAMPLING", 0)))
+SAMPLING_INTERVAL = float(os.environ.get("CS_PROFILE_SAMPLING_INTERVAL", 0.01))
+
 def profilable(fn):
     @wraps(fn)
     def _run_profiler(*args, **kwargs):
         profiling_enabled = kwargs.pop("_profile", False)
         profiles_dir = kwargs.pop("_profiles_dir", PROFILES_DIR)
-
-        if not profiling_enabled:
-            return fn(*args, **kwargs)
-        
-        profile = cProfile.Profile()
-        start_dt = datetime.now().strftime(FILENAME_DATETIME)
-        try:
-            profile.enable()
-            result = fn(*args, **kwargs)
-        finally:
-            profile.disable()
-        end_dt = datetime.now().strftime(FILENAME_DATETIME)
-        
-        profile_filename = FILENAME % (start_dt, end_dt, fn.__name__, 'profile')
-        stats_filename = FILENAME % (start_dt, end_dt, fn.__name__, 'txt')
-       
-        with open(str(Path(profiles_dir, stats_filename)), "w") as f:
-            stats = pstats.Stats(profile, stream=f)
-            stats.print_stats()
-            stats.dump_stats(str(Path(profiles_dir, profile_filename)))
-        
-        return result
+        if not profiling_enabled and SAMPLING_DEFAULT:
+            profiling_enabled = PROFILE_SAMPLE
+
+        with jobmetrics.job(fn.__name__, args) as job_metrics, \
+                querystats.scope(fn.__name__) as query_stats:
+            try:
+                if not profiling_enabled:
+                    return fn(*args, **kwargs)
+                if profiling_enabled == PROFILE_SAMPLE:
+                    return _run_sampler(fn, args, kwargs, profiles_dir)
+                return _run_cprofile(fn, args, kwargs, profiles_dir, query_stats)
+            finally:
+                # a job called from another job shares its metrics; the outer
+                # job's statements include the inner job's, and are set last
+                job_metrics.db_statements = query_stats.count
+                job_metrics.db_time = query_stats.total_time
+                if query_stats.count:
+                    _log.info("Job %s" % query_stats.summary())
 
     return _run_profiler
 
+def _run_cprofile(fn, args, kwargs, profiles_dir, query_stats):
+    profile = cProfile.Profile()
+    start_dt = datetime.now().strftime(FILENAME_DATETIME)
+    try:
+        profile.enable()
+        result = fn(*args, **kwargs)
+    finally:
+        profile.disable()
+    end_dt = datetime.now().strftime(FILENAME_DATETIME)
+
+    profile_filename = FILENAME % (start_dt, end_dt, fn.__name__, 'profile')
+    stats_filename = FILENAME % (start_dt, end_dt, fn.__name__, 'txt')
+    queries_filename = FILENAME % (start_dt, end_dt, fn.__name__, 'queries.json')
+
+    with open(str(Path(profiles_dir, stats_filename)), "w") as f:
+        stats = pstats.Stats(profile, stream=f)
+        stats.print_stats()
+        stats.dump_stats(str(Path(profiles_dir, profile_filename)))
+
+    if query_stats.count:
+        query_stats.write(str(Path(profiles_dir, queries_filename)))
+
+    return result
+
+def _run_sampler(fn, args, kwargs, profiles_dir):
+    sampler = Sampler()
+    if not sampler.start():
+        # an outer job is already being sampled, and will include this one
+        return fn(*args, **kwargs)
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        sampler.stop()
+        samples_filename = SAMPLES_FILENAME % (datetime.now().strftime(SAMPLES_FILENAME_DATE), fn.__name__)
+        merge_samples(str(Path(profiles_dir, samples_filename)), sampler.samples)
+    return result
+
+class Sampler:
+    """A statistical profiler. Every interval it records the stack of the
+    thread that started it as one collapsed stack line ("outer;...;inner"),
+    counting how often each stack is seen.
+
+    With clock="wall" (the default) a timer thread samples the stack, so time
+    spent waiting on reddit or the database shows up. With clock="cpu" a
+    SIGPROF interval timer samples on-CPU time only; this only works from the
+    main thread. SIGALRM is left alone because rq uses it for job timeouts."""
+
+    _active = threading.local()
+
+    def __init__(self, interval=SAMPLING_INTERVAL, clock="wall"):
+        self.interval = interval
+        self.clock = clock
+        self.samples = Counter()
+        self._thread_id = None
+        self._stopped = threading.Event()
+        self._timer = None
+
+    def _record(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            filename = code.co_filename
+            if filename.startswith(BASE_DIR):
+                filename = filename[len(BASE_DIR) + 1:]
+            stack.append("%s (%s:%d)" % (code.co_name, filename, code.co_firstlineno))
+            frame = frame.f_back
+        if stack:
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _sample_thread(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            self._record(frame)
+
+    def _handle_sigprof(self, signum, frame):
+        self._record(frame)
+
+    def start(self):
+        if getattr(Sampler._active, "sampler", None) is not None:
+            return False
+        Sampler._active.sampler = self
+        self._thread_id = threading.get_ident()
+        if self.clock == "cpu":
+            signal.signal(signal.SIGPROF, self._handle_sigprof)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._timer = threading.Thread(target=self._sample_thread, daemon=True)
+            self._timer.start()
+        return True
+
+    def stop(self):
+        if self.clock == "cpu":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        else:
+            self._stopped.set()
+            self._timer.join()
+        Sampler._active.sampler = None
+
+def read_samples(path):
+    samples = Counter()
+    with open(path, "r") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                samples[stack] += int(count)
+    return samples
+
+def merge_samples(path, samples):
+    """Add samples to the collapsed stacks file at path. Files are per job
+    name and per day, so they rotate daily and stay small: one line per
+    distinct stack. Files older than SAMPLES_RETENTION_DAYS are removed."""
+    if not samples:
+        return
+    path = Path(path)
+    with open(str(path.with_suffix(".lock")), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        is_new_file = not path.exists()
+        merged = Counter() if is_new_file else read_samples(str(path))
+        merged.update(samples)
+        tmp_path = path.with_suffix(".tmp")
+        with open(str(tmp_path), "w") as f:
+            for stack, count in merged.most_common():
+                f.write("%s %d\n" % (stack, count))
+        os.replace(str(tmp_path), str(path))
+
+    if is_new_file:
+        oldest = (datetime.now() - timedelta(days=SAMPLES_RETENTION_DAYS)).strftime(SAMPLES_FILENAME_DATE)
+        for old_path in path.parent.glob("*.collapsed"):
+            if old_path.name[:len(oldest)] < oldest:
+                for suffix in (".collapsed", ".lock"):
+                    try:
+                        old_path.with_suffix(suffix).unlink()
+                    except FileNotFoundError:
+                        pass
+
+def _stdev(values):
+    return stdev(values) if len(values) > 1 else 0.0
+
 class Aggregator:
     Result = namedtuple("Result", ["num_calls_median", "total_time_mean",
         "total_time_stdev", "cum_time_mean", "cum_time_stdev"])
@@ -62,7 +214,9 @@ class Aggregator:
         
         self._modified = False
         self._profiles = {}
+        self._sample_files = {}
         self._results = {}
+        self._samples = Counter()
         self._summary = Aggregator.Summary(None, None)
 
         self.paths = set()
@@ -76,31 +230,45 @@ class Aggregator:
         profile = self._profiles[path.name] = {}
         profile["functions"] = {}
 
-        with StringIO() as stream:
-            stats = pstats.Stats(str(path), stream=stream)
-            stats.print_stats()
-            pstats_output = stream.getvalue().split("\n")
+        stats = pstats.Stats(str(path))
+        profile["run_time"] = stats.total_tt
+        profile["date_range"] = self._profile_date_range(path, stats.total_tt)
 
-        run_time_idx = pstats_output[2].find("in")
-        run_time = float(pstats_output[2][run_time_idx:].split(" ")[1])
-        profile["run_time"] = run_time
-        
-        start_dt = datetime.strptime(pstats_output[0][:24], CPROFILE_DATETIME)
-        end_dt = start_dt + timedelta(seconds=run_time)
-        profile["date_range"] = (start_dt, end_dt)
+        # func -> (primitive calls, calls, total time, cumulative time, callers)
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            profile["functions"][pstats.func_std_string(func)] = {
+                "num_calls": cc,
+                "total_time": tt,
+                "cum_time": ct}
 
-        for line in pstats_output[7:-3]:
-            profile["functions"][line[46:]] = {
-                "num_calls": int(line[0:9].split("/")[-1]),
-                "total_time": float(line[9:18]),
-                "cum_time": float(line[27:36])}
+        self._modified = True
 
+    def _add_samples(self, path):
+        try:
+            day = datetime.strptime(path.name.split("_")[0], SAMPLES_FILENAME_DATE)
+        except ValueError:
+            day = datetime.fromtimestamp(path.stat().st_mtime)
+        self._sample_files[path.name] = {
+            "date_range": (day, day + timedelta(days=1) - timedelta(microseconds=1)),
+            "samples": read_samples(str(path))}
         self._modified = True
 
+    @staticmethod
+    def _profile_date_range(path, run_time):
+        # profiles written by @profilable are named start_end_function.profile
+        try:
+            start, end = path.name.split("_")[:2]
+            return (datetime.strptime(start, FILENAME_DATETIME),
+                    datetime.strptime(end, FILENAME_DATETIME))
+        except ValueError:
+            end_dt = datetime.fromtimestamp(path.stat().st_mtime)
+            return (end_dt - timedelta(seconds=run_time), end_dt)
+
     def _aggregate(self):
         if not self._modified:
             return
         
+        self._results = {}
         functions = defaultdict(lambda: defaultdict(list))
         for profile in filter(self._validate_profile, self._profiles.values()):
             for function, values in profile["functions"].items():
@@ -112,14 +280,20 @@ class Aggregator:
             self._results[function] = Aggregator.Result(
                 num_calls_median = int(median(lists["num_calls"])),
                 total_time_mean = mean(lists["total_time"]),
-                total_time_stdev = stdev(lists["total_time"]),
+                total_time_stdev = _stdev(lists["total_time"]),
                 cum_time_mean = mean(lists["cum_time"]),
-                cum_time_stdev = stdev(lists["cum_time"]))
+                cum_time_stdev = _stdev(lists["cum_time"]))
         
-        run_times = lambda: (p["run_time"] for p in self._profiles.values())
-        self._summary = Aggregator.Summary(
-            run_time_mean = mean(run_times()),
-            run_time_stdev = stdev(run_times()))
+        run_times = [p["run_time"] for p in filter(self._validate_profile, self._profiles.values())]
+        self._summary = Aggregator.Summary(None, None)
+        if run_times:
+            self._summary = Aggregator.Summary(
+                run_time_mean = mean(run_times),
+                run_time_stdev = _stdev(run_times))
+
+        self._samples = Counter()
+        for sample_file in filter(self._validate_samples, self._sample_files.values()):
+            self._samples.update(sample_file["samples"])
 
         self._modified = False
 
@@ -130,16 +304,28 @@ class Aggregator:
 
         return agg_start_dt <= start_dt <= end_dt <= agg_end_dt
 
+    def _validate_samples(self, sample_file):
+        # sample files cover a whole day, so include any that overlap
+        start_dt, end_dt = sample_file["date_range"]
+        agg_start_dt = self.start_dt if self.start_dt else datetime.min
+        agg_end_dt = self.end_dt if self.end_dt else datetime.max
+
+        return start_dt <= agg_end_dt and agg_start_dt <= end_dt
+
     def add(self, *paths, recursive=False):
         glob_fn = Path.rglob if recursive else Path.glob
 
-        paths = (p.resolve() for p in paths)
-        globs = (glob_fn(p, "*.profile") if p.is_dir() else [p] for p in paths)
+        paths = [p.resolve() for p in paths]
+        globs = ([f for pattern in ("*.profile", "*.collapsed") for f in glob_fn(p, pattern)]
+                 if p.is_dir() else [p] for p in paths)
         files = [f for g in globs for f in g if f.is_file()]
         
         self.paths.update(files)
         for f in files:
-            self._add_profile(f)
+            if f.suffix == ".collapsed":
+                self._add_samples(f)
+            else:
+                self._add_profile(f)
 
     def print_results(self, key=SORT_KEY, stream=sys.stdout, newline=False):
         stream.write("ordered by: %s\n\n" % key)
@@ -163,6 +349,28 @@ class Aggregator:
         if newline:
             stream.write("\n")
 
+    def print_samples(self, limit=30, stream=sys.stdout, newline=False):
+        """Functions ordered by the share of samples in which they were
+        running (self) or on the stack (total)."""
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        num_samples = sum(self.samples.values()) or 1
+
+        stream.write("samples: %d\n\n" % sum(self.samples.values()))
+        stream.write("%8s%8s%9s  function (filename:lineno)\n" % ("self%", "total%", "samples"))
+        for frame, count in total_counts.most_common(limit):
+            stream.write("%8.1f" % (100.0 * self_counts[frame] / num_samples))
+            stream.write("%8.1f" % (100.0 * count / num_samples))
+            stream.write("%9d" % count)
+            stream.write("  %s\n" % frame)
+
+        if newline:
+            stream.write("\n")
+
     def print_summary(self, stream=sys.stdout, newline=False):
         stream.write("runtime_mean: %8.3f\n" % self.summary.run_time_mean)
         stream.write("runtime_stdev: %7.3f\n" % self.summary.run_time_stdev)
@@ -180,7 +388,7 @@ class Aggregator:
 
     @end_dt.setter
     def end_dt(self, val):
-        self.start_dt = val
+        self._end_dt = val
         self._modified = True
 
     @property
@@ -198,9 +406,14 @@ class Aggregator:
 
     @start_dt.setter
     def start_dt(self, val):
-        self.start_dt = val
+        self._start_dt = val
         self._modified = True
 
+    @property
+    def samples(self):
+        self._aggregate()
+        return self._samples
+
     @property
     def summary(self):
         self._aggregate()
@@ -245,8 +458,11 @@ def parse_args():
 def main():
     args = parse_args()
     agg = Aggregator(**args)
-    agg.print_summary(newline=True)
-    agg.print_results(key=args["sort"])
+    if agg.profiles:
+        agg.print_summary(newline=True)
+        agg.print_results(key=args["sort"], newline=bool(agg.samples))
+    if agg.samples:
+        agg.print_samples()
     
 if __name__ == '__main__':
     try:
@@ -0,0 +1,147 @@
+"""Counts the SQL statements a job sends to the database, and how long they take.
+
+DbEngine instruments every engine it creates with instrument(). Statements are
+only recorded while a scope() is open, which @profilable does for every job, so
+outside of jobs the listeners cost a thread-local lookup. Within a scope each
+statement costs two perf_counter() calls and a dictionary update keyed by the
+statement text, so this is cheap enough to leave on in production. Statements
+are normalized (literals and IN/VALUES lists collapsed) only when the results
+are read.
+"""
+import contextlib
+import re
+import threading
+import time
+from functools import lru_cache
+
+import simplejson as json
+
+TOP_N = 10
+
+_local = threading.local()
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST_RE = re.compile(r"\(\s*(?:(?:\?|%s|%\(\w+\)s|NULL)\s*,\s*)+(?:\?|%s|%\(\w+\)s|NULL)\s*\)")
+_REPEATED_LIST_RE = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize(statement):
+    statement = _WHITESPACE_RE.sub(" ", statement).strip()
+    statement = _STRING_RE.sub("?", statement)
+    statement = _NUMBER_RE.sub("?", statement)
+    statement = _PARAM_LIST_RE.sub("(...)", statement)
+    return _REPEATED_LIST_RE.sub("(...)", statement)
+
+
+class QueryStats:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_time = 0.0
+        # statement -> [count, total time, max time]
+        self.statements = {}
+
+    def __repr__(self):
+        return "<QueryStats name=%s count=%d total_time=%.3f>" % (
+            self.name, self.count, self.total_time)
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        stats = self.statements.get(statement)
+        if stats is None:
+            self.statements[statement] = [1, duration, duration]
+        else:
+            stats[0] += 1
+            stats[1] += duration
+            if duration > stats[2]:
+                stats[2] = duration
+
+    def slowest(self, n=TOP_N):
+        """The n normalized statements with the most total time, as
+        (statement, count, total time, max time)."""
+        merged = {}
+        for statement, (count, total_time, max_time) in self.statements.items():
+            stats = merged.setdefault(normalize(statement), [0, 0.0, 0.0])
+            stats[0] += count
+            stats[1] += total_time
+            stats[2] = max(stats[2], max_time)
+        ranked = sorted(merged.items(), key=lambda s: s[1][1], reverse=True)
+        return [(s, c, t, m) for s, (c, t, m) in ranked[:n]]
+
+    def summary(self, n=3):
+        slowest = "; ".join("%.3fs/%dx %s" % (t, c, s[:120]) for s, c, t, _ in self.slowest(n))
+        return "%s: %d statements, %.3fs in database. Slowest: %s" % (
+            self.name, self.count, self.total_time, slowest or "none")
+
+    def as_dict(self, n=TOP_N):
+        return {
+            "name": self.name,
+            "count": self.count,
+            "total_time": self.total_time,
+            "distinct_statements": len(set(normalize(s) for s in self.statements)),
+            "slowest": [{"statement": s, "count": c, "total_time": t, "max_time": m}
+                        for s, c, t, m in self.slowest(n)]
+        }
+
+    def write(self, path, n=TOP_N):
+        with open(path, "w") as f:
+            f.write(json.dumps(self.as_dict(n), indent=2))
+
+
+def _scopes():
+    scopes = getattr(_local, "scopes", None)
+    if scopes is None:
+        scopes = _local.scopes = []
+    return scopes
+
+
+def current():
+    scopes = _scopes()
+    return scopes[-1] if scopes else None
+
+
+@contextlib.contextmanager
+def scope(name):
+    """Record statements executed on this thread into a new QueryStats.
+    Scopes nest; a statement is recorded in every open scope."""
+    stats = QueryStats(name)
+    scopes = _scopes()
+    scopes.append(stats)
+    try:
+        yield stats
+    finally:
+        scopes.remove(stats)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _scopes():
+        conn.info.setdefault("querystats_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    scopes = _scopes()
+    starts = conn.info.get("querystats_start")
+    if not scopes or not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    for stats in scopes:
+        stats.record(statement, duration)
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("querystats_start") if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument(engine):
+    from sqlalchemy import event
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    return engine
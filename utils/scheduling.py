@@ -0,0 +1,211 @@
+"""Overlap guard for the recurring jobs scheduled by schedule_jobs.py and
+schedule_experiments.py.
+
+rq-scheduler enqueues a recurring job every interval whether or not the last
+run has finished, so a comments or modlog job that runs longer than its
+interval piles up copies that contend for the same rows and rate limit.
+@coalesced jobs, when run by an rq worker as the scheduled job itself, take a
+Redis lock for their (function, args) and:
+
+  * skip the tick if another copy is still running
+  * skip the tick if it was enqueued before the last run started, since that
+    run already covered it; a backlog of ticks is merged into one run
+
+The lock expires LOCK_TTL seconds after it was last renewed, and a thread
+renews it while the job runs, so a work horse that dies without releasing it
+(killed, out of memory, a worker restart) holds up the job for at most
+LOCK_TTL seconds.
+
+Called outside a worker, or from inside another job, they run as usual.
+Skipped ticks, queue lag (from enqueue to start) and the last run are kept in
+a Redis hash per (function, args), which `manage_scheduled_jobs.py show` prints.
+
+Jobs scheduled with an "adaptive" entry in their meta ({"min_interval",
+"max_interval", "target_items"}) also have their interval adjusted after each
+run from the number of new items the job returns: quiet subreddits are polled
+less often and busy ones more often, within the configured bounds.
+rq-scheduler reads job.meta["interval"] each time it reschedules the job.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import timezone
+from functools import wraps
+
+from rq import get_current_job
+
+KEY_PREFIX = "civilservant:{env}:jobs:{name}:{args}"
+LOCK_TTL = 60 # seconds a lock outlives the last renewal
+LOCK_RENEW_INTERVAL = 20
+SCHEDULED_JOBS_KEY = "rq:scheduler:scheduled_jobs" # rq_scheduler.Scheduler.scheduled_jobs_key
+# the most an adaptive interval changes after one run, so one unusually busy
+# or quiet poll doesn't swing it from one bound to the other
+MAX_INTERVAL_CHANGE = 2.0
+
+
+def _args_key(args):
+    return ",".join(a.name if hasattr(a, "name") else str(a) for a in args)
+
+
+def _timestamp(dt):
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc) # rq stores utc
+    return dt.timestamp()
+
+
+def adaptive_interval(interval, new_items, min_interval, max_interval, target_items):
+    """The next interval for a job that found new_items at this interval,
+    aiming for target_items new items per poll."""
+    if new_items > 0:
+        factor = float(target_items) / new_items
+    else:
+        factor = MAX_INTERVAL_CHANGE
+    factor = min(max(factor, 1 / MAX_INTERVAL_CHANGE), MAX_INTERVAL_CHANGE)
+    return int(min(max(interval * factor, min_interval), max_interval))
+
+
+class JobGuard:
+    def __init__(self, connection, name, args, env=None):
+        self.connection = connection
+        self.name = name
+        key = KEY_PREFIX.format(
+            env=env or os.environ["CS_ENV"],
+            name=name,
+            args=_args_key(args))
+        self.lock_key = key + ":lock"
+        self.stats_key = key + ":stats"
+        self.token = None
+        self._stop_renewing = None
+
+    def acquire(self):
+        token = uuid.uuid4().hex
+        if self.connection.set(self.lock_key, token, nx=True, ex=LOCK_TTL):
+            self.token = token
+            return True
+        return False
+
+    def renew(self):
+        """Push back the expiry of our lock. False if it is no longer ours."""
+        lock = self.connection.get(self.lock_key)
+        if lock is None or lock.decode() != self.token:
+            return False
+        self.connection.expire(self.lock_key, LOCK_TTL)
+        return True
+
+    def _keep_renewing(self, stop):
+        while not stop.wait(LOCK_RENEW_INTERVAL):
+            try:
+                if not self.renew():
+                    return
+            except Exception:
+                # a missed renewal is retried; the lock outlives a few of them
+                pass
+
+    def start_renewing(self):
+        self._stop_renewing = threading.Event()
+        thread = threading.Thread(target=self._keep_renewing, args=(self._stop_renewing,),
+                                  name="JobGuard " + self.lock_key)
+        # dies with the work horse, leaving the lock to expire
+        thread.daemon = True
+        thread.start()
+
+    def release(self):
+        if self._stop_renewing is not None:
+            self._stop_renewing.set()
+            self._stop_renewing = None
+        if self.token is None:
+            return
+        # only delete our own lock, not one taken after ours expired
+        lock = self.connection.get(self.lock_key)
+        if lock is not None and lock.decode() == self.token:
+            self.connection.delete(self.lock_key)
+        self.token = None
+
+    def stats(self):
+        stats = {}
+        for field, value in self.connection.hgetall(self.stats_key).items():
+            stats[field.decode()] = float(value)
+        return stats
+
+    def record_skip(self, reason):
+        self.connection.hincrby(self.stats_key, "skipped_" + reason, 1)
+
+    def record_start(self, started_at, lag):
+        max_lag = self.connection.hget(self.stats_key, "max_lag")
+        self.connection.hset(self.stats_key, mapping={
+            "last_started_at": started_at,
+            "last_lag": lag,
+            "max_lag": max(lag, float(max_lag or 0))})
+
+    def record_finish(self, started_at):
+        finished_at = time.time()
+        self.connection.hincrby(self.stats_key, "runs", 1)
+        self.connection.hset(self.stats_key, mapping={
+            "last_finished_at": finished_at,
+            "last_duration": finished_at - started_at})
+
+    def adapt_interval(self, job, new_items, finished_at):
+        adaptive = job.meta.get("adaptive")
+        if not adaptive or not isinstance(new_items, int) or "interval" not in job.meta:
+            return None
+        interval = adaptive_interval(job.meta["interval"], new_items, **adaptive)
+        self.connection.hset(self.stats_key, mapping={"new_items": new_items, "interval": interval})
+        if interval != job.meta["interval"]:
+            job.meta["interval"] = interval
+            job.save_meta()
+            # the scheduler set the next run from the old interval when it
+            # enqueued this one; move it, if the job is still scheduled
+            self.connection.zadd(SCHEDULED_JOBS_KEY, {job.id: finished_at + interval}, xx=True)
+        return interval
+
+    def run(self, job, fn, args, kwargs):
+        enqueued_at = _timestamp(job.enqueued_at)
+        if not self.acquire():
+            self.record_skip("running")
+            return None
+        self.start_renewing()
+        try:
+            last_started_at = self.stats().get("last_started_at")
+            if enqueued_at is not None and last_started_at is not None \
+                    and enqueued_at < last_started_at:
+                self.record_skip("merged")
+                return None
+
+            started_at = time.time()
+            lag = started_at - enqueued_at if enqueued_at is not None else 0.0
+            self.record_start(started_at, lag)
+            result = fn(*args, **kwargs)
+            self.record_finish(started_at)
+            self.adapt_interval(job, result, time.time())
+            return result
+        finally:
+            self.release()
+
+
+def coalesced(fn):
+    name = "%s.%s" % (fn.__module__, fn.__name__)
+
+    @wraps(fn)
+    def _run_coalesced(*args, **kwargs):
+        job = get_current_job()
+        # only guard the scheduled job itself, not jobs it calls
+        if job is None or job.func_name != name:
+            return fn(*args, **kwargs)
+        return JobGuard(job.connection, name, args).run(job, fn, args, kwargs)
+
+    return _run_coalesced
+
+
+def job_stats(connection, job):
+    """The overlap stats for a scheduled rq job."""
+    return JobGuard(connection, job.func_name, job.args).stats()
+
+
+def release_job_lock(connection, job):
+    """Delete the lock of a scheduled rq job whose work horse was killed, so
+    its JobGuard couldn't release it; otherwise later runs of the job are
+    skipped until the lock expires."""
+    connection.delete(JobGuard(connection, job.func_name, job.args).lock_key)
@@ -0,0 +1,82 @@
+"""Routing of each subreddit's jobs to one of several rq queues.
+
+With CS_QUEUE_SHARDS set, the jobs for a subreddit go to the queue
+"{env}:shard-{n}", where the shard is picked by consistent hashing on the
+subreddit name. Jobs that belong to no one subreddit (the front page,
+retention) stay on the CS_ENV queue.
+"""
+import bisect
+import hashlib
+import os
+from functools import lru_cache
+
+SHARDS_VARIABLE = "CS_QUEUE_SHARDS"
+QUEUE_NAME = "{env}:shard-{shard}"
+# points on the ring per shard, so that subreddits spread evenly
+REPLICAS = 100
+
+
+def _hash(key):
+    # not hash(), which is salted differently in every process
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    def __init__(self, nodes, replicas=REPLICAS):
+        self.nodes = list(nodes)
+        self.ring = sorted((_hash("{0}:{1}".format(node, i)), node)
+                           for node in self.nodes for i in range(replicas))
+        self.points = [point for point, node in self.ring]
+
+    def node_for(self, key):
+        """The node that owns key: the first on the ring at or after it."""
+        if len(self.ring) == 0:
+            raise ValueError("HashRing has no nodes")
+        i = bisect.bisect(self.points, _hash(key)) % len(self.ring)
+        return self.ring[i][1]
+
+
+@lru_cache(maxsize=None)
+def _ring(shards):
+    return HashRing(range(shards))
+
+
+def shard_count(shards=None):
+    """The number of shards, from CS_QUEUE_SHARDS unless given; 0 when
+    queues aren't sharded."""
+    if shards is None:
+        shards = os.environ.get(SHARDS_VARIABLE) or 0
+    return int(shards)
+
+
+def shard_queue_names(shards=None, env=None):
+    """The name of every shard's queue."""
+    env = env or os.environ["CS_ENV"]
+    return [QUEUE_NAME.format(env=env, shard=shard) for shard in range(shard_count(shards))]
+
+
+def shard_for(subreddit, shards=None):
+    """The shard of a subreddit's jobs, or None when queues aren't sharded."""
+    shards = shard_count(shards)
+    if shards == 0 or subreddit is None:
+        return None
+    # reddit treats subreddit names case-insensitively
+    return _ring(shards).node_for(subreddit.lower())
+
+
+def queue_name(subreddit=None, shards=None, env=None):
+    """The queue for jobs about a subreddit: its shard's queue, or the
+    CS_ENV queue when queues aren't sharded or subreddit is None."""
+    env = env or os.environ["CS_ENV"]
+    shard = shard_for(subreddit, shards)
+    if shard is None:
+        return env
+    return QUEUE_NAME.format(env=env, shard=shard)
+
+
+def group_by_queue(subreddits, shards=None, env=None):
+    """{queue name: [subreddits]}, keeping the subreddits in order."""
+    groups = {}
+    for subreddit in subreddits:
+        groups.setdefault(queue_name(subreddit, shards, env), []).append(subreddit)
+    return groups
@@ -3,9 +3,13 @@
 import argparse
 import email.message
 import json
+import math
 import os
 import socket
 import subprocess
+import sys
+import time
+from datetime import timezone
 from pathlib import Path
 from smtplib import SMTP
 
@@ -13,12 +17,28 @@ from psutil import Process, process_iter, wait_procs
 from psutil import ZombieProcess, NoSuchProcess, AccessDenied
 
 BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.append(str(BASE_DIR))
+
+from utils.scheduling import job_stats, release_job_lock
+from utils.sharding import shard_queue_names
+
 EMAIL_CONFIG_PATH = Path(BASE_DIR, "config", "email_worker_restart.json")
 ENV = os.environ["CS_ENV"]
 HOSTNAME = socket.gethostname()
 SMTP_HOST = "localhost"
 SMTP_PORT = 25
 
+# supervisor defaults, see WorkerSupervisor
+SUPERVISE_INTERVAL = 30
+JOBS_PER_WORKER = 10
+STUCK_FACTOR = 3.0
+STUCK_AFTER = 3600 # for jobs that haven't finished a run before
+MIN_EXPECTED_DURATION = 300
+HEARTBEAT_TIMEOUT = 600 # rq's default worker_ttl is 420
+STARTUP_GRACE = 300
+SUPERVISOR_OPTIONS = ["max_count", "queues", "jobs_per_worker", "interval",
+                      "stuck_factor", "stuck_after"]
+
 
 def parse_args():
     """Parse command line arguments."""
@@ -34,6 +54,35 @@ def parse_args():
                         help="Send email notifications as needed.")
     parser.add_argument("-s", "--screen", required=True,
                         help="The name of the target screen.")
+    parser.add_argument("-S", "--shards", type=int, default=None,
+                        help="Keep --min-count processes for each of this "
+                             "many queue shards (see utils/sharding.py), "
+                             "running the command with {queue} replaced by "
+                             "the shard's queue, in a screen per shard.")
+
+    supervise = parser.add_argument_group(
+        "supervisor", "Supervise rq workers from their heartbeats in Redis.")
+    supervise.add_argument("--supervise", action="store_true", default=False,
+                           help="Restart dead and stuck rq workers, and "
+                                "scale them with the queue depth.")
+    supervise.add_argument("-M", "--max-count", type=int, default=None,
+                           help="The most processes to scale up to "
+                                "(default: --min-count).")
+    supervise.add_argument("-q", "--queue", dest="queues", action="append",
+                           help="A queue the workers listen to; may be "
+                                "given more than once (default: CS_ENV).")
+    supervise.add_argument("--jobs-per-worker", type=int,
+                           default=JOBS_PER_WORKER,
+                           help="Queued jobs per worker to scale up at.")
+    supervise.add_argument("-i", "--interval", type=int,
+                           default=SUPERVISE_INTERVAL,
+                           help="Seconds between checks.")
+    supervise.add_argument("--stuck-factor", type=float, default=STUCK_FACTOR,
+                           help="A job is stuck after running this many "
+                                "times as long as its last run.")
+    supervise.add_argument("--stuck-after", type=int, default=STUCK_AFTER,
+                           help="Seconds after which a job that has no "
+                                "previous run is stuck.")
 
     mutex = parser.add_mutually_exclusive_group()
     mutex.add_argument("-d", "--daemon", action="store_true", default=False,
@@ -41,12 +90,26 @@ def parse_args():
     mutex.add_argument("-D", "--dry-run", action="store_true", default=False,
                        help="Just output commands rather than running them.")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.shards is not None and "{queue}" not in args.cmdline:
+        parser.error("--shards needs a command with a {queue} placeholder")
+    if args.shards is not None and args.queues:
+        parser.error("--shards supervises each shard's queue; don't give --queue")
+    if not args.supervise:
+        for option in ["max_count", "queues"]:
+            if getattr(args, option):
+                parser.error("--{0} needs --supervise".format(option.replace("_", "-")))
+    if args.max_count is not None and args.max_count < args.min_count:
+        parser.error("--max-count is less than --min-count")
+    return args
 
 
 class WorkerMonitor:
     """Monitor and respawn worker processes when necessary."""
 
+    # seconds to wait for a process to exit between checks
+    poll_interval = 3
+
     def __init__(self, cmdline, min_count, screen, exclude_forks=False,
                  notify=False, daemon=False, dry_run=False):
         self._current_process = Process()
@@ -65,10 +128,13 @@ class WorkerMonitor:
 
     def _notify(self, count):
         """Send a notification email that workers needed to be restarted."""
+        subject = f"{count} worker(s) were just restarted on {HOSTNAME}."
+        self._send_email(subject, f"{subject}\n\nWorker process: {self.cmdline}")
+
+    def _send_email(self, subject, body):
+        """Send a notification email to the configured recipients."""
         from_, recipients = self._read_email_config()
         if recipients:
-            subject = f"{count} worker(s) were just restarted on {HOSTNAME}."
-            body = f"{subject}\n\nWorker process: {self.cmdline}"
             for recipient in recipients:
                 with SMTP(SMTP_HOST, SMTP_PORT) as smtp:
                     message = email.message.EmailMessage()
@@ -135,37 +201,328 @@ class WorkerMonitor:
         else:
             self.run_once()
 
+    def respawn(self):
+        """Add processes up to the minimum count and return the running
+        processes."""
+        # Retrieves processes twice to ensure the list contains the newly
+        # added processes since there is no way to return their individual
+        # pids due to launching them wrapped in a screen
+        processes = list(self.fetch_processes())
+        num_needed = max(self.min_count - len(processes), 0)
+        self._screen_add_processes(num_needed)
+        if self.notify and num_needed > 0:
+            self._notify(num_needed)
+        return list(self.fetch_processes())
+
     def run_daemon(self):
         """Run the worker monitor continuously."""
         self._screen_init()
         self._screen_update_env()
         while True:
-            # Retrieves processes twice to ensure the list contains the newly
-            # added processes since there is no way to return their individual
-            # pids due to launching them wrapped in a screen
-            processes = list(self.fetch_processes())
-            num_needed = max(self.min_count - len(processes), 0)
-            self._screen_add_processes(num_needed)
-            if self.notify and num_needed > 0:
-                self._notify(num_needed)
-            processes = list(self.fetch_processes())
-            wait_procs(processes, timeout=3)
+            processes = self.respawn()
+            wait_procs(processes, timeout=self.poll_interval)
 
     def run_once(self):
         """Perform a single run of the worker monitor."""
         self._screen_init()
         self._screen_update_env()
-        num_running = len(list(self.fetch_processes()))
-        num_needed = max(self.min_count - num_running, 0)
-        self._screen_add_processes(num_needed)
-        if self.notify and num_needed > 0:
-            self._notify(num_needed)
+        self.respawn()
+
+
+def _timestamp(dt):
+    """Seconds since the epoch of a datetime rq stored, in UTC."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class WorkerSupervisor(WorkerMonitor):
+    """Supervise the rq workers of some queues, on every host, from the
+    heartbeats and job counts the workers keep in Redis.
+
+    On each check, every interval seconds (or sooner when a worker on this
+    host exits), the supervisor:
+
+    - stops stuck jobs: jobs running longer than stuck_factor times their
+      last run (see utils.scheduling.job_stats), or stuck_after seconds when
+      they have no last run, and at most their rq timeout. The job is first
+      stopped through rq, which kills a forking worker's work horse; a
+      worker on this host still running it at the next check is killed.
+    - kills the workers on this host that are dead: that stopped sending
+      heartbeats while idle, or that never registered with rq within
+      STARTUP_GRACE seconds of starting.
+    - keeps between min_count and max_count workers on this host, so that
+      together with the workers on other hosts there is one worker for every
+      jobs_per_worker queued jobs. Idle workers beyond that are asked to
+      shut down, one per check.
+
+    Workers on other hosts are only reported, since their own supervisor
+    restarts them. Restarts, stopped jobs and scale events are emailed with
+    notify.
+    """
+
+    def __init__(self, cmdline, min_count, screen, max_count=None,
+                 queues=None, jobs_per_worker=JOBS_PER_WORKER,
+                 interval=SUPERVISE_INTERVAL, stuck_factor=STUCK_FACTOR,
+                 stuck_after=STUCK_AFTER, connection=None, clock=time.time,
+                 **kwargs):
+        super().__init__(cmdline, min_count, screen, **kwargs)
+        self.max_count = max(max_count or min_count, min_count)
+        self.queues = queues or [ENV]
+        self.jobs_per_worker = jobs_per_worker
+        self.poll_interval = interval
+        self.stuck_factor = stuck_factor
+        self.stuck_after = stuck_after
+        self.connection = connection
+        self.clock = clock
+        # pid -> when this supervisor first saw the process
+        self.first_seen = {}
+        # job id -> when the supervisor asked rq to stop the job
+        self.stop_requested = {}
+        # names of workers on other hosts already reported dead or stuck
+        self.reported = set()
+        self.last_job_count = None
+        self.last_checked_at = None
+
+    def __repr__(self):
+        return (f"<WorkerSupervisor queues={','.join(self.queues)} "
+                f"min_count={self.min_count} max_count={self.max_count}>")
+
+    def _connection(self):
+        if self.connection is None:
+            from redis import Redis
+            self.connection = Redis()
+        return self.connection
+
+    def fetch_worker_processes(self):
+        """The running target processes, leaving out the work horses that
+        forking workers run jobs in."""
+        processes = {process.pid: process for process in self.fetch_processes()}
+        workers = []
+        for pid, process in processes.items():
+            try:
+                if process.ppid() not in processes:
+                    workers.append(process)
+            except (ZombieProcess, NoSuchProcess, AccessDenied):
+                pass
+        return workers
+
+    def fetch_workers(self):
+        """The rq workers, on any host, listening to any of the queues."""
+        from rq import Worker
+        return [worker for worker in Worker.all(connection=self._connection())
+                if set(worker.queue_names()) & set(self.queues)]
+
+    def queue_depth(self):
+        from rq import Queue
+        return sum(Queue(name, connection=self._connection()).count
+                   for name in self.queues)
+
+    def expected_duration(self, job):
+        """How long a job can run before it counts as stuck."""
+        last_duration = job_stats(self._connection(), job).get("last_duration")
+        if last_duration:
+            expected = max(last_duration * self.stuck_factor, MIN_EXPECTED_DURATION)
+        else:
+            expected = self.stuck_after
+        if job.timeout:
+            expected = min(expected, job.timeout)
+        return expected
+
+    def find_stuck(self, workers, now):
+        """(worker, job) for each worker running a job past its expected
+        duration."""
+        stuck = []
+        for worker in workers:
+            if worker.get_state() != "busy":
+                continue
+            job = worker.get_current_job()
+            started_at = _timestamp(job.started_at) if job is not None else None
+            if started_at is not None and now - started_at > self.expected_duration(job):
+                stuck.append((worker, job))
+        return stuck
+
+    def find_dead(self, workers, now):
+        """The idle workers that stopped sending heartbeats. A busy worker
+        may not send heartbeats while it runs a job; see find_stuck."""
+        return [worker for worker in workers
+                if worker.get_state() != "busy"
+                and (_timestamp(worker.last_heartbeat) or 0) < now - HEARTBEAT_TIMEOUT]
+
+    def target_count(self, depth, remote_count):
+        """How many workers this host should run for the queue depth."""
+        wanted = math.ceil(depth / self.jobs_per_worker) - remote_count
+        return min(max(wanted, self.min_count), self.max_count)
+
+    def throughput(self, workers, now):
+        """Jobs finished per minute by the workers since the last check."""
+        job_count = sum(worker.successful_job_count + worker.failed_job_count
+                        for worker in workers)
+        per_minute = None
+        if self.last_job_count is not None and now > self.last_checked_at:
+            per_minute = max(job_count - self.last_job_count, 0) * 60 / (now - self.last_checked_at)
+        self.last_job_count = job_count
+        self.last_checked_at = now
+        return per_minute
+
+    def _kill(self, process):
+        """Kill a worker process and the work horse it may have forked."""
+        try:
+            for child in process.children(recursive=True):
+                child.kill()
+            process.kill()
+        except (ZombieProcess, NoSuchProcess, AccessDenied):
+            pass
+
+    def _stop_job(self, job):
+        from rq.command import send_stop_job_command
+        send_stop_job_command(self._connection(), job.id)
+
+    def _shutdown(self, worker):
+        from rq.command import send_shutdown_command
+        send_shutdown_command(self._connection(), worker.name)
+
+    def check(self):
+        """Check the workers once. Returns the events, as lines of text."""
+        now = self.clock()
+        events = []
+        processes = {process.pid: process for process in self.fetch_worker_processes()}
+        workers = self.fetch_workers()
+        local = {worker.pid: worker for worker in workers
+                 if worker.hostname == HOSTNAME and worker.pid in processes}
+        remote = [worker for worker in workers if worker.hostname != HOSTNAME]
+
+        for pid in processes:
+            self.first_seen.setdefault(pid, now)
+        self.first_seen = {pid: seen for pid, seen in self.first_seen.items() if pid in processes}
+
+        killed = set()
+        for worker, job in self.find_stuck(workers, now):
+            requested_at = self.stop_requested.get(job.id)
+            if worker.hostname != HOSTNAME:
+                if worker.name not in self.reported:
+                    self.reported.add(worker.name)
+                    events.append(f"Worker {worker.name} on {worker.hostname} is stuck on job {job.id} ({job.func_name})")
+            elif worker.pid not in local:
+                continue # not one of this supervisor's workers
+            elif requested_at is None:
+                self.stop_requested[job.id] = now
+                self._stop_job(job)
+                # stopping the job kills its work horse before it releases the lock
+                release_job_lock(self._connection(), job)
+                events.append(f"Stopped job {job.id} ({job.func_name}), stuck on worker {worker.name}")
+            elif now - requested_at >= self.poll_interval:
+                self._kill(processes[worker.pid])
+                killed.add(worker.pid)
+                release_job_lock(self._connection(), job)
+                events.append(f"Killed worker {worker.name}, still stuck on job {job.id} ({job.func_name}) after it was stopped")
+        self.stop_requested = {job_id: at for job_id, at in self.stop_requested.items()
+                               if now - at < self.stuck_after}
+
+        for worker in self.find_dead(workers, now):
+            if worker.pid in local and worker.pid not in killed:
+                self._kill(processes[worker.pid])
+                killed.add(worker.pid)
+                events.append(f"Killed worker {worker.name}, with no heartbeat since {worker.last_heartbeat}")
+            elif worker.hostname != HOSTNAME and worker.name not in self.reported:
+                self.reported.add(worker.name)
+                events.append(f"Worker {worker.name} on {worker.hostname} has sent no heartbeat since {worker.last_heartbeat}")
+        for pid, process in processes.items():
+            if pid not in local and pid not in killed and now - self.first_seen[pid] > STARTUP_GRACE:
+                self._kill(process)
+                killed.add(pid)
+                events.append(f"Killed worker process {pid}, not registered with rq {STARTUP_GRACE}s after it started")
+        self.reported &= set(worker.name for worker in remote)
+
+        depth = self.queue_depth()
+        live_remote = len(remote) - len(self.find_dead(remote, now))
+        target = self.target_count(depth, live_remote)
+        running = len(processes) - len(killed)
+        if running < target:
+            self._screen_add_processes(target - running)
+            if killed:
+                events.append(f"Restarted {min(len(killed), target - running)} worker(s)")
+            if target - running > len(killed):
+                events.append(f"Scaled up to {target} worker(s) for {depth} queued job(s)")
+        elif running > target:
+            idle = [worker for pid, worker in local.items()
+                    if pid not in killed and worker.get_state() == "idle"]
+            if idle:
+                self._shutdown(idle[0])
+                events.append(f"Scaled down: shutting down idle worker {idle[0].name} for {depth} queued job(s), {running - 1} worker(s) left")
+
+        per_minute = self.throughput(workers, now)
+        print(f"{HOSTNAME} {','.join(self.queues)}: {len(local)} local and "
+              f"{len(remote)} remote worker(s), {depth} queued job(s), "
+              + (f"{per_minute:.1f} jobs/min" if per_minute is not None else "jobs/min pending"),
+              flush=True)
+        for event in events:
+            print(event, flush=True)
+        return events
+
+    def respawn(self):
+        """Check the workers, and email any events with notify. Returns the
+        running processes."""
+        events = self.check()
+        if self.notify and events:
+            self._send_email(
+                f"{len(events)} worker event(s) on {HOSTNAME}",
+                "\n".join(events) + f"\n\nQueues: {', '.join(self.queues)}\nWorker process: {self.cmdline}")
+        return self.fetch_worker_processes()
+
+
+class ShardedWorkerMonitor:
+    """Keep a minimum count of worker processes for each queue shard, or
+    with supervise, a WorkerSupervisor for each shard's queue."""
+
+    def __init__(self, cmdline, min_count, screen, shards, daemon=False,
+                 supervise=False, **kwargs):
+        self.daemon = daemon
+        self.monitors = []
+        for shard, queue in enumerate(shard_queue_names(shards)):
+            monitor_kwargs = dict(kwargs, daemon=daemon)
+            monitor_class = WorkerMonitor
+            if not supervise:
+                for option in SUPERVISOR_OPTIONS:
+                    monitor_kwargs.pop(option, None)
+            else:
+                monitor_class = WorkerSupervisor
+                monitor_kwargs["queues"] = [queue]
+            self.monitors.append(monitor_class(
+                cmdline.replace("{queue}", queue), min_count,
+                f"{screen}-shard-{shard}", **monitor_kwargs))
+
+    def __repr__(self):
+        return f"<ShardedWorkerMonitor shards={len(self.monitors)}>"
+
+    def run(self):
+        """Run the worker monitors."""
+        for monitor in self.monitors:
+            monitor._screen_init()
+            monitor._screen_update_env()
+        while True:
+            processes = []
+            for monitor in self.monitors:
+                processes += monitor.respawn()
+            if not self.daemon:
+                break
+            wait_procs(processes, timeout=min(
+                monitor.poll_interval for monitor in self.monitors))
 
 
 if __name__ == "__main__":
     try:
-        args = parse_args()
-        manager = WorkerMonitor(**vars(args))
+        args = vars(parse_args())
+        shards = args.pop("shards")
+        if shards is not None:
+            manager = ShardedWorkerMonitor(shards=shards, **args)
+        elif args.pop("supervise"):
+            manager = WorkerSupervisor(**args)
+        else:
+            manager = WorkerMonitor(**{option: value for option, value in args.items()
+                                       if option not in SUPERVISOR_OPTIONS})
         manager.run()
     except KeyboardInterrupt:
         pass